@@ -15,17 +15,26 @@ The network links are:
 h1 <--> s1 <--> s2 <--> h2
 """
 
+import os
+import sys
+
 from mininet.net import Mininet
 from mininet.node import OVSSwitch
 from mininet.cli import CLI
 from mininet.link import TCLink
 from mininet.log import setLogLevel, info
-from mininet.clean import cleanup
 
-cleanup()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'SRC', 'Utils'))
+from reachability import reachability
+from scopedclean import clean_stale, record
 
-def create_topology():
-    "Create and run the custom network."
+# TCLink options for every link, e.g. {'bw': 10, 'delay': '5ms', 'loss': 1}
+# (SRC/Benchmarks/sweep.py passes its own profiles)
+LINKOPTS = {}
+
+def build_network(linkopts=LINKOPTS):
+    "Create the custom network, not yet started."
 
     # 1. Create a Mininet object
     # Run OVS switches in standalone mode; no external controller needed.
@@ -47,13 +56,34 @@ def create_topology():
 
     info('*** Creating links\n')
     # Create links between the nodes
-    net.addLink(h1, s1)
-    net.addLink(s1, s2)
-    net.addLink(h2, s2)
+    net.addLink(h1, s1, **linkopts)
+    net.addLink(s1, s2, **linkopts)
+    net.addLink(h2, s2, **linkopts)
+    return net
+
+def create_topology():
+    "Create and run the custom network."
+
+    # Remove what earlier runs of the lab scripts left behind when they
+    # died, and nothing else (mininet.clean.cleanup() would tear down
+    # every Mininet network on the machine)
+    clean_stale()
+
+    net = build_network()
+
+    # Record what this run created, so only that is removed if it dies
+    # (before starting, in case it dies in start())
+    run = record(net)
 
     info('*** Starting network\n')
     # Start the network (switches will run standalone)
     net.start()
+    # and the bridges start() created
+    run.update(net)
+
+    info('*** Testing network connectivity\n')
+    # Both directions are probed at the same time
+    info(reachability(net))
 
     info('*** Running CLI\n')
     # Start the Mininet Command Line Interface
@@ -62,6 +92,7 @@ def create_topology():
     info('*** Stopping network\n')
     # Stop the network when the CLI is exited
     net.stop()
+    run.release()
 
 if __name__ == '__main__':
     # Set the logging level to 'info' to see the script's output
@@ -15,6 +15,9 @@ ri-eth0 is on the left and ri-eth1 is on the right
 
 # mn --custom filename.py --topo rtopo
 
+import os
+import sys
+
 from mininet.net import Mininet
 from mininet.node import Node, OVSKernelSwitch, Controller, RemoteController
 #from mininet.node import Node, Host, OVSSwitch, OVSKernelSwitch, Controller, RemoteController, DefaultController
@@ -23,58 +26,79 @@ from mininet.link import TCLink
 from mininet.topo import Topo
 from mininet.log import setLogLevel, info
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..', 'SRC', 'Utils'))
+from batchconfig import NodeConfig, apply_all
+from routecompiler import add_routes, compile_routes, topo_links
+from services import Services
+
 ENABLE_LEFT_TO_RIGHT_ROUTING = True		# tell all routers how to get to h2
 
+# TCLink options for every link, e.g. {'bw': 10, 'delay': '5ms', 'loss': 1}
+# (SRC/Benchmarks/sweep.py passes its own profiles)
+LINKOPTS = {}
+
 class RTopo(Topo):
 
-    def build(self, **_opts):     # special names?
+    def build(self, linkopts=None, **_opts):     # special names?
+        linkopts = linkopts or {}
         h1 = self.addHost( 'h1', ip='10.0.0.10/24', defaultRoute='via 10.0.0.2' )
         h2 = self.addHost( 'h2', ip='10.0.3.10/24', defaultRoute='via 10.0.3.1' )
         r1 = self.addHost( 'r1' )
         r2 = self.addHost( 'r2' )
         r3 = self.addHost( 'r3' )
 
-        self.addLink( h1, r1, intfName1 = 'h1-eth0', intfName2 = 'r1-eth0')
-        self.addLink( r1, r2, inftName1 = 'r1-eth1', inftName2 = 'r2-eth0')
-        self.addLink( r2, r3, inftName1 = 'r2-eth1', inftName2 = 'r3-eth0')
-        self.addLink( r3, h2, intfName1 = 'r3-eth1', intfName2 = 'h2-eth0')
+        self.addLink( h1, r1, intfName1 = 'h1-eth0', intfName2 = 'r1-eth0', **linkopts)
+        self.addLink( r1, r2, inftName1 = 'r1-eth1', inftName2 = 'r2-eth0', **linkopts)
+        self.addLink( r2, r3, inftName1 = 'r2-eth1', inftName2 = 'r3-eth0', **linkopts)
+        self.addLink( r3, h2, intfName1 = 'r3-eth1', intfName2 = 'h2-eth0', **linkopts)
 
 
-def run():
-    rtopo = RTopo()
-    net = Mininet(topo = rtopo, link=TCLink, autoSetMacs = True)
-    net.start()
-    
+def configure(net, rtopo):
+    "Address the routers and add their routes; returns the ConfigResults."
     r1 = net['r1']
     r2 = net['r2']
     r3 = net['r3']
-    h1 = net['h1']
-    h2 = net['h2']
 
-    r1.cmd('ifconfig r1-eth0 10.0.0.2/24')
-    r1.cmd('ifconfig r1-eth1 10.0.1.1/24')
-    r1.cmd('sysctl net.ipv4.ip_forward=1')
-    rp_disable(r1)
+    # each router's settings are applied in a single batch
+    c1, c2, c3 = NodeConfig(r1), NodeConfig(r2), NodeConfig(r3)
+
+    c1.addr('r1-eth0', '10.0.0.2/24')
+    c1.addr('r1-eth1', '10.0.1.1/24')
+    c1.forwarding()
+    c1.rp_disable()
 
-    r2.cmd('ifconfig r2-eth0 10.0.1.2/24')
-    r2.cmd('ifconfig r2-eth1 10.0.2.1/24')
-    r2.cmd('sysctl net.ipv4.ip_forward=1')
-    rp_disable(r2)
+    c2.addr('r2-eth0', '10.0.1.2/24')
+    c2.addr('r2-eth1', '10.0.2.1/24')
+    c2.forwarding()
+    c2.rp_disable()
 
-    r3.cmd('ifconfig r3-eth0 10.0.2.2/24')
-    r3.cmd('ifconfig r3-eth1 10.0.3.1/24')
-    r3.cmd('sysctl net.ipv4.ip_forward=1')
-    rp_disable(r3)
+    c3.addr('r3-eth0', '10.0.2.2/24')
+    c3.addr('r3-eth1', '10.0.3.1/24')
+    c3.forwarding()
+    c3.rp_disable()
 
-    # add one-way routes to 10.0.3.0/24:
+    # routes between all subnets, compiled from the topology:
     if ENABLE_LEFT_TO_RIGHT_ROUTING:
-        r1.cmd('route add -net 10.0.3.0/24 gw 10.0.1.2')
-        r2.cmd('route add -net 10.0.3.0/24 gw 10.0.2.2')
-        r3.cmd('route add -net 10.0.0.0/24 gw 10.0.2.1')
-        r2.cmd('route add -net 10.0.0.0/24 gw 10.0.1.1') 
-    for h in [h1, r1, r2, r3, h2]:  h.cmd('/usr/sbin/sshd')
+        addrs = {'h1-eth0': '10.0.0.10/24', 'h2-eth0': '10.0.3.10/24'}
+        for c in (c1, c2, c3): addrs.update(c.addrs)
+        add_routes([c1, c2, c3], compile_routes(topo_links(rtopo), addrs))
+    return apply_all([c1, c2, c3])     # all routers at once
+
+
+def run(linkopts=LINKOPTS):
+    rtopo = RTopo(linkopts=linkopts)
+    net = Mininet(topo = rtopo, link=TCLink, autoSetMacs = True)
+    net.start()
+    configure(net, rtopo)
+
+    # sshd -i is started per connection (SRC/Utils/services.py)
+    services = Services(net)
+    services.sshd(net.get('h1', 'r1', 'r2', 'r3', 'h2'))
+    services.start()
 
     CLI( net)
+    services.stop()
     net.stop()
 
 # in the following, ip(4,2) returns 10.0.4.2
@@ -84,16 +108,14 @@ def ip(subnet,host,prefix=None):
     return addr
 
 # For some examples we need to disable the default blocking of forwarding of packets with no reverse path
+# (see NodeConfig.rp_disable(), which batches the per-interface sysctls)
 def rp_disable(host):
-    ifaces = host.cmd('ls /proc/sys/net/ipv4/conf')
-    ifacelist = ifaces.split()    # default is to split on whitespace
-    for iface in ifacelist:
-       if iface != 'lo': host.cmd('sysctl net.ipv4.conf.' + iface + '.rp_filter=0')
-    #print 'host', host, 'iface list:',  ifacelist
+    NodeConfig(host).rp_disable().apply()
 
 
-setLogLevel('info')
-run()
+if __name__ == '__main__':
+    setLogLevel('info')
+    run()
 
 """
 Manual routing commands:
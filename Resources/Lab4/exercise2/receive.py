@@ -1,19 +1,33 @@
 #!/usr/bin/env python3
+import argparse
+import ctypes
+import json
 import os
+import socket
+import struct
 import sys
+import time
 
 from scapy.all import (
     TCP,
     FieldLenField,
-    FieldListField,
     IntField,
     IPOption,
+    Packet,
+    PacketListField,
     ShortField,
     get_if_list,
     sniff
 )
 from scapy.layers.inet import _IPOption_HDR
 
+ETH_P_ALL = 0x0003
+SO_ATTACH_FILTER = 26
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+PACKET_OUTGOING = 4
+MRI_OPTION = 31
+
 
 def get_if():
     ifs=get_if_list()
@@ -27,18 +41,24 @@ def get_if():
         exit(1)
     return iface
 
+class SwitchTrace(Packet):
+    fields_desc = [ IntField("swid", 0),
+                    IntField("qdepth", 0)]
+    def extract_padding(self, p):
+        return "", p
+
 class IPOption_MRI(IPOption):
     name = "MRI"
     option = 31
     fields_desc = [ _IPOption_HDR,
                     FieldLenField("length", None, fmt="B",
-                                  length_of="swids",
+                                  length_of="swtraces",
                                   adjust=lambda pkt,l:l+4),
                     ShortField("count", 0),
-                    FieldListField("swids",
+                    PacketListField("swtraces",
                                    [],
-                                   IntField("", 0),
-                                   length_from=lambda pkt:pkt.count*4) ]
+                                   SwitchTrace,
+                                   count_from=lambda pkt:(pkt.count*1)) ]
 def handle_pkt(pkt):
     if TCP in pkt and pkt[TCP].dport == 1234:
         print("got a packet")
@@ -47,11 +67,206 @@ def handle_pkt(pkt):
         sys.stdout.flush()
 
 
+def bpf_tcp_dport(port):
+    """Classic BPF program for "ip and tcp dst port <port>" on Ethernet,
+       as (code, jt, jf, k) tuples; fragments are dropped."""
+    return [
+        (0x28, 0, 0, 12),           # ldh [12]            ethertype
+        (0x15, 0, 8, 0x0800),       # jeq #IPv4           else drop
+        (0x30, 0, 0, 23),           # ldb [23]            ip protocol
+        (0x15, 0, 6, 6),            # jeq #TCP            else drop
+        (0x28, 0, 0, 20),           # ldh [20]            flags/offset
+        (0x45, 4, 0, 0x1fff),       # jset #0x1fff        fragment: drop
+        (0xb1, 0, 0, 14),           # ldxb 4*([14]&0xf)   ip header length
+        (0x48, 0, 0, 16),           # ldh [x+16]          tcp dport
+        (0x15, 0, 1, port),         # jeq #port           else drop
+        (0x06, 0, 0, 0x40000),      # ret #262144         accept
+        (0x06, 0, 0, 0),            # ret #0              drop
+    ]
+
+
+def raw_socket(iface, port, rcvbuf=1 << 22):
+    """AF_PACKET socket on iface that the kernel filters down to
+       tcp dport == port."""
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+                         socket.htons(ETH_P_ALL))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    prog = bpf_tcp_dport(port)
+    insns = ctypes.create_string_buffer(
+        b''.join(struct.pack('HBBI', *insn) for insn in prog))
+    fprog = struct.pack('HL', len(prog), ctypes.addressof(insns))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+    sock.bind((iface, ETH_P_ALL))
+    # drop whatever was queued before the filter was attached
+    sock.setblocking(False)
+    try:
+        while True:
+            sock.recv(65536)
+    except BlockingIOError:
+        pass
+    sock.setblocking(True)
+    return sock
+
+
+def parse_mri(buf, ihl):
+    """(swids, qdepths) in path order from the MRI option of the IPv4
+       header at buf[14:14 + ihl], or None without one. Hops are 8 bytes
+       (swid, qdepth) as basic.p4 writes them; 4-byte hops (swid only)
+       give qdepths None."""
+    i, end = 34, 14 + ihl
+    while i < end:
+        kind = buf[i]
+        if kind == 0:
+            break
+        if kind == 1:
+            i += 1
+            continue
+        length = buf[i + 1]
+        if length < 2 or i + length > end:
+            break
+        if kind & 0x1f == MRI_OPTION and length >= 4:
+            count = struct.unpack_from('!H', buf, i + 2)[0]
+            if not count:
+                return (), ()
+            hop = (length - 4) // count
+            if hop not in (4, 8):
+                return None
+            words = struct.unpack_from('!%dI' % (count * hop // 4), buf, i + 4)
+            # switches push their entry on the front: newest hop first
+            if hop == 8:
+                return words[-2::-2], words[::-2]
+            return words[::-1], None
+        i += length
+    return None
+
+
+class PathWindows(object):
+    """Per-path MRI statistics over fixed time windows, written as one
+       NDJSON line per path and window."""
+
+    def __init__(self, out, window=1.0):
+        self.out = out
+        self.window = window
+        self.start = time.time()
+        self.paths = {}
+
+    def add(self, swids, qdepths, size):
+        entry = self.paths.get(swids)
+        if entry is None:
+            hops = len(swids)
+            entry = self.paths[swids] = [0, 0, 0, [0] * hops, [0] * hops]
+        entry[0] += 1
+        entry[1] += size
+        if qdepths is not None:
+            entry[2] += 1
+            qsum, qmax = entry[3], entry[4]
+            for k, q in enumerate(qdepths):
+                qsum[k] += q
+                if q > qmax[k]:
+                    qmax[k] = q
+
+    def flush(self, now):
+        "Write and reset the window once it is complete."
+        elapsed = now - self.start
+        if elapsed < self.window:
+            return
+        for swids, entry in sorted(self.paths.items()):
+            packets, nbytes, qpackets, qsum, qmax = entry
+            doc = {'time': round(now, 3), 'window': round(elapsed, 3),
+                   'path': list(swids), 'packets': packets,
+                   'pps': packets / elapsed,
+                   'mbps': 8e-6 * nbytes / elapsed}
+            if qpackets and swids:
+                qavg = [float(q) / qpackets for q in qsum]
+                doc.update(qdepth_avg=qavg, qdepth_max=qmax,
+                           congested=swids[qavg.index(max(qavg))])
+            self.out.write(json.dumps(doc, sort_keys=True) + '\n')
+        self.out.flush()
+        self.paths = {}
+        self.start = now
+
+
+def kernel_drops(sock):
+    "Packets the kernel dropped since the last call."
+    stats = sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8)
+    return struct.unpack('II', stats)[1]
+
+
+def raw_capture(iface, port, quiet, interval, paths=None):
+    """Receive with a kernel BPF filter into one reusable buffer and
+       parse headers in place. Quiet mode prints a summary every
+       interval seconds instead of a line per packet. MRI options are
+       fed to paths, a PathWindows, when given."""
+    sock = raw_socket(iface, port)
+    sock.settimeout(min(interval, paths.window) if paths else interval)
+    buf = bytearray(65536)
+    view = memoryview(buf)
+    total = count = nbytes = drops = 0
+    last = time.time()
+    while True:
+        try:
+            n, addr = sock.recvfrom_into(buf)
+        except socket.timeout:
+            n = 0
+        if n and addr[2] != PACKET_OUTGOING:
+            count += 1
+            nbytes += n
+            ihl = (buf[14] & 0x0f) * 4
+            mri = parse_mri(buf, ihl) if ihl > 20 else None
+            if mri and paths is not None:
+                paths.add(mri[0], mri[1], n)
+            if not quiet:
+                tcp = 14 + ihl
+                sport, dport = struct.unpack_from('!HH', buf, tcp)
+                data = tcp + (buf[tcp + 12] >> 4) * 4
+                print("%s:%d -> %s:%d len=%d%s payload=%r" % (
+                    socket.inet_ntoa(view[26:30]), sport,
+                    socket.inet_ntoa(view[30:34]), dport, n,
+                    ' path=%s' % ','.join(map(str, mri[0])) if mri else '',
+                    bytes(view[data:n])))
+        now = time.time()
+        if paths is not None:
+            paths.flush(now)
+        if quiet and now - last >= interval:
+            drops += kernel_drops(sock)
+            total += count
+            print("%.0f pps %.2f Mbps (%d packets, %d total, %d dropped)" % (
+                count / (now - last), 8e-6 * nbytes / (now - last),
+                count, total, drops))
+            sys.stdout.flush()
+            count = nbytes = 0
+            last = now
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Receive tcp dport 1234')
+    parser.add_argument('--raw', action='store_true',
+                        help='AF_PACKET + kernel BPF capture instead of scapy')
+    parser.add_argument('--quiet', action='store_true',
+                        help='raw mode: print periodic summaries only')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='seconds between quiet-mode summaries')
+    parser.add_argument('--port', type=int, default=1234)
+    parser.add_argument('--iface', help='default: first *eth* interface')
+    parser.add_argument('--mri', metavar='FILE',
+                        help='raw mode: append per-path MRI statistics as '
+                        'NDJSON to FILE (- for stdout)')
+    parser.add_argument('--window', type=float, default=1.0,
+                        help='seconds per MRI statistics window')
+    args = parser.parse_args()
+
     ifaces = [i for i in os.listdir('/sys/class/net/') if 'eth' in i]
-    iface = ifaces[0]
+    iface = args.iface or ifaces[0]
     print("sniffing on %s" % iface)
     sys.stdout.flush()
+    paths = None
+    if args.mri:
+        args.raw = True
+        out = sys.stdout if args.mri == '-' else open(args.mri, 'a')
+        paths = PathWindows(out, args.window)
+    if args.raw:
+        raw_capture(iface, args.port, args.quiet, args.interval, paths)
+        return
     sniff(iface = iface,
           prn = lambda x: handle_pkt(x))
 
@@ -1,9 +1,35 @@
 #!/usr/bin/env python3
+import argparse
+import errno
 import random
 import socket
+import struct
 import sys
+import time
 
-from scapy.all import IP, TCP, Ether, get_if_hwaddr, get_if_list, sendp
+from scapy.all import (
+    IP,
+    TCP,
+    Ether,
+    FieldLenField,
+    IntField,
+    IPOption,
+    Packet,
+    PacketListField,
+    ShortField,
+    get_if_hwaddr,
+    get_if_list,
+    sendp
+)
+from scapy.layers.inet import _IPOption_HDR
+
+ETH_P_ALL = 0x0003
+
+# offsets into the Ethernet/IP header and into the TCP header
+IP_ID = 14 + 4
+IP_CSUM = 14 + 10
+TCP_SPORT = 0
+TCP_CSUM = 16
 
 
 def get_if():
@@ -18,20 +44,126 @@ def get_if():
         exit(1)
     return iface
 
-def main():
+class SwitchTrace(Packet):
+    fields_desc = [ IntField("swid", 0),
+                    IntField("qdepth", 0)]
+    def extract_padding(self, p):
+        return "", p
 
-    if len(sys.argv)<3:
-        print('pass 2 arguments: <destination> "<message>"')
-        exit(1)
+class IPOption_MRI(IPOption):
+    name = "MRI"
+    option = 31
+    fields_desc = [ _IPOption_HDR,
+                    FieldLenField("length", None, fmt="B",
+                                  length_of="swtraces",
+                                  adjust=lambda pkt,l:l+4),
+                    ShortField("count", 0),
+                    PacketListField("swtraces",
+                                   [],
+                                   SwitchTrace,
+                                   count_from=lambda pkt:(pkt.count*1)) ]
+
+def csum_update(csum, old, new):
+    "Incremental Internet checksum update for one 16-bit word (RFC 1624)."
+    s = (~csum & 0xffff) + (~old & 0xffff) + new
+    s = (s & 0xffff) + (s >> 16)
+    s = (s & 0xffff) + (s >> 16)
+    return ~s & 0xffff
+
+def bulk_send(pkt, iface, count=None, pps=None, duration=None):
+    """Send pkt repeatedly through one raw socket. Only the TCP source
+       port and IP id change between packets; both checksums are patched
+       incrementally instead of rebuilding the packet.
+       Returns (packets sent, seconds)."""
+    frame = bytearray(bytes(pkt))
+    tcp = 14 + (frame[14] & 0x0f) * 4
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+                         socket.htons(ETH_P_ALL))
+    sock.bind((iface, 0))
+    ipid, ipcsum, sport, tcpcsum = (
+        struct.unpack_from('!H', frame, off)[0]
+        for off in (IP_ID, IP_CSUM, tcp + TCP_SPORT, tcp + TCP_CSUM))
+    sent = 0
+    start = time.time()
+    end = start + duration if duration else None
+    while count is None or sent < count:
+        newid = (ipid + 1) & 0xffff
+        newport = sport + 1 if sport < 65535 else 49152
+        ipcsum = csum_update(ipcsum, ipid, newid)
+        tcpcsum = csum_update(tcpcsum, sport, newport)
+        ipid, sport = newid, newport
+        struct.pack_into('!H', frame, IP_ID, ipid)
+        struct.pack_into('!H', frame, IP_CSUM, ipcsum)
+        struct.pack_into('!H', frame, tcp + TCP_SPORT, sport)
+        struct.pack_into('!H', frame, tcp + TCP_CSUM, tcpcsum)
+        try:
+            sock.send(frame)
+        except OSError as e:
+            if e.errno not in (errno.ENOBUFS, errno.EAGAIN):
+                raise
+            # transmit queue full: back off briefly and retry
+            time.sleep(0.0001)
+            if end and time.time() >= end:
+                break
+            continue
+        sent += 1
+        if sent & 63 == 0 or pps:
+            now = time.time()
+            if end and now >= end:
+                break
+            if pps:
+                ahead = start + sent / float(pps) - now
+                if ahead > 0.001:
+                    time.sleep(ahead)
+    sock.close()
+    return sent, time.time() - start
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Send TCP packets to port 1234')
+    parser.add_argument('destination')
+    parser.add_argument('message')
+    parser.add_argument('--count', type=int,
+                        help='bulk mode: number of packets')
+    parser.add_argument('--duration', type=float,
+                        help='bulk mode: seconds to send for')
+    parser.add_argument('--pps', type=float,
+                        help='bulk mode: target packets per second')
+    parser.add_argument('--size', type=int,
+                        help='payload bytes (message padded/truncated); '
+                        'does not select bulk mode')
+    parser.add_argument('--mri', action='store_true',
+                        help='add an empty MRI option for switches to fill')
+    args = parser.parse_args()
 
-    addr = socket.gethostbyname(sys.argv[1])
+    addr = socket.gethostbyname(args.destination)
     iface = get_if()
+    payload = args.message
+    if args.size is not None:
+        payload = (payload * (args.size // max(len(payload), 1) + 1))[:args.size]
 
     print("sending on interface %s to %s" % (iface, str(addr)))
     pkt =  Ether(src=get_if_hwaddr(iface), dst='ff:ff:ff:ff:ff:ff')
-    pkt = pkt /IP(dst=addr) / TCP(dport=1234, sport=random.randint(49152,65535)) / sys.argv[2]
-    pkt.show2()
-    sendp(pkt, iface=iface, verbose=False)
+    ip = IP(dst=addr)
+    if args.mri:
+        ip.options = IPOption_MRI(count=0, swtraces=[])
+    pkt = pkt / ip / TCP(dport=1234, sport=random.randint(49152,65535)) / payload
+    if args.count is None and args.duration is None and args.pps is None:
+        pkt.show2()
+        sendp(pkt, iface=iface, verbose=False)
+        return
+    if args.count is None and args.duration is None:
+        args.duration = 10
+    try:
+        sent, elapsed = bulk_send(pkt, iface, args.count, args.pps,
+                                  args.duration)
+    except OSError as e:
+        sys.exit("send failed: %s" % e)
+    size = len(pkt)
+    pps = sent / elapsed if elapsed else 0.0
+    print("sent %d packets of %d bytes in %.2fs: %.0f pps, %.2f Mbps" % (
+        sent, size, elapsed, pps, 8e-6 * pps * size))
+    sys.stdout.flush()
 
 
 if __name__ == '__main__':
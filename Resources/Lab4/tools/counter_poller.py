@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Poll the per-port counters of basic.p4 over P4Runtime
+
+Each interval, every switch gets one ReadRequest carrying a wildcard
+CounterEntry for each indirect counter in the p4info (ingress_port_counter,
+egress_port_counter, drop_counter), so all ports of all counters come back
+in one round trip. Packet and byte deltas become pps/bps rates, kept in a
+fixed-size ring buffer per switch (--history samples), and the busiest
+ports are printed:
+
+    python3 counter_poller.py topology.json --interval 1
+    s1 ingress p1 8410 pps 68.9 Mbps | egress p3 8402 pps 68.8 Mbps | ...
+
+Switch sN is expected at 127.0.0.1:(50050 + N) with device id N - 1, as the
+exercise Makefiles start them. --out writes the ring buffers as JSON on
+exit. Needs grpcio and the p4runtime protos, like runtime_sync.py.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from array import array
+
+from gen_runtime import node_index
+from runtime_sync import P4Info, Switch
+
+
+class Ring(object):
+    """Fixed-size ring of (time, values) rows over one flat array; the
+       oldest row is overwritten once capacity rows are stored."""
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.width = width
+        self.data = array('d', bytes(8 * capacity * (width + 1)))
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, t, values):
+        row = (self.count % self.capacity) * (self.width + 1)
+        self.data[row] = t
+        self.data[row + 1:row + 1 + self.width] = values
+        self.count += 1
+
+    def rows(self):
+        "Rows oldest first as (time, [values])."
+        start = self.count - len(self)
+        stride = self.width + 1
+        for i in range(start, self.count):
+            row = (i % self.capacity) * stride
+            yield self.data[row], self.data[row + 1:row + stride].tolist()
+
+    def last(self):
+        row = ((self.count - 1) % self.capacity) * (self.width + 1)
+        return self.data[row + 1:row + 1 + self.width]
+
+
+class CounterPoller(object):
+    """Rates of every (counter, port) of one switch. Columns are pps and
+       bps for each counter and ports 0..ports-1."""
+
+    def __init__(self, switch, ports=64, history=600):
+        self.switch = switch
+        self.ports = ports
+        pb = switch.pb
+        self.counters = [(c.preamble.id, c.preamble.name.split('.')[-1])
+                         for c in switch.p4info.proto.counters]
+        self.slot = dict((cid, i) for i, (cid, _) in
+                         enumerate(self.counters))
+        self.request = pb.ReadRequest(device_id=switch.device_id)
+        for cid, _ in self.counters:
+            self.request.entities.add().counter_entry.counter_id = cid
+        width = 2 * ports * len(self.counters)
+        self.ring = Ring(history, width)
+        self.previous = None
+        self.before = array('d', bytes(8 * width))
+
+    def columns(self):
+        "Column names, in ring order."
+        return ['%s.p%d.%s' % (name, port, unit)
+                for _, name in self.counters
+                for port in range(self.ports) for unit in ('pps', 'bps')]
+
+    def read(self):
+        "Cumulative packets/bytes of every column, in one ReadRequest."
+        totals = array('d', bytes(8 * len(self.before)))
+        for resp in self.switch.stub.Read(self.request):
+            for entity in resp.entities:
+                c = entity.counter_entry
+                port = c.index.index
+                if port < self.ports:
+                    col = 2 * (self.slot[c.counter_id] * self.ports + port)
+                    totals[col] = c.data.packet_count
+                    totals[col + 1] = c.data.byte_count
+        return totals
+
+    def poll(self):
+        "Read the counters and append one rate sample."
+        now = time.time()
+        totals = self.read()
+        if self.previous is not None:
+            elapsed = now - self.previous
+            rates = array('d', ((t - b) / elapsed
+                                for t, b in zip(totals, self.before)))
+            for col in range(1, len(rates), 2):
+                rates[col] *= 8
+            self.ring.append(now, rates)
+        self.previous = now
+        self.before = totals
+
+    def hot(self, top=3, threshold=1.0):
+        "[(counter, port, pps, bps)] of the busiest ports, per counter."
+        if not len(self.ring):
+            return []
+        last = self.ring.last()
+        result = []
+        for i, (_, name) in enumerate(self.counters):
+            base = 2 * i * self.ports
+            ports = sorted(range(self.ports),
+                           key=lambda p: -last[base + 2 * p + 1])
+            for port in ports[:top]:
+                pps, bps = last[base + 2 * port], last[base + 2 * port + 1]
+                if pps >= threshold:
+                    result.append((name, port, pps, bps))
+        return result
+
+
+def connect(topology, p4info, host, base_port):
+    "{name: Switch} for the switches of a topology.json, read-only."
+    with open(topology) as f:
+        names = sorted(json.load(f)['switches'], key=node_index)
+    return dict((name, Switch('%s:%d' % (host, base_port + node_index(name)),
+                              node_index(name) - 1, p4info,
+                              election_id=None))
+                for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('topology', nargs='?', default='topology.json')
+    parser.add_argument('--p4info', help='default: build/basic.p4.p4info.txt '
+                        'next to the topology')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--base-port', type=int, default=50050,
+                        help='switch sN listens on base-port + N')
+    parser.add_argument('--interval', type=float, default=1.0)
+    parser.add_argument('--count', type=int, help='stop after N samples')
+    parser.add_argument('--ports', type=int, default=64,
+                        help='ports tracked per counter')
+    parser.add_argument('--history', type=int, default=600,
+                        help='samples kept per switch')
+    parser.add_argument('--top', type=int, default=3,
+                        help='busiest ports printed per counter')
+    parser.add_argument('--out', help='write the ring buffers as JSON on exit')
+    args = parser.parse_args()
+
+    p4info = args.p4info or os.path.join(
+        os.path.dirname(os.path.abspath(args.topology)),
+        'build', 'basic.p4.p4info.txt')
+    switches = connect(args.topology, P4Info(p4info), args.host,
+                       args.base_port)
+    pollers = dict((name, CounterPoller(sw, args.ports, args.history))
+                   for name, sw in switches.items())
+    samples = 0
+    try:
+        deadline = time.time()
+        while args.count is None or samples < args.count:
+            for name in sorted(pollers, key=node_index):
+                poller = pollers[name]
+                poller.poll()
+                hot = poller.hot(args.top)
+                if hot:
+                    print('%s %s' % (name, ' | '.join(
+                        '%s p%d %.0f pps %.1f Mbps' % (
+                            counter.replace('_port_counter', '')
+                            .replace('_counter', ''), port, pps, bps / 1e6)
+                        for counter, port, pps, bps in hot)))
+            sys.stdout.flush()
+            samples = min(p.ring.count for p in pollers.values())
+            deadline += args.interval
+            time.sleep(max(0, deadline - time.time()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for sw in switches.values():
+            sw.close()
+    if args.out:
+        doc = dict((name, {'columns': p.columns(),
+                           'samples': [[t] + values
+                                       for t, values in p.ring.rows()]})
+                   for name, p in pollers.items())
+        with open(args.out, 'w') as f:
+            json.dump(doc, f)
+
+
+if __name__ == '__main__':
+    main()
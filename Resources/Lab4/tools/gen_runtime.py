@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Generate the P4Runtime entries of every switch in a topology.json
+
+Forwarding follows shortest switch paths. Where several neighbours are
+equally close to a host, the host index (from 1) modulo the number of
+candidates picks one, so hosts spread over equal-cost paths while each
+hop still moves closer (no loops). A neighbouring switch sN is addressed with the
+MAC 08:00:00:00:0N:00; the last hop uses the host's own MAC.
+
+The per-host /32 routes of each switch are then compressed with ORTC
+(Draves et al., "Constructing Optimal IP Routing Tables"): the result is
+the smallest set of LPM prefixes that forwards every host exactly as the
+/32s did. Addresses no host owns are dropped as before, or with
+--dont-care may follow any next hop, which aggregates further but can
+bounce unknown destinations between switches until their TTL expires.
+
+The ipv4_lpm table size is read from the P4 program (or given with
+--table-size), and nothing is written if any switch would overflow it.
+
+    cd Resources/Lab4/exercise2
+    python3 ../tools/gen_runtime.py topology.json --p4 basic.p4
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import struct
+import sys
+from collections import deque
+
+DROP = 'drop'
+TABLE = 'MyIngress.ipv4_lpm'
+
+
+def node_index(name):
+    "Number in a node name: 's12' -> 12."
+    digits = re.sub(r'\D', '', name)
+    return int(digits) if digits else 0
+
+
+def switch_mac(name):
+    return '08:00:00:00:%02x:00' % node_index(name)
+
+
+def ip_int(text):
+    return struct.unpack('!I', socket.inet_aton(text))[0]
+
+
+def int_ip(value):
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+def parse_endpoint(text):
+    "'s1-p3' -> ('s1', 3), 'h1' -> ('h1', None)."
+    name, _, port = text.partition('-p')
+    return name, int(port) if port else None
+
+
+class Fabric(object):
+    "Hosts, switches and ports of a topology.json."
+
+    def __init__(self, topo):
+        self.switches = sorted(topo['switches'], key=node_index)
+        self.runtime = dict((s, (topo['switches'][s] or {}).get(
+            'runtime_json', '%s-runtime.json' % s)) for s in self.switches)
+        self.hosts = {}
+        for name, host in topo['hosts'].items():
+            self.hosts[name] = (ip_int(host['ip'].split('/')[0]), host['mac'])
+        self.ports = dict((s, {}) for s in self.switches)
+        self.attach = {}
+        for link in topo['links']:
+            (a, pa), (b, pb) = map(parse_endpoint, link[:2])
+            for node, port, peer in ((a, pa, b), (b, pb, a)):
+                if node in self.ports:
+                    self.ports[node][port] = peer
+                elif peer in self.ports:
+                    self.attach[node] = (peer, pb if peer == b else pa)
+        self._dist = {}
+
+    def distances(self, dst):
+        "Switch hop counts to switch dst."
+        if dst not in self._dist:
+            dist = {dst: 0}
+            queue = deque([dst])
+            while queue:
+                s = queue.popleft()
+                for peer in self.ports[s].values():
+                    if peer in self.ports and peer not in dist:
+                        dist[peer] = dist[s] + 1
+                        queue.append(peer)
+            self._dist[dst] = dist
+        return self._dist[dst]
+
+    def next_hop(self, switch, host):
+        "(port, mac) switch forwards host's traffic to, or None."
+        if host not in self.attach:
+            return None
+        dst, port = self.attach[host]
+        if switch == dst:
+            return port, self.hosts[host][1]
+        dist = self.distances(dst)
+        if switch not in dist:
+            return None
+        candidates = sorted((p, peer) for p, peer in self.ports[switch].items()
+                            if dist.get(peer) == dist[switch] - 1)
+        port, peer = candidates[(node_index(host) - 1) % len(candidates)]
+        return port, switch_mac(peer)
+
+    def host_routes(self, switch):
+        "{(addr, 32): (port, mac)} for every reachable host."
+        routes = {}
+        for host in sorted(self.hosts, key=node_index):
+            nh = self.next_hop(switch, host)
+            if nh:
+                routes[(self.hosts[host][0], 32)] = nh
+        return routes
+
+
+def _merge(a, b):
+    "ORTC set combination; None is the don't-care (any next hop) set."
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (a & b) or (a | b)
+
+
+def _sort_key(nh):
+    return (nh != DROP, str(nh))
+
+
+def aggregate(routes, dont_care=False):
+    """Smallest [(addr, plen, nexthop)] forwarding like routes
+       {(addr, plen): nexthop}. Uncovered space drops (the table default,
+       never emitted) or, with dont_care, may take any next hop."""
+    # trie node: [child0, child1, route nexthop, ORTC set]
+    root = [None, None, None, None]
+    for (addr, plen), nh in routes.items():
+        node = root
+        for bit in range(plen):
+            b = (addr >> (31 - bit)) & 1
+            if node[b] is None:
+                node[b] = [None, None, None, None]
+            node = node[b]
+        node[2] = nh
+
+    def sets(node, inherited):
+        nh = node[2] if node[2] is not None else inherited
+        if node[0] is None and node[1] is None:
+            node[3] = None if nh is None else frozenset([nh])
+            return
+        for b in (0, 1):
+            if node[b] is None:
+                node[b] = [None, None, None, None]
+            sets(node[b], nh)
+        node[3] = _merge(node[0][3], node[1][3])
+
+    entries = []
+
+    def choose(node, addr, plen, parent):
+        s = node[3]
+        if s is None or parent in s:
+            chosen = parent
+        else:
+            chosen = min(s, key=_sort_key)
+            entries.append((addr, plen, chosen))
+        if node[0] is not None:
+            choose(node[0], addr, plen + 1, chosen)
+            choose(node[1], addr | (1 << (31 - plen)), plen + 1, chosen)
+
+    sets(root, None if dont_care else DROP)
+    choose(root, 0, 0, DROP)
+    return sorted(entries)
+
+
+def table_size(source, table='ipv4_lpm'):
+    "Declared size of table in P4 source, or None."
+    m = re.search(r'\btable\s+%s\s*\{' % table, source)
+    if not m:
+        return None
+    # the table's own properties, without nested blocks such as key = {}
+    depth, body = 1, []
+    for c in source[m.end():]:
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+            if not depth:
+                break
+        elif depth == 1:
+            body.append(c)
+    size = re.search(r'\bsize\s*=\s*(\d+)', ''.join(body))
+    return int(size.group(1)) if size else None
+
+
+def lpm_entry(addr, plen, nh):
+    if nh == DROP:
+        action, params = 'MyIngress.drop', {}
+    else:
+        action = 'MyIngress.ipv4_forward'
+        params = {'dstAddr': nh[1], 'port': nh[0]}
+    return {'table': TABLE,
+            'match': {'hdr.ipv4.dstAddr': [int_ip(addr), plen]},
+            'action_name': action, 'action_params': params}
+
+
+def runtime(program, switch, entries, swtrace):
+    "Runtime JSON document of one switch."
+    table_entries = []
+    if swtrace:
+        table_entries.append({'table': 'MyEgress.swtrace',
+                              'default_action': True,
+                              'action_name': 'MyEgress.add_swtrace',
+                              'action_params': {'swid': node_index(switch)}})
+    table_entries.append({'table': TABLE, 'default_action': True,
+                          'action_name': 'MyIngress.drop',
+                          'action_params': {}})
+    table_entries.extend(lpm_entry(*e) for e in entries)
+    return {'target': 'bmv2',
+            'p4info': 'build/%s.p4.p4info.txt' % program,
+            'bmv2_json': 'build/%s.json' % program,
+            'table_entries': table_entries}
+
+
+def dumps(doc):
+    "JSON in the layout of the hand-written runtime files."
+    text = json.dumps(doc, indent=2)
+    text = re.sub(r'\[\s+("[^"]*"),\s+(\d+)\s+\]', r'[\1, \2]', text)
+    return text.replace('{}', '{ }') + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('topology', nargs='?', default='topology.json')
+    parser.add_argument('--p4', help='P4 program (default: basic.p4 '
+                        'next to the topology)')
+    parser.add_argument('--out', help='output directory (default: the '
+                        'topology directory)')
+    parser.add_argument('--table-size', type=int,
+                        help='override the ipv4_lpm size from the program')
+    parser.add_argument('--dont-care', action='store_true',
+                        help='let unowned addresses follow any next hop')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only print entry counts')
+    args = parser.parse_args()
+
+    base = os.path.dirname(os.path.abspath(args.topology))
+    p4 = args.p4 or os.path.join(base, 'basic.p4')
+    with open(args.topology) as f:
+        fabric = Fabric(json.load(f))
+    with open(p4) as f:
+        source = f.read()
+    size = args.table_size or table_size(source)
+    if size is None:
+        sys.exit('error: no size for ipv4_lpm in %s; use --table-size' % p4)
+    swtrace = re.search(r'table\s+swtrace\b', source) is not None
+    program = os.path.splitext(os.path.basename(p4))[0]
+
+    docs, overflow = {}, []
+    for switch in fabric.switches:
+        routes = fabric.host_routes(switch)
+        entries = aggregate(routes, args.dont_care)
+        print('%s: %d host routes -> %d entries' % (
+            switch, len(routes), len(entries)))
+        if len(entries) > size:
+            overflow.append(switch)
+        docs[switch] = runtime(program, switch, entries, swtrace)
+    if overflow:
+        sys.exit('error: %s exceed%s the ipv4_lpm size of %d; nothing written'
+                 % (', '.join(overflow), 's' if len(overflow) == 1 else '',
+                    size))
+    if args.dry_run:
+        return
+    out = args.out or base
+    for switch in fabric.switches:
+        path = os.path.join(out, fabric.runtime[switch])
+        with open(path, 'w') as f:
+            f.write(dumps(docs[switch]))
+        print('wrote %s' % path)
+
+
+if __name__ == '__main__':
+    main()
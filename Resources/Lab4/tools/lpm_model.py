@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Offline reference model of the MyIngress.ipv4_lpm table
+
+Loads the entries of an s*-runtime.json into one sorted prefix array per
+prefix length and resolves whole NumPy arrays of destination addresses
+at once: longest lengths are searched first (np.searchsorted), and each
+address keeps the first hit, which is exactly longest-prefix match. A
+lookup of millions of addresses is a few dozen vectorized passes.
+
+    model = LpmModel.load('s1-runtime.json')
+    port, mac = model.forward(addrs)      # port -1: dropped
+
+From the command line, look up single addresses of one switch:
+
+    python3 lpm_model.py lookup s1-runtime.json 10.0.1.1 10.0.3.3
+
+or walk every address of a space hop by hop through all switches of a
+topology, checking that each host address reaches its host, that
+nothing loops and what happens to addresses no host owns:
+
+    python3 lpm_model.py verify topology.json --space 10.0.0.0/16
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from gen_runtime import Fabric, int_ip, ip_int, node_index
+
+TABLE = 'MyIngress.ipv4_lpm'
+FORWARD = 'MyIngress.ipv4_forward'
+MAX_HOPS = 64
+
+
+def mac_int(text):
+    return int(text.replace(':', ''), 16)
+
+
+def int_mac(value):
+    text = '%012x' % value
+    return ':'.join(text[i:i + 2] for i in range(0, 12, 2))
+
+
+class LpmModel(object):
+    """ipv4_lpm of one switch. actions[0] is the default action; each
+       prefix length maps to (sorted prefixes, action indices)."""
+
+    def __init__(self, entries, table=TABLE):
+        self.actions = [('MyIngress.drop', {})]
+        index = {}
+        by_len = {}
+        for entry in entries:
+            if entry.get('table') != table:
+                continue
+            action = (entry['action_name'], entry.get('action_params', {}))
+            key = json.dumps(action, sort_keys=True)
+            if entry.get('default_action'):
+                self.actions[0] = action
+                continue
+            if key not in index:
+                index[key] = len(self.actions)
+                self.actions.append(action)
+            addr, plen = entry['match']['hdr.ipv4.dstAddr']
+            mask = (0xffffffff << (32 - plen)) & 0xffffffff
+            by_len.setdefault(plen, {})[ip_int(addr) & mask] = index[key]
+        self.levels = []
+        for plen in sorted(by_len, reverse=True):
+            prefixes = np.array(sorted(by_len[plen]), dtype=np.uint32)
+            acts = np.array([by_len[plen][p] for p in prefixes.tolist()],
+                            dtype=np.int32)
+            mask = np.uint32((0xffffffff << (32 - plen)) & 0xffffffff)
+            self.levels.append((plen, mask, prefixes, acts))
+        self.ports = np.full(len(self.actions), -1, dtype=np.int32)
+        self.macs = np.zeros(len(self.actions), dtype=np.uint64)
+        for i, (name, params) in enumerate(self.actions):
+            if name == FORWARD:
+                self.ports[i] = int(params['port'])
+                self.macs[i] = mac_int(params['dstAddr'])
+
+    @classmethod
+    def load(cls, path, table=TABLE):
+        with open(path) as f:
+            return cls(json.load(f)['table_entries'], table)
+
+    def __len__(self):
+        return sum(len(level[2]) for level in self.levels)
+
+    def lookup(self, addrs):
+        "Action index (into self.actions) for each address."
+        addrs = np.asarray(addrs, dtype=np.uint32)
+        result = np.zeros(addrs.shape, dtype=np.int32)
+        pending = np.ones(addrs.shape, dtype=bool)
+        for _plen, mask, prefixes, acts in self.levels:
+            keys = addrs & mask
+            pos = np.searchsorted(prefixes, keys)
+            pos[pos == len(prefixes)] = 0
+            hit = pending & (prefixes[pos] == keys)
+            result[hit] = acts[pos[hit]]
+            pending &= ~hit
+            if not pending.any():
+                break
+        return result
+
+    def forward(self, addrs):
+        "(egress port, dstAddr MAC) arrays; port -1 means dropped."
+        actions = self.lookup(addrs)
+        return self.ports[actions], self.macs[actions]
+
+
+def space(cidr, samples, seed=1):
+    "Every address of cidr, or a random sample of that many."
+    addr, _, plen = cidr.partition('/')
+    plen = int(plen or 32)
+    base = ip_int(addr) & ((0xffffffff << (32 - plen)) & 0xffffffff)
+    size = 1 << (32 - plen)
+    if size <= samples:
+        return np.arange(base, base + size, dtype=np.uint64).astype(np.uint32)
+    rng = np.random.default_rng(seed)
+    offsets = rng.integers(0, size, samples, dtype=np.uint64)
+    return (offsets + base).astype(np.uint32)
+
+
+def walk(fabric, models, addrs, start):
+    """Follow addrs from switch index start until they reach a host,
+       drop or exceed MAX_HOPS. Returns (host index or -1, hops, last
+       dstAddr MAC); host -1 with hops MAX_HOPS is a loop."""
+    switches = fabric.switches
+    hosts = sorted(fabric.hosts, key=node_index)
+    # next node for (switch, port): >= 0 switch, <= -2 host, -1 nothing
+    peers = []
+    for s in switches:
+        ports = fabric.ports[s]
+        table = np.full(max(list(ports) + [0]) + 1, -1, dtype=np.int64)
+        for port, peer in ports.items():
+            if peer in fabric.ports:
+                table[port] = switches.index(peer)
+            elif peer in fabric.hosts:
+                table[port] = -2 - hosts.index(peer)
+        peers.append(table)
+    n = len(addrs)
+    node = np.full(n, start, dtype=np.int64)
+    hops = np.zeros(n, dtype=np.int64)
+    macs = np.zeros(n, dtype=np.uint64)
+    active = np.ones(n, dtype=bool)
+    for _hop in range(MAX_HOPS):
+        if not active.any():
+            break
+        for i, model in enumerate(models):
+            sel = np.flatnonzero(active & (node == i))
+            if not len(sel):
+                continue
+            port, mac = model.forward(addrs[sel])
+            nxt = np.full(len(sel), -1, dtype=np.int64)
+            known = (port >= 0) & (port < len(peers[i]))
+            nxt[known] = peers[i][port[known]]
+            node[sel] = nxt
+            macs[sel] = mac
+            hops[sel] += 1
+        active &= node >= 0
+    host = np.where(node <= -2, -2 - node, -1)
+    hops[active] = MAX_HOPS
+    return host, hops, macs
+
+
+def verify(topology, runtime_dir, cidr, samples):
+    "Check a fabric; returns the number of problems found."
+    with open(topology) as f:
+        fabric = Fabric(json.load(f))
+    hosts = sorted(fabric.hosts, key=node_index)
+    models = [LpmModel.load(os.path.join(runtime_dir, fabric.runtime[s]))
+              for s in fabric.switches]
+    host_addrs = np.array([fabric.hosts[h][0] for h in hosts],
+                          dtype=np.uint32)
+    addrs = np.union1d(space(cidr, samples), host_addrs).astype(np.uint32)
+    order = np.argsort(host_addrs)
+    pos = np.searchsorted(host_addrs[order], addrs)
+    pos[pos == len(order)] = 0
+    expected = np.where(host_addrs[order][pos] == addrs, order[pos], -1)
+    owned = expected >= 0
+    host_macs = np.array([mac_int(fabric.hosts[h][1]) for h in hosts] + [0],
+                         dtype=np.uint64)
+    problems = 0
+    for start, switch in enumerate(fabric.switches):
+        host, hops, macs = walk(fabric, models, addrs, start)
+        wrong = owned & ((host != expected) | (macs != host_macs[expected]))
+        loops = hops >= MAX_HOPS
+        stray = ~owned & (host >= 0)
+        print('%s: %d addresses, %d/%d hosts reached, %d misrouted, '
+              '%d looping, %d unowned delivered, max %d hops' % (
+                  switch, len(addrs), int((owned & ~wrong).sum()),
+                  int(owned.sum()), int(wrong.sum()), int(loops.sum()),
+                  int(stray.sum()), int(hops[~loops].max(initial=0))))
+        for a in addrs[wrong][:5].tolist():
+            print('    %s misrouted' % int_ip(a))
+        for a in addrs[loops][:5].tolist():
+            print('    %s loops' % int_ip(a))
+        problems += int(wrong.sum()) + int(loops.sum())
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    sub = parser.add_subparsers(dest='cmd')
+    sub.required = True
+    look = sub.add_parser('lookup', help='resolve addresses on one switch')
+    look.add_argument('runtime')
+    look.add_argument('addrs', nargs='+')
+    ver = sub.add_parser('verify', help='walk a topology hop by hop')
+    ver.add_argument('topology', nargs='?', default='topology.json')
+    ver.add_argument('--runtime-dir',
+                     help='default: the topology directory')
+    ver.add_argument('--space', default='10.0.0.0/16',
+                     help='destination addresses to check')
+    ver.add_argument('--samples', type=int, default=1 << 20,
+                     help='random sample size for larger spaces')
+    args = parser.parse_args()
+
+    if args.cmd == 'lookup':
+        model = LpmModel.load(args.runtime)
+        addrs = np.array([ip_int(a) for a in args.addrs], dtype=np.uint32)
+        ports, macs = model.forward(addrs)
+        for a, port, mac in zip(args.addrs, ports.tolist(), macs.tolist()):
+            print('%s -> %s' % (a, 'drop' if port < 0 else
+                                'port %d dstAddr %s' % (port, int_mac(mac))))
+        return
+    runtime_dir = args.runtime_dir or os.path.dirname(
+        os.path.abspath(args.topology))
+    if verify(args.topology, runtime_dir, args.space, args.samples):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
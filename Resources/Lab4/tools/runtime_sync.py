@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Incremental P4Runtime table updates from s*-runtime.json files
+
+Instead of reloading a switch's whole runtime JSON, keep an index of the
+installed table entries keyed by (table, match, priority), diff it
+against a new JSON and write only the changes: deletes first (freeing
+table space), then modifies, then inserts, in batched WriteRequests
+that never mix two kinds.
+Match and parameter values are compared as integers, so "10.0.1.1",
+0x0a000101 and the bytes read back from the switch are the same key.
+
+The installed state is read from the switch, or taken from --assume
+FILE. --dry-run prints the diff without connecting; --watch keeps the
+connection and re-syncs whenever the file changes.
+
+    python3 runtime_sync.py s1-runtime.json --grpc 127.0.0.1:50051
+    python3 runtime_sync.py new.json --assume s1-runtime.json --dry-run
+
+Talking to a switch needs grpcio and the p4runtime Python protos
+(p4.v1.p4runtime_pb2, p4.config.v1.p4info_pb2).
+"""
+
+import argparse
+import json
+import os
+import socket
+import struct
+import sys
+import time
+from collections import namedtuple
+
+# match: ((field, (ints...)), ...) sorted; params: ((name, int), ...) sorted
+Entry = namedtuple('Entry', 'table match priority action params default')
+Diff = namedtuple('Diff', 'deletes modifies inserts')
+
+DEFAULT = ()
+
+
+def value_int(value):
+    "Integer of a runtime JSON value: int, IPv4, MAC or 0x-hex string."
+    if isinstance(value, int):
+        return int(value)
+    text = str(value)
+    if text.count(':') == 5:
+        return int(text.replace(':', ''), 16)
+    if text.count('.') == 3:
+        return struct.unpack('!I', socket.inet_aton(text))[0]
+    return int(text, 0)
+
+
+def entry_key(entry):
+    return (entry.table, entry.match, entry.priority)
+
+
+def canonical(doc, p4info=None):
+    "Entry of one runtime JSON table entry."
+    params = tuple(sorted((name, value_int(v)) for name, v in
+                          doc.get('action_params', {}).items()))
+    if doc.get('default_action'):
+        return Entry(doc['table'], DEFAULT, 0, doc['action_name'], params,
+                     True)
+    match = []
+    for field, value in doc.get('match', {}).items():
+        ints = tuple(map(value_int, value if isinstance(value, list)
+                         else [value]))
+        if p4info and p4info.dont_care(doc['table'], field, ints):
+            continue
+        match.append((field, ints))
+    return Entry(doc['table'], tuple(sorted(match)),
+                 int(doc.get('priority', 0)), doc['action_name'], params,
+                 False)
+
+
+def load_entries(path, p4info=None):
+    with open(path) as f:
+        doc = json.load(f)
+    return [canonical(e, p4info) for e in doc.get('table_entries', [])]
+
+
+class RuntimeIndex(object):
+    "Installed table entries keyed by (table, match, priority)."
+
+    def __init__(self, entries=()):
+        self.entries = dict((entry_key(e), e) for e in entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def diff(self, entries):
+        "Diff that turns the installed entries into entries."
+        wanted = dict((entry_key(e), e) for e in entries)
+        deletes = [e for k, e in self.entries.items()
+                   if k not in wanted and not e.default]
+        modifies, inserts = [], []
+        for k, e in wanted.items():
+            old = self.entries.get(k)
+            if old is None:
+                (modifies if e.default else inserts).append(e)
+            elif (old.action, old.params) != (e.action, e.params):
+                modifies.append(e)
+        return Diff(sorted(deletes), sorted(modifies), sorted(inserts))
+
+    def update(self, diff):
+        for e in diff.deletes:
+            self.entries.pop(entry_key(e), None)
+        for e in diff.modifies + diff.inserts:
+            self.entries[entry_key(e)] = e
+
+
+def show(diff, out=sys.stdout):
+    for sign, entries in zip('-~+', diff):
+        for e in entries:
+            match = ' '.join('%s=%s' % (f, '/'.join(map(hex, v)))
+                             for f, v in e.match) or '(default)'
+            params = ' '.join('%s=%s' % (p, hex(v)) for p, v in e.params)
+            out.write('%s %s %s -> %s %s\n' % (sign, e.table, match,
+                                              e.action, params))
+
+
+class P4Info(object):
+    "Name/id/bitwidth lookups over a p4info text file."
+
+    def __init__(self, path):
+        from google.protobuf import text_format
+        from p4.config.v1 import p4info_pb2
+        self.proto = p4info_pb2.P4Info()
+        with open(path) as f:
+            text_format.Merge(f.read(), self.proto)
+        self.tables, self.table_names = {}, {}
+        for t in self.proto.tables:
+            fields = dict((m.name, (m.id, m.bitwidth, m.match_type))
+                          for m in t.match_fields)
+            self.tables[t.preamble.name] = (t.preamble.id, fields)
+            self.table_names[t.preamble.id] = (t.preamble.name, dict(
+                (fid, (name, bw, kind))
+                for name, (fid, bw, kind) in fields.items()))
+        self.actions, self.action_names = {}, {}
+        for a in self.proto.actions:
+            params = dict((p.name, (p.id, p.bitwidth)) for p in a.params)
+            self.actions[a.preamble.name] = (a.preamble.id, params)
+            self.action_names[a.preamble.id] = (a.preamble.name, dict(
+                (pid, (name, bw)) for name, (pid, bw) in params.items()))
+
+    def dont_care(self, table, field, ints):
+        "Whether a match value is a wildcard P4Runtime wants omitted."
+        from p4.config.v1 import p4info_pb2
+        kind = self.tables[table][1][field][2]
+        return (kind in (p4info_pb2.MatchField.LPM,
+                         p4info_pb2.MatchField.TERNARY)
+                and len(ints) == 2 and ints[1] == 0)
+
+    def table_entry(self, entry):
+        "p4runtime TableEntry proto of an Entry."
+        from p4.config.v1 import p4info_pb2
+        from p4.v1 import p4runtime_pb2
+        te = p4runtime_pb2.TableEntry()
+        table_id, fields = self.tables[entry.table]
+        te.table_id = table_id
+        if entry.default:
+            te.is_default_action = True
+        for field, ints in entry.match:
+            fid, bw, kind = fields[field]
+            m = te.match.add()
+            m.field_id = fid
+            if kind == p4info_pb2.MatchField.EXACT:
+                m.exact.value = encode(ints[0], bw)
+            elif kind == p4info_pb2.MatchField.LPM:
+                m.lpm.value = encode(ints[0], bw)
+                m.lpm.prefix_len = ints[1]
+            elif kind == p4info_pb2.MatchField.TERNARY:
+                m.ternary.value = encode(ints[0], bw)
+                m.ternary.mask = encode(ints[1], bw)
+            elif kind == p4info_pb2.MatchField.RANGE:
+                m.range.low = encode(ints[0], bw)
+                m.range.high = encode(ints[1], bw)
+            else:
+                raise ValueError('%s: unsupported match kind' % field)
+        if entry.priority:
+            te.priority = entry.priority
+        action_id, params = self.actions[entry.action]
+        te.action.action.action_id = action_id
+        for name, value in entry.params:
+            pid, bw = params[name]
+            p = te.action.action.params.add()
+            p.param_id = pid
+            p.value = encode(value, bw)
+        return te
+
+    def entry(self, te):
+        "Entry of a TableEntry read back from the switch."
+        table, fields = self.table_names[te.table_id]
+        match = []
+        for m in te.match:
+            kind = m.WhichOneof('field_match_type')
+            f = getattr(m, kind)
+            if kind == 'exact':
+                ints = (decode(f.value),)
+            elif kind == 'lpm':
+                ints = (decode(f.value), f.prefix_len)
+            elif kind == 'ternary':
+                ints = (decode(f.value), decode(f.mask))
+            else:
+                ints = (decode(f.low), decode(f.high))
+            match.append((fields[m.field_id][0], ints))
+        action, params = self.action_names[te.action.action.action_id]
+        values = tuple(sorted((params[p.param_id][0], decode(p.value))
+                              for p in te.action.action.params))
+        return Entry(table, tuple(sorted(match)), te.priority, action,
+                     values, te.is_default_action)
+
+
+def encode(value, bitwidth):
+    return value.to_bytes((bitwidth + 7) // 8, 'big')
+
+
+def decode(data):
+    return int.from_bytes(data, 'big')
+
+
+class Switch(object):
+    """P4Runtime connection holding primary (master) arbitration; with
+       election_id None it only reads and leaves arbitration alone."""
+
+    def __init__(self, address, device_id, p4info, election_id=1):
+        import grpc
+        import queue
+        from p4.v1 import p4runtime_pb2, p4runtime_pb2_grpc
+        self.pb = p4runtime_pb2
+        self.error = grpc.RpcError
+        self.device_id = device_id
+        self.p4info = p4info
+        self.channel = grpc.insecure_channel(address)
+        self.stub = p4runtime_pb2_grpc.P4RuntimeStub(self.channel)
+        self.requests = queue.Queue()
+        if election_id is None:
+            return
+        self.stream = self.stub.StreamChannel(iter(self.requests.get, None))
+        req = p4runtime_pb2.StreamMessageRequest()
+        req.arbitration.device_id = device_id
+        req.arbitration.election_id.low = election_id
+        self.requests.put(req)
+        for msg in self.stream:
+            if msg.HasField('arbitration'):
+                self.election_id = msg.arbitration.election_id
+                break
+
+    def read(self):
+        "Entries currently in every table."
+        req = self.pb.ReadRequest(device_id=self.device_id)
+        req.entities.add().table_entry.table_id = 0
+        entries = []
+        for resp in self.stub.Read(req):
+            entries.extend(self.p4info.entry(e.table_entry)
+                           for e in resp.entities)
+        # wildcard reads skip default actions; ask for them per table
+        req = self.pb.ReadRequest(device_id=self.device_id)
+        for table_id, _ in self.p4info.tables.values():
+            te = req.entities.add().table_entry
+            te.table_id = table_id
+            te.is_default_action = True
+        try:
+            for resp in self.stub.Read(req):
+                entries.extend(self.p4info.entry(e.table_entry)
+                               for e in resp.entities
+                               if e.table_entry.action.action.action_id)
+        except self.error:
+            pass                # modified on the first sync instead
+        return entries
+
+    def write(self, diff, batch=500):
+        """Apply diff in WriteRequests of up to batch updates; returns count.
+           P4Runtime may apply the updates of one request in any order,
+           so each request holds one kind only: all deletes are done
+           before the first modify, and those before the first insert."""
+        kinds = (self.pb.Update.DELETE, self.pb.Update.MODIFY,
+                 self.pb.Update.INSERT)
+        writes = 0
+        for kind, entries in zip(kinds, diff):
+            for i in range(0, len(entries), batch):
+                req = self.pb.WriteRequest(device_id=self.device_id)
+                req.election_id.CopyFrom(self.election_id)
+                for e in entries[i:i + batch]:
+                    u = req.updates.add()
+                    u.type = kind
+                    u.entity.table_entry.CopyFrom(self.p4info.table_entry(e))
+                self.stub.Write(req)
+                writes += 1
+        return writes
+
+    def close(self):
+        self.requests.put(None)
+        self.channel.close()
+
+
+def sync(switch, index, path, batch, out=sys.stdout):
+    "Bring switch from index to the entries of path."
+    diff = index.diff(load_entries(path, switch.p4info))
+    start = time.time()
+    writes = switch.write(diff, batch) if any(diff) else 0
+    index.update(diff)
+    out.write('%s: -%d ~%d +%d in %d writes (%.1f ms), %d entries\n' % (
+        path, len(diff.deletes), len(diff.modifies), len(diff.inserts),
+        writes, 1000 * (time.time() - start), len(index)))
+    out.flush()
+    return diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('runtime', help='runtime JSON to converge to')
+    parser.add_argument('--grpc', default='127.0.0.1:50051')
+    parser.add_argument('--device-id', type=int, default=0)
+    parser.add_argument('--p4info', help='default: "p4info" of the JSON, '
+                        'relative to its directory')
+    parser.add_argument('--assume', metavar='FILE',
+                        help='treat FILE as installed instead of reading '
+                        'the switch')
+    parser.add_argument('--batch', type=int, default=500,
+                        help='updates per WriteRequest')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print the diff against --assume and exit')
+    parser.add_argument('--watch', action='store_true',
+                        help='re-sync whenever the file changes')
+    parser.add_argument('--interval', type=float, default=0.5,
+                        help='watch polling interval in seconds')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help='print every changed entry')
+    args = parser.parse_args()
+
+    if args.dry_run:
+        if not args.assume:
+            parser.error('--dry-run needs --assume')
+        index = RuntimeIndex(load_entries(args.assume))
+        diff = index.diff(load_entries(args.runtime))
+        show(diff)
+        print('-%d ~%d +%d' % tuple(map(len, diff)))
+        return
+
+    p4info = args.p4info
+    if not p4info:
+        with open(args.runtime) as f:
+            p4info = os.path.join(os.path.dirname(args.runtime) or '.',
+                                  json.load(f)['p4info'])
+    p4info = P4Info(p4info)
+    switch = Switch(args.grpc, args.device_id, p4info)
+    try:
+        if args.assume:
+            index = RuntimeIndex(load_entries(args.assume, p4info))
+        else:
+            index = RuntimeIndex(switch.read())
+        mtime = os.stat(args.runtime).st_mtime
+        diff = sync(switch, index, args.runtime, args.batch)
+        while True:
+            if args.verbose:
+                show(diff)
+            if not args.watch:
+                break
+            while os.stat(args.runtime).st_mtime == mtime:
+                time.sleep(args.interval)
+            mtime = os.stat(args.runtime).st_mtime
+            diff = Diff([], [], [])
+            try:
+                diff = sync(switch, index, args.runtime, args.batch)
+            except ValueError as e:
+                # half-written file: retry on the next change
+                sys.stderr.write('%s: %s\n' % (args.runtime, e))
+            except switch.error as e:
+                # some updates may have landed: start again from the switch
+                sys.stderr.write('%s: write failed: %s\n' % (
+                    args.runtime, e.details()))
+                index = RuntimeIndex(switch.read())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        switch.close()
+
+
+if __name__ == '__main__':
+    main()
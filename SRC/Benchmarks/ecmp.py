@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+"""
+Aggregate TCP throughput of MultiPathTopo: protocol pinning vs ECMP
+
+With protocol pinning (Exercise 03_01's default) every TCP flow from h1
+to h2 crosses r4-r6, however many flows there are. In ECMP mode h1 and
+h2 hash each flow onto one of the three paths by addresses and ports.
+For every mode and flow count this harness runs that many parallel TCP
+flows from h1 to h2 and records the aggregate throughput and the bytes
+each path forwarded (router interface counters):
+
+    pin    flows to h2's TCP-path address 10.0.8.2
+    ecmp   flows from ECMP_SRC to ECMP_DST (loopback service addresses)
+
+Links are shaped to --bw Mbit/s so the paths, not the CPU, are the
+bottleneck. iperf3 -P is used when installed, otherwise one
+SRC/Utils/loadgen.py client/server pair per flow.
+
+    sudo python3 ecmp.py --flows 1,4,16 --bw 20 --duration 10
+"""
+
+import argparse
+import json
+import os
+import sys
+from shutil import which
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'Utils'))
+
+from mininet.net import Mininet
+from mininet.link import TCLink
+from mininet.log import setLogLevel, info
+
+from benchutil import load_script, write_results
+from multipath import LOADGEN, PORT, path_bytes, snapshot
+
+
+def iperf3_flows(client, server, dst, flows, duration):
+    "Aggregate receive rate of flows parallel iperf3 streams."
+    srv = server.popen(['iperf3', '-s', '-1', '-J', '-p', str(PORT)])
+    client.cmd('sleep 0.5')
+    out = json.loads(client.cmd('iperf3 -J -c %s -p %d -t %s -P %d' % (
+        dst, PORT, duration, flows)))
+    srv.communicate()
+    if 'error' in out:
+        return {'error': out['error']}
+    return {'bps': out['end']['sum_received']['bits_per_second']}
+
+
+def builtin_flows(client, server, dst, flows, duration):
+    "Aggregate rate of flows loadgen.py sessions, one port each."
+    servers = [server.popen(['python3', LOADGEN, 'server', '--once',
+                             '--proto', 'tcp', '--port', str(PORT + i)])
+               for i in range(flows)]
+    for srv in servers:
+        srv.stdout.readline()       # {"ready": port}
+    clients = [client.popen(['python3', LOADGEN, 'client', '--proto', 'tcp',
+                             '--host', dst, '--port', str(PORT + i),
+                             '--duration', str(duration)])
+               for i in range(flows)]
+    for c in clients:
+        c.communicate()
+    rates = [json.loads(srv.communicate()[0].decode().strip()
+                        .splitlines()[-1])['bps'] for srv in servers]
+    return {'bps': sum(rates), 'flow_bps_min': min(rates),
+            'flow_bps_max': max(rates)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--modes', default='pin,ecmp')
+    parser.add_argument('--flows', default='1,4,16',
+                        help='comma-separated parallel flow counts')
+    parser.add_argument('--bw', type=float, default=20,
+                        help='link bandwidth in Mbit/s')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--tool', choices=['auto', 'iperf3', 'builtin'],
+                        default='auto')
+    parser.add_argument('--out', default='ecmp.json')
+    args = parser.parse_args()
+    tool = args.tool
+    if tool == 'auto':
+        tool = 'iperf3' if which('iperf3') else 'builtin'
+    run = iperf3_flows if tool == 'iperf3' else builtin_flows
+
+    ex = load_script('Exercise/Exercise 03_01.py')
+    rows = []
+    for mode in args.modes.split(','):
+        net = Mininet(topo=ex.MultiPathTopo(bw=args.bw), controller=None,
+                      link=TCLink)
+        net.start()
+        try:
+            ex.configure(net, ecmp=mode == 'ecmp')
+            dst = ex.ECMP_DST if mode == 'ecmp' else ex.PATHS['tcp'][1]
+            h1, h2 = net.get('h1', 'h2')
+            for flows in map(int, args.flows.split(',')):
+                info('*** %s: %d flows to %s\n' % (mode, flows, dst))
+                before = snapshot(net, ex.PATHS)
+                result = run(h1, h2, dst, flows, args.duration)
+                used = path_bytes(before, snapshot(net, ex.PATHS), ex.PATHS)
+                total = sum(used.values()) or 1
+                row = dict(mode=mode, flows=flows, dst=dst, tool=tool,
+                           path_bytes=used,
+                           paths_used=sum(1 for b in used.values()
+                                          if b > 0.1 * total))
+                row.update(result)
+                info('    %.1f Mbit/s over %d path(s)\n' % (
+                    row.get('bps', 0) / 1e6, row['paths_used']))
+                rows.append(row)
+        finally:
+            net.stop()
+    write_results(args.out, 'ecmp', vars(args), rows)
+    info('*** Results written to %s\n' % args.out)
+
+
+if __name__ == '__main__':
+    setLogLevel('info')
+    main()
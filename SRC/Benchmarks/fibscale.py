@@ -0,0 +1,224 @@
+#!/usr/bin/python3
+"""
+FIB scale: install large route tables on the routers and measure them
+
+The lab routers hold two or three routes. For each table size N this
+harness gives every router N synthetic prefixes (consecutive /--plen
+networks from --base), all routed towards h2, and measures:
+
+    install_s         one `ip -batch` of N routes per router, all routers
+                      at once (batchconfig.apply_all)
+    flush_s           removing them again (`route flush proto FIB_PROTO`)
+    bytes_per_route_fib, bytes_per_route_slab
+                      kernel memory per installed route: growth of the
+                      ip_fib_trie/ip_fib_alias slabs, and of all slab
+                      memory (/proc/meminfo), divided by the routes added
+    forwarding_ok     h1 reaches addresses in the first, middle and last
+                      prefix (h2 answers for them on lo)
+    pps               unpaced 64-byte UDP from h1 to the last prefix,
+                      packets per second received behind h2
+
+The routes are tagged with proto FIB_PROTO so they can be counted and
+flushed without touching the lab's own routes. Slab sizes are host-wide,
+so keep other network activity low while measuring.
+
+    sudo python3 fibscale.py --sizes 0,1000,10000,100000
+    sudo python3 fibscale.py --topo routerchain,10 --sizes 0,100000
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import struct
+import sys
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'Utils'))
+
+from mininet.log import setLogLevel, info, warn
+
+from batchconfig import NodeConfig, apply_all
+from benchutil import write_results
+from multipath import LOADGEN, PORT
+from sweep import TOPOS
+
+# Route protocol number marking the synthetic routes
+FIB_PROTO = 200
+
+# Kernel slab caches holding IPv4 FIB entries
+FIB_SLABS = ('ip_fib_trie', 'ip_fib_alias')
+
+
+def prefixes(base, plen, n):
+    "n consecutive a.b.c.d/plen prefixes from base."
+    start = struct.unpack('!I', socket.inet_aton(base))[0]
+    step = 1 << (32 - plen)
+    return ['%s/%d' % (socket.inet_ntoa(struct.pack('!I', start + i * step)),
+                       plen) for i in range(n)]
+
+
+def host_in(prefix):
+    "The first host address of a prefix."
+    addr, plen = prefix.split('/')
+    value = struct.unpack('!I', socket.inet_aton(addr))[0]
+    return socket.inet_ntoa(struct.pack('!I', value + (int(plen) < 32)))
+
+
+def fib_slab_bytes():
+    "Bytes allocated to the FIB slab caches, or None if unreadable."
+    try:
+        with open('/proc/slabinfo') as f:
+            lines = f.readlines()
+    except (IOError, OSError):
+        return None
+    total = 0
+    for line in lines:
+        fields = line.split()
+        if fields and fields[0] in FIB_SLABS:
+            total += int(fields[2]) * int(fields[3])    # num_objs * objsize
+    return total
+
+
+def slab_kb():
+    "Slab: from /proc/meminfo, in kB."
+    with open('/proc/meminfo') as f:
+        return int(re.search(r'^Slab:\s+(\d+)', f.read(), re.M).group(1))
+
+
+def next_hops(routers, dst):
+    "{router: (via, dev)} of each router's route towards dst."
+    hops = {}
+    for r in routers:
+        out = r.cmd('ip -4 route get %s' % dst)
+        via = re.search(r'\bvia (\S+)', out)
+        dev = re.search(r'\bdev (\S+)', out)
+        hops[r] = (via.group(1) if via else dst,
+                   dev.group(1) if dev else None)
+    return hops
+
+
+def installed(routers):
+    "Synthetic routes present on each router."
+    return dict((r, int(r.cmd('ip -4 route show proto %d | wc -l' %
+                              FIB_PROTO).strip() or 0))
+                for r in routers)
+
+
+def flood(client, server, dst, duration, size=64):
+    "Unpaced loadgen.py UDP from client to dst; received packets/s."
+    srv = server.popen(['python3', LOADGEN, 'server', '--once',
+                        '--proto', 'udp', '--port', str(PORT)])
+    srv.stdout.readline()       # {"ready": port}
+    sent = json.loads(client.cmd(
+        'python3 %s client --proto udp --host %s --port %d --duration %s '
+        '--rate 0 --size %d' % (LOADGEN, dst, PORT, duration, size))
+        .strip().splitlines()[-1])
+    got = json.loads(srv.communicate()[0].decode().strip().splitlines()[-1])
+    return {'sent_pps': sent['pps'],
+            'pps': got['packets'] / sent['seconds'] if sent['seconds']
+            else 0.0}
+
+
+def run_size(net, routers, hops, n, args):
+    "Install, check, measure and flush n routes per router."
+    h1, h2 = net.get('h1', 'h2')
+    nets = prefixes(args.base, args.plen, n)
+    # first, middle and last prefix, the last one flooded
+    probes = ([host_in(p) for p in
+               sorted(set([nets[0], nets[len(nets) // 2], nets[-1]]),
+                      key=nets.index)] if nets else [])
+    row = dict(routes_per_router=n, routers=len(routers),
+               routes=n * len(routers))
+
+    configs = []
+    for r in routers:
+        cfg = NodeConfig(r)
+        via, dev = hops[r]
+        for prefix in nets:
+            cfg.route(prefix, via=via, dev=dev, proto=FIB_PROTO)
+        configs.append(cfg)
+    slab, fib = slab_kb(), fib_slab_bytes()
+    start = time.time()
+    results = apply_all(configs, timeout=args.timeout)
+    row['install_s'] = time.time() - start
+    row['failed_routes'] = sum(len(res.failures) for res in results)
+    if row['routes']:
+        row['routes_per_s'] = row['routes'] / row['install_s']
+        row['bytes_per_route_slab'] = (
+            1024.0 * (slab_kb() - slab) / row['routes'])
+        if fib is not None:
+            row['bytes_per_route_fib'] = (
+                float(fib_slab_bytes() - fib) / row['routes'])
+    counts = installed(routers)
+    row['installed_ok'] = all(c == n for c in counts.values())
+    if not row['installed_ok']:
+        warn('*** routes installed: %s\n' % counts)
+
+    for addr in probes:
+        h2.cmd('ip addr add %s/32 dev lo' % addr)
+    lost = [addr for addr in probes
+            if ' 0% packet loss' not in h1.cmd('ping -n -c 2 -i 0.2 -W 2 %s'
+                                              % addr)]
+    row['forwarding_ok'] = not lost
+    if lost:
+        warn('*** no forwarding to %s\n' % ', '.join(lost))
+    dst = probes[-1] if probes else h2.IP()
+    row.update(flood(h1, h2, dst, args.duration))
+    for addr in probes:
+        h2.cmd('ip addr del %s/32 dev lo' % addr)
+
+    flush = [NodeConfig(r).ip('route flush proto %d' % FIB_PROTO)
+             for r in routers]
+    start = time.time()
+    apply_all(flush, timeout=args.timeout)
+    row['flush_s'] = time.time() - start
+    info('    %s\n' % ', '.join('%s=%s' % (k, ('%.3f' % v
+                                               if isinstance(v, float)
+                                               else v))
+                                  for k, v in sorted(row.items())))
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--topo', default='router3',
+                        help='router3 or routerchain,N')
+    parser.add_argument('--sizes', default='0,1000,10000,100000',
+                        help='comma-separated routes per router')
+    parser.add_argument('--base', default='100.0.0.0',
+                        help='first synthetic prefix')
+    parser.add_argument('--plen', type=int, default=24)
+    parser.add_argument('--duration', type=float, default=5,
+                        help='seconds of UDP load per size')
+    parser.add_argument('--timeout', type=float, default=300,
+                        help='seconds allowed per batch')
+    parser.add_argument('--out', default='fibscale.json')
+    args = parser.parse_args()
+
+    name, _, size = args.topo.partition(',')
+    start = TOPOS[name][1]
+    if size:
+        start = partial(start, n=int(size))
+    net = start({})
+    rows = []
+    try:
+        routers = [h for h in net.hosts if re.match(r'r\d+$', h.name)]
+        hops = next_hops(routers, net['h2'].IP())
+        for n in map(int, args.sizes.split(',')):
+            info('*** %d routes on each of %d routers\n' % (n, len(routers)))
+            row = run_size(net, routers, hops, n, args)
+            row['topo'] = args.topo
+            rows.append(row)
+    finally:
+        net.stop()
+    write_results(args.out, 'fibscale', vars(args), rows)
+    info('*** Results written to %s\n' % args.out)
+
+
+if __name__ == '__main__':
+    setLogLevel('info')
+    main()
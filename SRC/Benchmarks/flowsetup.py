@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+"""
+First-packet latency and flow setup rate: reactive vs proactive L2
+
+Managed Switch.py runs OVSController, a reactive learning switch: the
+first packet of every new flow on every switch is sent to the controller,
+which installs a flow and releases the packet. --proactive instead
+installs the MAC-to-port flows of all switches before any traffic (see
+SRC/Utils/flows.py). For Mininet TreeTopo networks of growing size this
+harness measures both modes:
+
+    first_rtt_ms    RTT of the first ping between sampled host pairs
+                    (ARP plus ICMP, every switch on the path cold)
+    steady_rtt_ms   RTT of the following ping
+    allpairs_s      time for every host pair to reach each other at
+                    once (SRC/Utils/reachability.py)
+    flows_per_s     reactive: flows the controller installed per second
+                    of the all-pairs test; proactive: flows installed
+                    per second of the bundled install
+
+    sudo python3 flowsetup.py --trees 2x4,3x4,4x4 --pairs 20
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'Utils'))
+
+from mininet.net import Mininet
+from mininet.node import OVSController, OVSSwitch
+from mininet.topolib import TreeTopo
+from mininet.log import setLogLevel, info
+
+from benchutil import Stopwatch, write_results
+from flows import OF_VERSION, FlowTable, install_all, l2_flows
+from reachability import reachability
+
+
+def median(values):
+    values = sorted(v for v in values if v is not None)
+    return values[len(values) // 2] if values else None
+
+
+def ping_pair(src, dst):
+    "RTTs in ms of two pings, in order (None for a lost one)."
+    out = src.cmd('ping -n -c 2 -i 0.2 -W 2 %s' % dst.IP())
+    rtts = dict((int(seq), float(t)) for seq, t in
+                re.findall(r'icmp_seq=(\d+) .*?time=([\d.]+) ms', out))
+    return rtts.get(1), rtts.get(2)
+
+
+def count_flows(net, protocols=None):
+    "Flows installed on all switches."
+    opt = '-O %s ' % protocols if protocols else ''
+    total = 0
+    for sw in net.switches:
+        out = sw.cmd('ovs-ofctl %sdump-flows %s' % (opt, sw.name))
+        total += len(re.findall(r'actions=', out))
+    return total
+
+
+def run_one(mode, depth, fanout, pairs, seed):
+    "Measure one mode on one tree."
+    proactive = mode == 'proactive'
+    topo = TreeTopo(depth=depth, fanout=fanout)
+    if proactive:
+        net = Mininet(topo=topo, controller=None, autoSetMacs=True,
+                      switch=partial(OVSSwitch, protocols=OF_VERSION))
+    else:
+        net = Mininet(topo=topo, controller=OVSController, autoSetMacs=True)
+    sw = Stopwatch()
+    row = dict(mode=mode, depth=depth, fanout=fanout,
+               hosts=len(topo.hosts()), switches=len(topo.switches()))
+    try:
+        with sw('net_start'):
+            net.start()
+        if proactive:
+            tables = dict((s, FlowTable(s)) for s in net.switches)
+            with sw('flow_compute'):
+                l2_flows(net, tables)
+            with sw('flow_install'):
+                row['failed_switches'] = len(install_all(tables.values()))
+            row['flows'] = sum(len(t) for t in tables.values())
+            row['flows_per_s'] = row['flows'] / sw.times['flow_install']
+        else:
+            # let every switch connect before the first packet
+            net.waitConnected()
+
+        rng = random.Random(seed)
+        sample = [tuple(rng.sample(net.hosts, 2)) for _ in range(pairs)]
+        first, steady = [], []
+        for src, dst in sample:
+            a, b = ping_pair(src, dst)
+            first.append(a)
+            steady.append(b)
+        row.update(first_rtt_ms=median(first),
+                   first_rtt_max_ms=max([r for r in first if r] or [None]),
+                   steady_rtt_ms=median(steady),
+                   pairs_lost=sum(1 for r in first if r is None))
+
+        before = 0 if proactive else count_flows(net)
+        start = time.time()
+        matrix = reachability(net)
+        row['allpairs_s'] = time.time() - start
+        row['allpairs_loss_pct'] = matrix.ploss()
+        if not proactive:
+            row['flows'] = count_flows(net) - before
+            row['flows_per_s'] = row['flows'] / row['allpairs_s']
+    finally:
+        net.stop()
+    row.update(sw.times)
+    info('    %s\n' % ', '.join('%s=%s' % (k, ('%.3f' % v
+                                               if isinstance(v, float)
+                                               else v))
+                                  for k, v in sorted(row.items())))
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--modes', default='reactive,proactive')
+    parser.add_argument('--trees', default='2x4,3x4,4x4',
+                        help='comma-separated DEPTHxFANOUT tree sizes')
+    parser.add_argument('--pairs', type=int, default=20,
+                        help='host pairs sampled for first-packet RTT')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default='flowsetup.json')
+    args = parser.parse_args()
+
+    rows = []
+    for tree in args.trees.split(','):
+        depth, fanout = map(int, tree.split('x'))
+        for mode in args.modes.split(','):
+            info('*** %s, tree depth %d fanout %d\n' % (mode, depth, fanout))
+            rows.append(run_one(mode, depth, fanout, args.pairs, args.seed))
+    write_results(args.out, 'flowsetup', vars(args), rows)
+    info('*** Results written to %s\n' % args.out)
+
+
+if __name__ == '__main__':
+    setLogLevel('info')
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+"""
+Traffic interruption when a link of MultiPathTopo fails
+
+Runs steady traffic from h1 to h2 over one path of Exercise 03_01, takes
+one of the path's links down with net.configLinkStatus() part way
+through and brings it back up later, and measures how long no data
+reached h2 (the receiver's longest gap between arrivals, loadgen.py's
+max_gap_ms). Two modes:
+
+    static     the lab's static routes only: traffic stops until the
+               link is back (for TCP, until the next retransmission)
+    failover   keepalive agents on h1 and h2 (SRC/Utils/failover.py)
+               move the path's table onto a live path
+
+In failover mode the agents' events give, per host, the time from the
+failure to declaring the path down (detect_ms) and to rerouting
+(reroute_ms), and from the repair to the path's table being pointed
+back at the path itself (failback_ms).
+
+Taking an interface down makes the kernel drop every static route
+through it, and bringing it up does not restore them; a router would
+reinstall them once the link is back. run_once() does so itself, from a
+snapshot of both ends' routes taken before the failure.
+
+Keep --down under two seconds for UDP: loadgen's UDP server ends a
+session after two idle seconds.
+
+    sudo python3 linkfail.py --path tcp --link r4,r5 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'Utils'))
+
+from mininet.net import Mininet
+from mininet.log import setLogLevel, info
+
+from batchconfig import NodeConfig, apply_all
+from benchutil import load_script, write_results
+from failover import INTERVAL, MULTIPLIER, stop_agents
+from multipath import LOADGEN, PORT
+from warmrunner import parse_routes
+
+
+def restore_routes(routes):
+    "Replace the routes {node: [ip route arguments]} lost with a link."
+    configs = []
+    for node, lines in routes.items():
+        cfg = NodeConfig(node)
+        for line in lines:
+            cfg.ip('route replace %s' % line)
+        configs.append(cfg)
+    apply_all(configs)
+
+
+def run_once(net, args, dst, link):
+    "One failure during steady traffic; returns the receiver's summary."
+    h1, h2 = net.get('h1', 'h2')
+    routes = dict((node, parse_routes(node.cmd('ip -4 route show table all')))
+                  for node in net.get(*link))
+    srv = h2.popen(['python3', LOADGEN, 'server', '--once', '--proto',
+                    args.path, '--port', str(PORT)])
+    srv.stdout.readline()       # {"ready": port}
+    client = h1.popen(['python3', LOADGEN, 'client', '--proto',
+                       args.path, '--host', dst, '--port', str(PORT),
+                       '--duration', str(args.duration), '--rate', args.rate,
+                       '--size', str(args.size)])
+    time.sleep(args.fail_at)
+    failed = time.time()
+    net.configLinkStatus(link[0], link[1], 'down')
+    time.sleep(args.down)
+    repaired = time.time()
+    net.configLinkStatus(link[0], link[1], 'up')
+    restore_routes(routes)
+    client.communicate()
+    got = json.loads(srv.communicate()[0].decode().strip().splitlines()[-1])
+    return failed, repaired, got
+
+
+def first_after(events, start, **match):
+    "ms from start to the first event after it matching all of match."
+    for e in events:
+        if e['time'] >= start and all(e.get(k) == v
+                                      for k, v in match.items()):
+            return 1000 * (e['time'] - start)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--modes', default='static,failover')
+    parser.add_argument('--path', choices=['udp', 'tcp'], default='tcp',
+                        help='path (and protocol) carrying the traffic')
+    parser.add_argument('--link', help='link to fail, as NODE1,NODE2 '
+                        '(default: between the path\'s first two routers)')
+    parser.add_argument('--rate', default='2M', help='traffic bits/s')
+    parser.add_argument('--size', type=int, default=250,
+                        help='bytes per datagram or write')
+    parser.add_argument('--duration', type=float, default=6)
+    parser.add_argument('--fail-at', type=float, default=2,
+                        help='seconds into the traffic')
+    parser.add_argument('--down', type=float, default=1.5,
+                        help='seconds the link stays down')
+    parser.add_argument('--interval', type=float, default=INTERVAL,
+                        help='keepalive interval (failover mode)')
+    parser.add_argument('--multiplier', type=int, default=MULTIPLIER)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', default='linkfail.json')
+    args = parser.parse_args()
+
+    ex = load_script('Exercise/Exercise 03_01.py')
+    routers, dst = ex.PATHS[args.path]
+    link = args.link.split(',') if args.link else list(routers[:2])
+    name = '-'.join(routers)
+    rows = []
+    for mode in args.modes.split(','):
+        net = Mininet(topo=ex.MultiPathTopo(), controller=None)
+        net.start()
+        agents = {}
+        runs = []
+        try:
+            ex.configure(net)
+            if mode == 'failover':
+                agents = ex.configure_failover(
+                    net, interval=args.interval, multiplier=args.multiplier)
+            for run_no in range(args.repeat):
+                info('*** %s, run %d: %s traffic to %s, %s-%s down for '
+                     '%.1fs\n' % (mode, run_no + 1, args.path, dst, link[0],
+                                  link[1], args.down))
+                runs.append(run_once(net, args, dst, link))
+                time.sleep(0.5)
+        finally:
+            events = stop_agents(agents)
+            net.stop()
+        for run_no, (failed, repaired, got) in enumerate(runs):
+            row = dict(mode=mode, run=run_no, path=args.path,
+                       link='-'.join(link), max_gap_ms=got['max_gap_ms'],
+                       bps=got['bps'], loss_pct=got.get('loss_pct'))
+            for host, evs in sorted(events.items()):
+                row['detect_ms_%s' % host] = first_after(
+                    evs, failed, event='down', path=name)
+                row['reroute_ms_%s' % host] = first_after(
+                    evs, failed, event='route', path=name, ok=True)
+                row['failback_ms_%s' % host] = first_after(
+                    evs, repaired, event='route', path=name, via=name,
+                    ok=True)
+            info('    %s\n' % ', '.join(
+                '%s=%s' % (k, '%.1f' % v if isinstance(v, float) else v)
+                for k, v in sorted(row.items())))
+            rows.append(row)
+    write_results(args.out, 'linkfail', vars(args), rows)
+    info('*** Results written to %s\n' % args.out)
+
+
+if __name__ == '__main__':
+    setLogLevel('info')
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+"""
+Per-path throughput and latency benchmark for MultiPathTopo
+
+Exercise 03_01 steers UDP over r1-r3, TCP over r4-r6 and everything else
+over r7-r9. This harness builds and configures that network, then for
+each path drives sustained load from h1 to h2's address on the path:
+
+    udp    UDP at --udp-rate: throughput, jitter, loss
+    tcp    bulk TCP: throughput
+    other  ICMP latency probes: rtt min/avg/max, mdev (jitter), loss
+
+iperf3 is used when installed, otherwise SRC/Utils/loadgen.py. Interface
+counters of r1..r9 are read before and after each test to check that the
+traffic really crossed its intended path. Results are written as JSON.
+With --samples (CSV) or --textfile (Prometheus) the routers' interfaces
+are also sampled at --hz for the whole run (SRC/Utils/ifsampler.py):
+
+    sudo python3 multipath.py --duration 10 --udp-rate 50M --out paths.json
+    sudo python3 multipath.py --samples r1-r9.csv --hz 100
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from shutil import which
+
+UTILS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Utils')
+sys.path.insert(0, UTILS)
+
+from mininet.net import Mininet
+from mininet.log import setLogLevel, info, warn
+
+from benchutil import load_script, write_results
+from ifsampler import Sampler
+from ifstats import netdev, diff
+
+LOADGEN = os.path.abspath(os.path.join(UTILS, 'loadgen.py'))
+PORT = 5201
+
+
+def path_bytes(before, after, paths):
+    "Bytes forwarded by each path's routers between two snapshots."
+    used = {}
+    for name, (routers, _dst) in paths.items():
+        used[name] = sum(sum(c['tx_bytes'] for c in
+                             diff(before[r], after[r]).values())
+                         for r in routers)
+    return used
+
+
+def snapshot(net, paths):
+    return dict((r, netdev(net[r])) for routers, _ in paths.values()
+                for r in routers)
+
+
+def iperf3(client, server, dst, proto, duration, rate, size):
+    "One iperf3 run; returns the result fields."
+    srv = server.popen(['iperf3', '-s', '-1', '-J', '-p', str(PORT)])
+    client.cmd('sleep 0.5')
+    cmd = 'iperf3 -J -c %s -p %d -t %s' % (dst, PORT, duration)
+    if proto == 'udp':
+        cmd += ' -u -b %s -l %d' % (rate, size)
+    out = json.loads(client.cmd(cmd))
+    srv.communicate()
+    if 'error' in out:
+        return {'error': out['error']}
+    end = out['end']
+    if proto == 'udp':
+        return {'bps': end['sum']['bits_per_second'],
+                'jitter_ms': end['sum']['jitter_ms'],
+                'loss_pct': end['sum']['lost_percent']}
+    return {'bps': end['sum_received']['bits_per_second'],
+            'retransmits': end['sum_sent'].get('retransmits')}
+
+
+def builtin(client, server, dst, proto, duration, rate, size):
+    "One loadgen.py run; returns the server's view of the session."
+    srv = server.popen(['python3', LOADGEN, 'server', '--once',
+                        '--proto', proto, '--port', str(PORT)])
+    srv.stdout.readline()       # {"ready": port}
+    cmd = 'python3 %s client --proto %s --host %s --port %d ' \
+          '--duration %s --size %d' % (LOADGEN, proto, dst, PORT,
+                                       duration, size)
+    if proto == 'udp':
+        cmd += ' --rate %s' % rate
+    client.cmd(cmd)
+    out, _err = srv.communicate()
+    result = json.loads(out.decode().strip().splitlines()[-1])
+    keep = ('bps', 'jitter_ms', 'loss_pct')
+    return dict((k, v) for k, v in result.items() if k in keep)
+
+
+def icmp(client, dst, count, interval):
+    "ICMP latency probes; returns rtt statistics and loss."
+    out = client.cmd('ping -n -q -c %d -i %s %s' % (count, interval, dst))
+    result = {}
+    m = re.search(r'(\d+)% packet loss', out)
+    if m:
+        result['loss_pct'] = float(m.group(1))
+    m = re.search(r'= ([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+) ms', out)
+    if m:
+        result.update(zip(('rtt_min_ms', 'rtt_avg_ms', 'rtt_max_ms',
+                           'jitter_ms'), map(float, m.groups())))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--udp-rate', default='50M')
+    parser.add_argument('--size', type=int, default=1200,
+                        help='UDP datagram / TCP write size')
+    parser.add_argument('--pings', type=int, default=500)
+    parser.add_argument('--ping-interval', default='0.01')
+    parser.add_argument('--tool', choices=['auto', 'iperf3', 'builtin'],
+                        default='auto')
+    parser.add_argument('--samples', help='CSV of router interface samples')
+    parser.add_argument('--textfile',
+                        help='Prometheus textfile updated while running')
+    parser.add_argument('--hz', type=float, default=100,
+                        help='interface sampling rate')
+    parser.add_argument('--out', default='multipath.json')
+    args = parser.parse_args()
+    tool = args.tool
+    if tool == 'auto':
+        tool = 'iperf3' if which('iperf3') else 'builtin'
+    load = iperf3 if tool == 'iperf3' else builtin
+
+    ex = load_script('Exercise/Exercise 03_01.py')
+    paths = ex.PATHS
+    net = Mininet(topo=ex.MultiPathTopo(), controller=None)
+    net.start()
+    rows = []
+    sampler = None
+    try:
+        ex.configure(net)
+        if args.samples or args.textfile:
+            routers = sorted(set(r for rs, _ in paths.values() for r in rs))
+            sampler = Sampler(net, [net[r] for r in routers], hz=args.hz,
+                              seconds=3 * args.duration + 60,
+                              textfile=args.textfile).start()
+        h1, h2 = net.get('h1', 'h2')
+        for name, (routers, dst) in sorted(paths.items()):
+            info('*** %s path (%s) to %s\n' % (name, '-'.join(routers), dst))
+            before = snapshot(net, paths)
+            if name == 'other':
+                result = icmp(h1, dst, args.pings, args.ping_interval)
+            else:
+                result = load(h1, h2, dst, name, args.duration,
+                              args.udp_rate, args.size)
+            used = path_bytes(before, snapshot(net, paths), paths)
+            busiest = max(used, key=used.get)
+            row = dict(path=name, routers=list(routers), dst=dst,
+                       tool='ping' if name == 'other' else tool,
+                       path_bytes=used, path_used=busiest,
+                       path_ok=busiest == name)
+            row.update(result)
+            if not row['path_ok']:
+                warn('*** %s traffic crossed the %s path\n' %
+                     (name, busiest))
+            info('    %s\n' % json.dumps(result, sort_keys=True))
+            rows.append(row)
+    finally:
+        if sampler:
+            sampler.close()
+            if args.samples:
+                sampler.write_csv(args.samples)
+        net.stop()
+    write_results(args.out, 'multipath', vars(args), rows)
+    info('*** Results written to %s\n' % args.out)
+
+
+if __name__ == '__main__':
+    setLogLevel('info')
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+"""
+Startup-time benchmark for generated router topologies
+
+For each router count N this builds a routerchain or routermesh topology
+(see SRC/Utils/topogen.py) and times every phase of getting it ready:
+
+    topo_build   Topo construction (Topo.build)
+    net_build    Mininet(): nodes, namespaces and links
+    net_start    net.start()
+    configure    forwarding + compiled routes on every router
+    first_ping   until h1 gets its first reply from h2 (pings go out
+                 with TTL MAX_TTL both ways; a path of more routers
+                 than that can forward, such as routerchain with N of
+                 255 and up, is not pinged and recorded as 'ttl')
+    net_stop     net.stop()
+
+Results are written as JSON so runs can be compared across commits:
+
+    sudo python3 startup.py --sizes 3,10,30,100,300,500 --out startup.json
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'Utils'))
+
+from mininet.net import Mininet
+from mininet.link import Link, TCLink
+from mininet.log import setLogLevel, info
+
+from benchutil import Stopwatch, write_results
+from topogen import topos, configure_routers
+
+# Largest TTL an IPv4 packet can carry; it crosses at most MAX_TTL - 1
+# routers
+MAX_TTL = 255
+
+
+def router_hops(topo, src='h1', dst='h2'):
+    "Routers on the shortest path from src to dst in topo, or None."
+    adj = {}
+    for a, b in topo.links():
+        adj.setdefault(a, []).append(b)
+        adj.setdefault(b, []).append(a)
+    dist = {src: 0}
+    frontier = [src]
+    while frontier and dst not in dist:
+        step = []
+        for node in frontier:
+            for peer in adj.get(node, []):
+                if peer not in dist:
+                    dist[peer] = dist[node] + 1
+                    step.append(peer)
+        frontier = step
+    return dist[dst] - 1 if dst in dist else None
+
+
+def first_ping(net, timeout=30):
+    """Ping h2 from h1 until a reply arrives, with TTL MAX_TTL on the
+       request and on h2's reply.
+       Returns (seconds until the reply, its rtt in ms) or (None, None)."""
+    h1, h2 = net.get('h1', 'h2')
+    h2.cmd('sysctl -qw net.ipv4.ip_default_ttl=%d' % MAX_TTL)
+    start = time.time()
+    while time.time() - start < timeout:
+        out = h1.cmd('ping -c1 -W1 -t %d %s' % (MAX_TTL, h2.IP()))
+        m = re.search(r'time=([\d.]+) ms', out)
+        if m:
+            return time.time() - start, float(m.group(1))
+    return None, None
+
+
+def run_one(topo, n, fanout, link):
+    "Time one build/start/configure/ping/stop cycle."
+    sw = Stopwatch()
+    with sw('topo_build'):
+        t = topos[topo](n=n, fanout=fanout, link=link)
+    with sw('net_build'):
+        net = Mininet(topo=t, controller=None,
+                      link=Link if link == 'none' else TCLink)
+    try:
+        with sw('net_start'):
+            net.start()
+        with sw('configure'):
+            results = configure_routers(net)
+        hops = router_hops(t)
+        if hops is not None and hops < MAX_TTL:
+            ready, rtt = first_ping(net)
+            status = 'ok' if ready is not None else 'timeout'
+        else:
+            ready, rtt, status = None, None, 'ttl'
+    finally:
+        with sw('net_stop'):
+            net.stop()
+    routers = set(t.routers)
+    row = dict(topo=topo, routers=n, fanout=fanout, link=link,
+               end_hosts=len([h for h in t.hosts() if h not in routers]),
+               links=len(t.links()), path_routers=hops,
+               failed_commands=sum(len(r.failures) for r in results),
+               first_ping=ready, first_rtt_ms=rtt, first_ping_status=status)
+    row.update(sw.times)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--topo', choices=sorted(topos), default='routerchain')
+    parser.add_argument('--sizes', default='3,10,30,100,300,500',
+                        help='comma-separated router counts')
+    parser.add_argument('--fanout', type=int, default=0,
+                        help='extra hosts per router')
+    parser.add_argument('--link', default='none',
+                        help='link profile from topogen.LINK_PROFILES')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--out', default='startup.json')
+    args = parser.parse_args()
+
+    rows = []
+    for n in [int(x) for x in args.sizes.split(',')]:
+        for _ in range(args.repeat):
+            row = run_one(args.topo, n, args.fanout, args.link)
+            info('*** %(topo)s n=%(routers)d: build %(net_build).2fs '
+                 'start %(net_start).2fs configure %(configure).2fs '
+                 'first ping %(first_ping)s (%(first_ping_status)s)\n'
+                 % row)
+            rows.append(row)
+            write_results(args.out, 'startup', vars(args), rows)
+    info('*** Results written to %s\n' % args.out)
+
+
+if __name__ == '__main__':
+    setLogLevel('info')
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+"""
+Small-packet send rate and CPU cost of h1's protocol steering
+
+Exercise 03_01 can steer h1's traffic onto its paths in two ways:
+
+    mark   iptables mangle OUTPUT rules MARK each packet by protocol and
+           `ip rule fwmark` picks the path table (packets are re-routed
+           after marking)
+    rule   `ip rule ipproto` picks the table during the normal route
+           lookup; no netfilter rules at all
+
+For each variant this harness configures MultiPathTopo, then runs
+--senders unpaced UDP senders of --size byte datagrams on h1 towards
+h2's UDP-path address and records the packets per second sent and
+received, and the sender CPU time per packet. The netfilter work is done
+in the sender's system calls, so it shows up in its system time. Router
+interface counters confirm the traffic used the UDP path.
+
+The senders are SRC/Utils/loadgen.py clients with --rate 0. iperf3 is
+not used: its TCP control connection would be steered onto the TCP path,
+and h2's replies from its UDP-path address have no way back over it.
+
+    sudo python3 steering.py --size 64 --duration 10 --repeat 3
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'Utils'))
+
+from mininet.net import Mininet
+from mininet.log import setLogLevel, info, warn
+
+from benchutil import load_script, write_results
+from multipath import LOADGEN, PORT, path_bytes, snapshot
+
+
+def udp_senders(client, server, dst, senders, duration, size):
+    "Unpaced loadgen.py UDP senders; returns per-sender result dicts."
+    servers = [server.popen(['python3', LOADGEN, 'server', '--once',
+                             '--proto', 'udp', '--port', str(PORT + i)])
+               for i in range(senders)]
+    for srv in servers:
+        srv.stdout.readline()       # {"ready": port}
+    clients = [client.popen(['python3', LOADGEN, 'client', '--proto', 'udp',
+                             '--host', dst, '--port', str(PORT + i),
+                             '--duration', str(duration), '--rate', '0',
+                             '--size', str(size)])
+               for i in range(senders)]
+    results = []
+    for c, srv in zip(clients, servers):
+        sent = json.loads(c.communicate()[0].decode().strip()
+                          .splitlines()[-1])
+        got = json.loads(srv.communicate()[0].decode().strip()
+                         .splitlines()[-1])
+        results.append({'sent_pps': sent['pps'],
+                        'received_pps': (got['packets'] / sent['seconds']
+                                         if sent['seconds'] else 0),
+                        'packets': sent['packets'],
+                        'cpu_user': sent['cpu_user'],
+                        'cpu_system': sent['cpu_system']})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--variants', default='mark,rule')
+    parser.add_argument('--size', type=int, default=64,
+                        help='UDP payload bytes')
+    parser.add_argument('--senders', type=int, default=1,
+                        help='parallel sender processes on h1')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', default='steering.json')
+    args = parser.parse_args()
+
+    ex = load_script('Exercise/Exercise 03_01.py')
+    dst = ex.PATHS['udp'][1]
+    rows = []
+    for variant in args.variants.split(','):
+        net = Mininet(topo=ex.MultiPathTopo(), controller=None)
+        net.start()
+        try:
+            ex.configure(net, steering=variant)
+            h1, h2 = net.get('h1', 'h2')
+            for run_no in range(args.repeat):
+                info('*** %s steering, run %d: %d x %d-byte UDP to %s\n' % (
+                    variant, run_no + 1, args.senders, args.size, dst))
+                before = snapshot(net, ex.PATHS)
+                senders = udp_senders(h1, h2, dst, args.senders,
+                                      args.duration, args.size)
+                used = path_bytes(before, snapshot(net, ex.PATHS), ex.PATHS)
+                busiest = max(used, key=used.get)
+                row = dict(variant=variant, run=run_no,
+                           senders=senders, path_bytes=used,
+                           path_ok=busiest == 'udp')
+                packets = sum(s['packets'] for s in senders)
+                if packets:
+                    cpu = sum(s['cpu_user'] + s['cpu_system']
+                              for s in senders)
+                    row.update(
+                        sent_pps=sum(s['sent_pps'] for s in senders),
+                        received_pps=sum(s['received_pps'] for s in senders),
+                        cpu_ns_per_packet=1e9 * cpu / packets,
+                        system_ns_per_packet=1e9 * sum(
+                            s['cpu_system'] for s in senders) / packets)
+                    info('    %.0f pps sent, %.0f received, %.0f ns CPU '
+                         '(%.0f system) per packet\n' % (
+                             row['sent_pps'], row['received_pps'],
+                             row['cpu_ns_per_packet'],
+                             row['system_ns_per_packet']))
+                if not row['path_ok']:
+                    warn('*** UDP traffic crossed the %s path\n' % busiest)
+                rows.append(row)
+        finally:
+            net.stop()
+    write_results(args.out, 'steering', vars(args), rows)
+    info('*** Results written to %s\n' % args.out)
+
+
+if __name__ == '__main__':
+    setLogLevel('info')
+    main()
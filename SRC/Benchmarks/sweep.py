@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+"""
+Link-profile sweep of a routed topology, with cached cells
+
+Runs one topology and traffic test over a grid of TCLink profiles
+(bandwidth x delay x loss x queue size, the same options on every link)
+and writes one columnar results table. Topologies:
+
+    router3          Resources/Lab3/router3.py (h1-r1-r2-r3-h2)
+    test01           Debug/Test 01.py (h1-s1-s2-h2, standalone OVS)
+    routerchain,N    SRC/Utils/topogen.py chain of N routers
+
+Tests run from h1 to h2:
+
+    ping   ICMP RTT (min/avg/max/mdev) and loss
+    tcp    bulk TCP throughput
+    udp    UDP at --udp-rate: throughput, jitter, loss
+
+iperf3 is used when installed, otherwise SRC/Utils/loadgen.py. Each cell
+(one profile, one test) is cached in --cache under a hash of the
+topology (its name, its source file and the modules that compute and
+install its routes), the profile and the test (its parameters and
+code), so a rerun only measures cells that changed; the network of a
+profile is not even built when all of its cells are cached. --force measures everything again.
+
+    sudo python3 sweep.py --topo router3 --tests ping,tcp \\
+        --bw 10,100 --delay 1ms,10ms --loss 0,1 --queue none,100
+"""
+
+import argparse
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import sys
+from functools import partial
+from shutil import which
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'Utils'))
+
+from mininet.net import Mininet
+from mininet.link import TCLink
+from mininet.log import setLogLevel, info, error
+
+from benchutil import columnar, load_script, write_results
+from multipath import builtin, icmp, iperf3
+from topogen import RouterChainTopo, configure_routers
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def start_router3(profile):
+    mod = load_script('../Resources/Lab3/router3.py')
+    topo = mod.RTopo(linkopts=profile)
+    net = Mininet(topo=topo, link=TCLink, autoSetMacs=True, controller=None)
+    net.start()
+    mod.configure(net, topo)
+    return net
+
+
+def start_test01(profile):
+    net = load_script('../Debug/Test 01.py').build_network(profile)
+    net.start()
+    return net
+
+
+def start_chain(profile, n=3):
+    net = Mininet(topo=RouterChainTopo(n=int(n), link=profile),
+                  link=TCLink, controller=None)
+    net.start()
+    configure_routers(net)
+    return net
+
+
+# Topology name: (source file relative to SRC/, function starting it)
+TOPOS = {'router3': ('../Resources/Lab3/router3.py', start_router3),
+         'test01': ('../Debug/Test 01.py', start_test01),
+         'routerchain': ('Utils/topogen.py', start_chain)}
+
+# Modules whose code decides the routes a topology gets (relative to SRC/)
+ROUTING = ('Utils/batchconfig.py', 'Utils/routecompiler.py',
+           'Utils/topogen.py')
+
+
+def ping_test(args, tool, h1, h2):
+    return icmp(h1, h2.IP(), args.pings, args.ping_interval)
+
+
+def tcp_test(args, tool, h1, h2):
+    load = iperf3 if tool == 'iperf3' else builtin
+    return load(h1, h2, h2.IP(), 'tcp', args.duration, None, args.size)
+
+
+def udp_test(args, tool, h1, h2):
+    load = iperf3 if tool == 'iperf3' else builtin
+    return load(h1, h2, h2.IP(), 'udp', args.duration, args.udp_rate,
+                args.size)
+
+
+# Test name: (function, the arguments its result depends on)
+TESTS = {'ping': (ping_test, ('pings', 'ping_interval')),
+         'tcp': (tcp_test, ('duration', 'size')),
+         'udp': (udp_test, ('duration', 'size', 'udp_rate'))}
+
+
+def sha(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def source_hash(path):
+    "Hash of a source file relative to SRC/."
+    with open(os.path.join(SRC, path), 'rb') as f:
+        return sha(f.read())
+
+
+def profiles(args):
+    """Link option dicts of the whole grid; 'none' (or loss 0) leaves an
+       option out, so the link is not shaped in that dimension."""
+    def values(text, kind):
+        return [None if v in ('none', '') else kind(v)
+                for v in text.split(',')]
+    grid = []
+    for bw, delay, loss, queue in itertools.product(
+            values(args.bw, float), values(args.delay, str),
+            values(args.loss, float), values(args.queue, int)):
+        opts = {'bw': bw, 'delay': delay, 'loss': loss or None,
+                'max_queue_size': queue}
+        grid.append(dict((k, v) for k, v in opts.items() if v is not None))
+    return grid
+
+
+def cell_key(topo, source, routing, profile, test, tool, args):
+    "Cache key and the document it hashes."
+    fn, params = TESTS[test]
+    code = inspect.getsource(fn) + inspect.getsource(
+        icmp if test == 'ping' else iperf3 if tool == 'iperf3' else builtin)
+    doc = {'topology': {'name': topo, 'source': source, 'routing': routing},
+           'profile': profile,
+           'test': {'name': test, 'tool': 'ping' if test == 'ping' else tool,
+                    'code': sha(code.encode()),
+                    'params': dict((p, getattr(args, p)) for p in params)}}
+    return sha(json.dumps(doc, sort_keys=True).encode()), doc
+
+
+def load_cached(path):
+    try:
+        with open(path) as f:
+            return json.load(f)['result']
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+
+def store(path, doc, result):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'key': doc, 'result': result}, f, sort_keys=True)
+    os.rename(tmp, path)
+
+
+def measure(start, profile, todo, args, tool):
+    "Build one profile's network and run the tests in todo on it."
+    results = {}
+    try:
+        net = start(profile)
+    except Exception as e:
+        error('*** network failed to start: %s\n' % e)
+        return dict((test, {'error': str(e)}) for test in todo)
+    try:
+        h1, h2 = net.get('h1', 'h2')
+        for test in todo:
+            try:
+                results[test] = TESTS[test][0](args, tool, h1, h2)
+            except Exception as e:
+                error('*** %s test failed: %s\n' % (test, e))
+                results[test] = {'error': str(e)}
+    finally:
+        net.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--topo', default='router3',
+                        help='router3, test01 or routerchain,N')
+    parser.add_argument('--tests', default='ping,tcp')
+    parser.add_argument('--bw', default='10,100',
+                        help='Mbit/s per link; none for unlimited')
+    parser.add_argument('--delay', default='1ms,10ms',
+                        help='one-way delay per link; none for no delay')
+    parser.add_argument('--loss', default='0,1', help='loss %% per link')
+    parser.add_argument('--queue', default='none',
+                        help='max_queue_size in packets; none for default')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--size', type=int, default=1200,
+                        help='UDP datagram / TCP write size')
+    parser.add_argument('--udp-rate', default='10M')
+    parser.add_argument('--pings', type=int, default=50)
+    parser.add_argument('--ping-interval', default='0.05')
+    parser.add_argument('--tool', choices=['auto', 'iperf3', 'builtin'],
+                        default='auto')
+    parser.add_argument('--cache', default='sweep-cache',
+                        help='directory of cached cells')
+    parser.add_argument('--force', action='store_true',
+                        help='measure every cell, even if cached')
+    parser.add_argument('--out', default='sweep.json')
+    args = parser.parse_args()
+    tool = args.tool
+    if tool == 'auto':
+        tool = 'iperf3' if which('iperf3') else 'builtin'
+
+    name, _, size = args.topo.partition(',')
+    source, start = TOPOS[name]
+    if size:
+        start = partial(start, n=int(size))
+    topo_hash = source_hash(source)
+    routing = dict((path, source_hash(path)) for path in ROUTING)
+    tests = args.tests.split(',')
+    os.makedirs(args.cache, exist_ok=True)
+
+    rows = []
+    measured = 0
+    for profile in profiles(args):
+        cells, todo = {}, []
+        for test in tests:
+            key, doc = cell_key(args.topo, topo_hash, routing, profile, test,
+                                tool, args)
+            path = os.path.join(args.cache, key + '.json')
+            result = None if args.force else load_cached(path)
+            cells[test] = (key, doc, path, result)
+            if result is None:
+                todo.append(test)
+        info('*** %s: %s\n' % (json.dumps(profile, sort_keys=True),
+                               'measuring ' + ','.join(todo) if todo
+                               else 'cached'))
+        fresh = measure(start, profile, todo, args, tool) if todo else {}
+        measured += len(todo)
+        for test in tests:
+            key, doc, path, result = cells[test]
+            if test in fresh:
+                result = fresh[test]
+                if 'error' not in result:
+                    store(path, doc, result)
+            row = dict(topo=args.topo, test=test, key=key,
+                       cached=test not in fresh,
+                       bw=profile.get('bw'), delay=profile.get('delay'),
+                       loss=profile.get('loss', 0),
+                       queue=profile.get('max_queue_size'))
+            row.update(result)
+            rows.append(row)
+            info('    %s %s\n' % (test, json.dumps(result, sort_keys=True)))
+    write_results(args.out, 'sweep', vars(args), columnar(rows), indent=None)
+    info('*** %d cells, %d measured, %d cached; results written to %s\n' % (
+        len(rows), measured, len(rows) - measured, args.out))
+
+
+if __name__ == '__main__':
+    setLogLevel('info')
+    main()
@@ -20,12 +20,22 @@ The script configures all IP addresses, static routes, and enables
 IP forwarding on the routers.
 """
 
+import os
+import sys
+
 from mininet.topo import Topo
 from mininet.net import Mininet
 from mininet.node import Controller, OVSController
 from mininet.cli import CLI
 from mininet.log import setLogLevel, info
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'Utils'))
+from batchconfig import NodeConfig, apply_all
+from reachability import reachability
+from routecompiler import (add_routes, compile_routes, net_addresses,
+                           net_links)
+
 class RouterTopo(Topo):
     """
     A topology with 2 hosts and 3 routers.
@@ -72,30 +82,35 @@ def configure_and_run():
     h1, h2 = net.get('h1', 'h2')
     r1, r2, r3 = net.get('r1', 'r2', 'r3')
 
+    # Each router's settings are collected and applied in one batch
     # Configure Router 1
-    r1.cmd('ifconfig r1-eth0 10.0.1.1/24')
-    r1.cmd('ifconfig r1-eth1 10.0.2.1/24')
-    r1.cmd('sysctl net.ipv4.ip_forward=1')
-    # Route to networks beyond r2
-    r1.cmd('route add -net 10.0.3.0/24 gw 10.0.2.2')
-    r1.cmd('route add -net 10.0.4.0/24 gw 10.0.2.2')
+    c1 = NodeConfig(r1)
+    c1.addr('r1-eth0', '10.0.1.1/24')
+    c1.addr('r1-eth1', '10.0.2.1/24')
+    c1.forwarding()
 
     # Configure Router 2
-    r2.cmd('ifconfig r2-eth0 10.0.2.2/24')
-    r2.cmd('ifconfig r2-eth1 10.0.3.1/24')
-    r2.cmd('sysctl net.ipv4.ip_forward=1')
-    # Route to h1's network
-    r2.cmd('route add -net 10.0.1.0/24 gw 10.0.2.1')
-    # Route to h2's network
-    r2.cmd('route add -net 10.0.4.0/24 gw 10.0.3.2')
+    c2 = NodeConfig(r2)
+    c2.addr('r2-eth0', '10.0.2.2/24')
+    c2.addr('r2-eth1', '10.0.3.1/24')
+    c2.forwarding()
 
     # Configure Router 3
-    r3.cmd('ifconfig r3-eth0 10.0.3.2/24')
-    r3.cmd('ifconfig r3-eth1 10.0.4.1/24')
-    r3.cmd('sysctl net.ipv4.ip_forward=1')
-    # Route to networks beyond r2
-    r3.cmd('route add -net 10.0.1.0/24 gw 10.0.3.1')
-    r3.cmd('route add -net 10.0.2.0/24 gw 10.0.3.1')
+    c3 = NodeConfig(r3)
+    c3.addr('r3-eth0', '10.0.3.2/24')
+    c3.addr('r3-eth1', '10.0.4.1/24')
+    c3.forwarding()
+
+    # Static routes are compiled from the topology: every router gets a
+    # shortest-path route to each subnet it is not connected to, e.g.
+    # r1 reaches 10.0.3.0/24 and 10.0.4.0/24 via r2 (10.0.2.2)
+    add_routes([c1, c2, c3],
+               compile_routes(net_links(net), net_addresses(net, [c1, c2, c3]),
+                              routers=['r1', 'r2', 'r3']))
+
+    # All three routers are configured concurrently
+    for result in apply_all([c1, c2, c3]):
+        info('%s\n' % result)
 
     info('\n*** Routing Tables:\n')
     info('--- r1 ---\n')
@@ -107,9 +122,9 @@ def configure_and_run():
 
 
     info('*** Testing network connectivity\n')
-    # Ping from h1 to h2 to see if the routing works
-    result = h1.cmd('ping -c 3 %s' % h2.IP())
-    info(result + '\n')
+    # Ping between h1 and h2 (both directions at once) to see if the
+    # routing works
+    info(reachability(net, hosts=[h1, h2], count=3))
 
     info('*** Running CLI\n')
     # Start the Mininet CLI for further interaction
@@ -9,14 +9,29 @@ h1 <--> s1 <--> s2 <--> h2
 
 This setup allows for testing connectivity and routing between two
 separate network segments connected by a switch-to-switch link.
+
+With --proactive no controller is started: the MAC-to-port flows of
+every switch are computed from the topology (hosts get autoSetMacs
+addresses) and installed before any traffic, so no packet waits for a
+packet-in.
 """
 
+import argparse
+import os
+import sys
+from functools import partial
+
 from mininet.topo import Topo
 from mininet.net import Mininet
-from mininet.node import Controller, OVSController
+from mininet.node import Controller, OVSController, OVSSwitch
 from mininet.cli import CLI
 from mininet.log import setLogLevel, info
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'Utils'))
+from reachability import reachability
+from flows import OF_VERSION, proactive_l2
+
 
 class ManagedSwitchTopo(Topo):
     """
@@ -46,11 +61,13 @@ class ManagedSwitchTopo(Topo):
         self.addLink(host2, switch2)
 
 
-def run_topology():
+def run_topology(proactive=False):
     """
     This function creates an instance of the topology,
     starts the Mininet network, runs a simple test,
     and opens the Mininet CLI for user interaction.
+    proactive: install all L2 flows up front instead of running a
+    controller
     """
     # Create an instance of our custom topology
     topo = ManagedSwitchTopo()
@@ -59,16 +76,24 @@ def run_topology():
     # We specify controller=Controller to use Mininet's default
     # controller class. This requires a controller executable
     # (like ovs-controller) to be available in the system's PATH.
-    net = Mininet(topo=topo, controller=OVSController)
+    if proactive:
+        net = Mininet(topo=topo, controller=None, autoSetMacs=True,
+                      switch=partial(OVSSwitch, protocols=OF_VERSION))
+    else:
+        net = Mininet(topo=topo, controller=OVSController)
     #net.addController('c0')
 
     info('*** Starting network\n')
     net.start()
 
+    if proactive:
+        info('*** Installing L2 flows on every switch\n')
+        proactive_l2(net)
+
     info('*** Testing network connectivity\n')
-    # Use pingAll to check if all hosts can reach each other
-    # The output will show the connectivity results and any packet loss.
-    net.pingAll()
+    # Probe all host pairs at once (instead of pingAll's one pair at a
+    # time); the matrix shows every pair's result, loss and RTT.
+    info(reachability(net))
 
     info('*** Running CLI\n')
     # Start the Mininet command-line interface
@@ -81,8 +106,13 @@ def run_topology():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--proactive', action='store_true',
+                        help='preinstall L2 flows instead of running '
+                        'OVSController')
+    args = parser.parse_args()
     # Set the logging level to 'info' to see status messages
     setLogLevel('info')
     # Execute the main function to run the topology
-    run_topology()
+    run_topology(args.proactive)
 
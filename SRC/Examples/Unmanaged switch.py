@@ -9,21 +9,37 @@ h1 <--> s1 <--> s2 <--> h2
 
 This setup allows for testing connectivity and routing between two
 separate network segments connected by a switch-to-switch link.
+--switches N puts N switches in a chain between h1 and h2 instead.
+
+The 'normal' flow of every switch is programmed by flows.program_all():
+all switches at once from a bounded worker pool, one bundle each,
+checked with dump-flows.
 """
 
+import argparse
+import os
+import sys
+from functools import partial
+
 from mininet.topo import Topo
 from mininet.net import Mininet
-from mininet.node import Controller
+from mininet.node import Controller, OVSSwitch
 from mininet.cli import CLI
 from mininet.log import setLogLevel, info
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'Utils'))
+from reachability import reachability
+from flows import OF_VERSION, WORKERS, FlowTable, program_all
+
 
 class UnmanagedSwitchTopo(Topo):
     """
     A simple custom topology of 2 hosts and 2 switches.
     h1 --- s1 --- s2 --- h2
+    (or n switches: h1 --- s1 --- ... --- sn --- h2)
     """
-    def build(self):
+    def build(self, n=2):
         "Create the custom topology."
         info('*** Adding Hosts\n')
         # Add two hosts to the topology
@@ -31,32 +47,34 @@ class UnmanagedSwitchTopo(Topo):
         host2 = self.addHost('h2')
 
         info('*** Adding Switches\n')
-        # Add two switches to the topology
-        switch1 = self.addSwitch('s1')
-        switch2 = self.addSwitch('s2')
+        # Add the switches to the topology
+        switches = [self.addSwitch('s%d' % i) for i in range(1, n + 1)]
 
         info('*** Creating Links\n')
         # Add links between the network components
         # Host 1 is connected to Switch 1
-        self.addLink(host1, switch1)
-        # Switch 1 is connected to Switch 2
-        self.addLink(switch1, switch2)
-        # Host 2 is connected to Switch 2
-        self.addLink(host2, switch2)
+        self.addLink(host1, switches[0])
+        # Each switch is connected to the next one
+        for left, right in zip(switches, switches[1:]):
+            self.addLink(left, right)
+        # Host 2 is connected to the last switch
+        self.addLink(host2, switches[-1])
 
 
-def run_topology():
+def run_topology(switches=2, workers=WORKERS):
     """
     This function creates an instance of the topology,
     starts the Mininet network, runs a simple test,
     and opens the Mininet CLI for user interaction.
     """
     # Create an instance of our custom topology
-    topo = UnmanagedSwitchTopo()
+    topo = UnmanagedSwitchTopo(n=switches)
 
     # Create a Mininet network using the custom topology
-    # A default controller is created automatically.
-    net = Mininet(topo=topo, controller=None)
+    # No controller: the switches get their flows from ovs-ofctl
+    # (OpenFlow 1.4 for bundles)
+    net = Mininet(topo=topo, controller=None,
+                  switch=partial(OVSSwitch, protocols=OF_VERSION))
 
     info('*** Starting network\n')
     net.start()
@@ -65,14 +83,13 @@ def run_topology():
     # We are telling each switch to use the 'normal' action, which enables
     # standard MAC learning and forwarding. (unmanaged switch)
     info('*** Adding L2 switching flow rules to switches\n')
-    for sw in net.switches:
-        sw.cmd('ovs-ofctl add-flow', sw.name, 'action=normal')
-
+    program_all([FlowTable(sw).add('', 'normal', priority=0)
+                 for sw in net.switches], workers)
 
     info('*** Testing network connectivity\n')
-    # Use pingAll to check if all hosts can reach each other
-    # The output will show the connectivity results and any packet loss.
-    net.pingAll()
+    # Probe all host pairs at once (instead of pingAll's one pair at a
+    # time); the matrix shows every pair's result, loss and RTT.
+    info(reachability(net))
 
     info('*** Running CLI\n')
     # Start the Mininet command-line interface
@@ -85,7 +102,13 @@ def run_topology():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--switches', type=int, default=2,
+                        help='switches in the chain between h1 and h2')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='switches programmed at the same time')
+    args = parser.parse_args()
     # Set the logging level to 'info' to see status messages
     setLogLevel('info')
     # Execute the main function to run the topology
-    run_topology()
+    run_topology(args.switches, args.workers)
@@ -1,12 +1,46 @@
 #!/usr/bin/python
+import argparse
+import os
+import sys
+
 from mininet.topo import Topo
 from mininet.net import Mininet
 from mininet.node import OVSController
+from mininet.link import Link, TCLink
 from mininet.cli import CLI
 from mininet.log import setLogLevel, info
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'Utils'))
+from batchconfig import NodeConfig, apply_all
+from failover import protect, stop_agents
+from routecompiler import (add_routes, compile_routes, net_addresses,
+                           net_links)
+from steering import Steering
+
+# Routers and h2 address of each path, by the traffic h1 steers onto it
+PATHS = {'udp': (('r1', 'r2', 'r3'), '10.0.4.2'),
+         'tcp': (('r4', 'r5', 'r6'), '10.0.8.2'),
+         'other': (('r7', 'r8', 'r9'), '10.0.12.2')}
+
+# Path tables/marks by protocol
+MARKS = {'udp': 1, 'tcp': 2, 'other': 3}
+
+# iptables match of each protocol (--steering mark)
+MATCH = {'udp': '-p udp', 'tcp': '-p tcp', 'other': '! -p tcp ! -p udp'}
+
+# ECMP mode: service addresses on h1's and h2's loopbacks, reached over
+# all three paths
+ECMP_SRC = '10.0.200.1'
+ECMP_DST = '10.0.100.2'
+
+# ECMP rules are tried before the protocol rules (priority 1000 on)
+ECMP_PRIORITY = 900
+
 class MultiPathTopo(Topo):
-    def build(self):
+    def build(self, bw=None):
+        # bw (Mbit/s) needs a TCLink network
+        opts = {'bw': bw} if bw else {}
         h1 = self.addHost('h1')
         h2 = self.addHost('h2')
 
@@ -18,79 +52,197 @@ class MultiPathTopo(Topo):
         r7, r8, r9 = [self.addHost(n) for n in ('r7', 'r8', 'r9')]
 
         # Links UDP path
-        self.addLink(h1, r1); self.addLink(r1, r2); self.addLink(r2, r3); self.addLink(r3, h2)
+        self.addLink(h1, r1, **opts); self.addLink(r1, r2, **opts); self.addLink(r2, r3, **opts); self.addLink(r3, h2, **opts)
         # Links TCP path
-        self.addLink(h1, r4); self.addLink(r4, r5); self.addLink(r5, r6); self.addLink(r6, h2)
+        self.addLink(h1, r4, **opts); self.addLink(r4, r5, **opts); self.addLink(r5, r6, **opts); self.addLink(r6, h2, **opts)
         # Links OTHER path
-        self.addLink(h1, r7); self.addLink(r7, r8); self.addLink(r8, r9); self.addLink(r9, h2)
+        self.addLink(h1, r7, **opts); self.addLink(r7, r8, **opts); self.addLink(r8, r9, **opts); self.addLink(r9, h2, **opts)
 
 
-def configure_and_run():
-    topo = MultiPathTopo()
-    net = Mininet(topo=topo, controller=OVSController)
-    net.start()
+def hop_routes(net, cfg, chain, dst):
+    "Route dst along chain (node names), each hop via the next node."
+    for name, nxt in zip(chain, chain[1:]):
+        here, there = net[name].connectionsTo(net[nxt])[0]
+        via = cfg[net[nxt]].addrs[there.name].split('/')[0]
+        cfg[net[name]].route(dst, via=via, dev=here)
 
+
+def configure_ecmp(net, cfg, pin=(), steering='rule'):
+    """Spread h1<->h2 flows between ECMP_SRC and ECMP_DST over all three
+       paths with L4-hashed multipath routes; protocols in pin keep
+       their own path."""
+    h1, h2 = net.get('h1', 'h2')
+    cfg[h1].addr('lo', ECMP_SRC + '/32', flush=False)
+    cfg[h2].addr('lo', ECMP_DST + '/32', flush=False)
+    for routers, _dst in PATHS.values():
+        hop_routes(net, cfg, list(routers) + ['h2'], ECMP_DST + '/32')
+        hop_routes(net, cfg, list(reversed(routers)) + ['h1'],
+                   ECMP_SRC + '/32')
+    first = dict((n, net[routers[0]]) for n, (routers, _) in PATHS.items())
+    last = dict((n, net[routers[-1]]) for n, (routers, _) in PATHS.items())
+    for host, local, remote, ends in ((h1, ECMP_SRC, ECMP_DST, first),
+                                      (h2, ECMP_DST, ECMP_SRC, last)):
+        nexthops = []
+        for name in sorted(PATHS, key=MARKS.get):
+            here, there = host.connectionsTo(ends[name])[0]
+            nexthops.append((cfg[ends[name]].addrs[there.name].split('/')[0],
+                             here))
+        cfg[host].route(remote + '/32', src=local, nexthops=nexthops)
+        # hash on addresses and ports, not just addresses
+        cfg[host].sysctl('net.ipv4.fib_multipath_hash_policy', 1)
+        cfg[host].rp_disable()
+        # pinned protocols to their path's table, the rest to the
+        # multipath route, ahead of h1's protocol steering
+        rules = Steering(cfg[host], base=ECMP_PRIORITY)
+        if steering == 'mark':
+            for name in pin:
+                rules.add(MARKS[name], fwmark=MARKS[name], dst=remote)
+        else:
+            rules.protocols(dict((name, MARKS[name]) for name in pin),
+                            dst=remote)
+        rules.add('main', dst=remote)
+        for name in pin:
+            cfg[host].route(remote + '/32', via=nexthops[MARKS[name] - 1][0],
+                            dev=nexthops[MARKS[name] - 1][1], src=local,
+                            table=MARKS[name])
+
+
+def mark(node, protocols):
+    "Mark node's outgoing packets with the path of their protocol."
+    for name in protocols:
+        node.cmd('iptables -t mangle -A OUTPUT %s -j MARK --set-mark %d'
+                 % (MATCH[name], MARKS[name]))
+
+
+def configure(net, ecmp=False, pin=(), steering='rule'):
+    """Address all nodes, route r1..r9 and steer h1's traffic by protocol,
+       with ipproto policy rules or (steering='mark') iptables marks.
+       With ecmp, traffic between ECMP_SRC and ECMP_DST is spread over all
+       paths instead, except for the protocols in pin."""
     h1, h2 = net.get('h1', 'h2')
     r1, r2, r3 = net.get('r1', 'r2', 'r3')
     r4, r5, r6 = net.get('r4', 'r5', 'r6')
     r7, r8, r9 = net.get('r7', 'r8', 'r9')
 
+    # Settings are collected per node and applied to all nodes at once
+    cfg = dict((n, NodeConfig(n)) for n in
+               [h1, h2, r1, r2, r3, r4, r5, r6, r7, r8, r9])
+
     # --- Configure IPs ---
     # UDP path
-    r1.setIP('10.0.1.1/24', intf='r1-eth0'); r1.setIP('10.0.2.1/24', intf='r1-eth1')
-    r2.setIP('10.0.2.2/24', intf='r2-eth0'); r2.setIP('10.0.3.1/24', intf='r2-eth1')
-    r3.setIP('10.0.3.2/24', intf='r3-eth0'); r3.setIP('10.0.4.1/24', intf='r3-eth1')
-    h1.setIP('10.0.1.100/24', intf='h1-eth0'); h2.setIP('10.0.4.2/24', intf='h2-eth0')
+    cfg[r1].addr('r1-eth0', '10.0.1.1/24'); cfg[r1].addr('r1-eth1', '10.0.2.1/24')
+    cfg[r2].addr('r2-eth0', '10.0.2.2/24'); cfg[r2].addr('r2-eth1', '10.0.3.1/24')
+    cfg[r3].addr('r3-eth0', '10.0.3.2/24'); cfg[r3].addr('r3-eth1', '10.0.4.1/24')
+    cfg[h1].addr('h1-eth0', '10.0.1.100/24'); cfg[h2].addr('h2-eth0', '10.0.4.2/24')
 
     # TCP path
-    r4.setIP('10.0.5.1/24', intf='r4-eth0'); r4.setIP('10.0.6.1/24', intf='r4-eth1')
-    r5.setIP('10.0.6.2/24', intf='r5-eth0'); r5.setIP('10.0.7.1/24', intf='r5-eth1')
-    r6.setIP('10.0.7.2/24', intf='r6-eth0'); r6.setIP('10.0.8.1/24', intf='r6-eth1')
-    h1.setIP('10.0.5.100/24', intf='h1-eth1'); h2.setIP('10.0.8.2/24', intf='h2-eth1')
+    cfg[r4].addr('r4-eth0', '10.0.5.1/24'); cfg[r4].addr('r4-eth1', '10.0.6.1/24')
+    cfg[r5].addr('r5-eth0', '10.0.6.2/24'); cfg[r5].addr('r5-eth1', '10.0.7.1/24')
+    cfg[r6].addr('r6-eth0', '10.0.7.2/24'); cfg[r6].addr('r6-eth1', '10.0.8.1/24')
+    cfg[h1].addr('h1-eth1', '10.0.5.100/24'); cfg[h2].addr('h2-eth1', '10.0.8.2/24')
 
     # OTHER path
-    r7.setIP('10.0.9.1/24', intf='r7-eth0'); r7.setIP('10.0.10.1/24', intf='r7-eth1')
-    r8.setIP('10.0.10.2/24', intf='r8-eth0'); r8.setIP('10.0.11.1/24', intf='r8-eth1')
-    r9.setIP('10.0.11.2/24', intf='r9-eth0'); r9.setIP('10.0.12.1/24', intf='r9-eth1')
-    h1.setIP('10.0.9.100/24', intf='h1-eth2'); h2.setIP('10.0.12.2/24', intf='h2-eth2')
+    cfg[r7].addr('r7-eth0', '10.0.9.1/24'); cfg[r7].addr('r7-eth1', '10.0.10.1/24')
+    cfg[r8].addr('r8-eth0', '10.0.10.2/24'); cfg[r8].addr('r8-eth1', '10.0.11.1/24')
+    cfg[r9].addr('r9-eth0', '10.0.11.2/24'); cfg[r9].addr('r9-eth1', '10.0.12.1/24')
+    cfg[h1].addr('h1-eth2', '10.0.9.100/24'); cfg[h2].addr('h2-eth2', '10.0.12.2/24')
 
     # Enable forwarding
     for r in [r1, r2, r3, r4, r5, r6, r7, r8, r9]:
-        r.cmd('sysctl -w net.ipv4.ip_forward=1')
-
-    # --- Configure h1 policy routing ---
-    h1.cmd('ip rule add fwmark 1 table 1')
-    h1.cmd('ip rule add fwmark 2 table 2')
-    h1.cmd('ip rule add fwmark 3 table 3')
+        cfg[r].forwarding()
 
-    h1.cmd('ip route add default via 10.0.1.1 dev h1-eth0 table 1')
-    h1.cmd('ip route add default via 10.0.5.1 dev h1-eth1 table 2')
-    h1.cmd('ip route add default via 10.0.9.1 dev h1-eth2 table 3')
+    # Routes on r1..r9 to every subnet, compiled from the topology
+    # (h1 and h2 are never used for transit)
+    routers = ['r%d' % i for i in range(1, 10)]
+    add_routes(cfg.values(), compile_routes(
+        net_links(net), net_addresses(net, cfg.values()), routers))
 
-    # Mark packets by protocol
-    h1.cmd('iptables -t mangle -A OUTPUT -p udp -j MARK --set-mark 1')
-    h1.cmd('iptables -t mangle -A OUTPUT -p tcp -j MARK --set-mark 2')
-    h1.cmd('iptables -t mangle -A OUTPUT ! -p tcp ! -p udp -j MARK --set-mark 3')
+    # --- Configure h1 policy routing ---
+    # Each protocol looks up the table of its path
+    steer = Steering(cfg[h1])
+    if steering == 'mark':
+        for name in sorted(MARKS, key=MARKS.get):
+            steer.add(MARKS[name], fwmark=MARKS[name])
+        # Sockets route before their packets are marked, so unmarked
+        # lookups need a route too (their source address is h1-eth2's)
+        cfg[h1].route('default', via='10.0.9.1', dev='h1-eth2')
+    else:
+        steer.protocols(MARKS)
+
+    cfg[h1].route('default', via='10.0.1.1', dev='h1-eth0', table=1)
+    cfg[h1].route('default', via='10.0.5.1', dev='h1-eth1', table=2)
+    cfg[h1].route('default', via='10.0.9.1', dev='h1-eth2', table=3)
 
     # --- Configure h2 return routing ---
     # Create rules like h1 but reversed
-    h2.cmd('ip rule add from 10.0.4.2 table 1')
-    h2.cmd('ip rule add from 10.0.8.2 table 2')
-    h2.cmd('ip rule add from 10.0.12.2 table 3')
+    cfg[h2].rule('from 10.0.4.2', table=1)
+    cfg[h2].rule('from 10.0.8.2', table=2)
+    cfg[h2].rule('from 10.0.12.2', table=3)
 
-    h2.cmd('ip route add default via 10.0.3.2 dev h2-eth0 table 1')
-    h2.cmd('ip route add default via 10.0.7.2 dev h2-eth1 table 2')
-    h2.cmd('ip route add default via 10.0.11.2 dev h2-eth2 table 3')
+    cfg[h2].route('default', via='10.0.4.1', dev='h2-eth0', table=1)
+    cfg[h2].route('default', via='10.0.8.1', dev='h2-eth1', table=2)
+    cfg[h2].route('default', via='10.0.12.1', dev='h2-eth2', table=3)
+
+    if ecmp:
+        configure_ecmp(net, cfg, pin, steering)
+
+    apply_all(cfg.values())
+
+    # Mark packets by protocol
+    if steering == 'mark':
+        mark(h1, sorted(MARKS, key=MARKS.get))
+        if ecmp:
+            mark(h2, pin)
+
+
+def configure_failover(net, **opts):
+    """Back up every path with the other two: keepalive agents on h1 and
+       h2 move a path's table onto a live path when it fails (see
+       SRC/Utils/failover.py). Returns the agents, for stop_agents()."""
+    return protect(net, [(['h1'] + list(PATHS[name][0]) + ['h2'],
+                          MARKS[name])
+                         for name in sorted(MARKS, key=MARKS.get)], **opts)
+
+
+def configure_and_run(ecmp=False, pin=(), bw=None, steering='rule',
+                      failover=False):
+    topo = MultiPathTopo(bw=bw)
+    net = Mininet(topo=topo, controller=OVSController,
+                  link=TCLink if bw else Link)
+    net.start()
+    configure(net, ecmp, pin, steering)
+    agents = configure_failover(net) if failover else {}
 
+    h1 = net['h1']
     info('*** Testing connectivity\n')
     info(h1.cmd('ping -c 2 10.0.4.2'))   # UDP path
     info(h1.cmd('ping -c 2 10.0.8.2'))   # TCP path
     info(h1.cmd('ping -c 2 10.0.12.2'))  # OTHER path
+    if ecmp:
+        info(h1.cmd('ping -c 2 -I %s %s' % (ECMP_SRC, ECMP_DST)))
 
     CLI(net)
+    stop_agents(agents)
     net.stop()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ecmp', action='store_true',
+                        help='spread %s -> %s flows over all paths'
+                        % (ECMP_SRC, ECMP_DST))
+    parser.add_argument('--pin', default='',
+                        help='with --ecmp, protocols that keep their path '
+                        '(comma separated: udp,tcp,other)')
+    parser.add_argument('--bw', type=float, help='link bandwidth in Mbit/s')
+    parser.add_argument('--steering', choices=['rule', 'mark'],
+                        default='rule',
+                        help='match protocols in ip rules (ipproto) or '
+                        'with iptables marks (fwmark)')
+    parser.add_argument('--failover', action='store_true',
+                        help='reroute a failed path\'s traffic over the '
+                        'others (keepalives between h1 and h2)')
+    args = parser.parse_args()
     setLogLevel('info')
-    configure_and_run()
+    configure_and_run(args.ecmp, [p for p in args.pin.split(',') if p],
+                      args.bw, args.steering, args.failover)
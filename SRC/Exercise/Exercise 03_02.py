@@ -1,12 +1,167 @@
+import argparse
+import os
+import sys
+from functools import partial
+
 from mininet.net import Mininet
-from mininet.node import Controller, OVSSwitch, Host
+from mininet.node import OVSSwitch, Host
 from mininet.cli import CLI
 from mininet.log import setLogLevel
 import time
 
-def setup_network():
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'Utils'))
+from batchconfig import NodeConfig, apply_all
+from routecompiler import (add_routes, compile_routes, net_addresses,
+                           net_links)
+from steering import Steering
+from flows import (OF_VERSION, FlowTable, install_all, mac,
+                   path_flows)
+
+# Routers of each path, by the traffic h1 steers onto it, and the
+# gateway addresses h1 and h2 use at its two ends
+PATHS = {'udp': (('r1', 'r2', 'r3'), '10.1.1.1', '10.1.4.1'),
+         'tcp': (('r4', 'r5', 'r6'), '10.2.1.1', '10.2.4.1'),
+         'other': (('r7', 'r8', 'r9'), '10.3.1.1', '10.3.4.1')}
+
+# Policy routing table of each path on h1 and h2
+TABLES = {'udp': 1, 'tcp': 2, 'other': 3}
+
+H1_NET = '10.0.0.0/24'
+H2_NET = '10.0.1.0/24'
+
+def path_routes(net, cfg, chain, dst):
+    "Route dst along chain (node names), each hop via the next node."
+    for name, nxt in zip(chain, chain[1:]):
+        here, there = net[name].connectionsTo(net[nxt])[0]
+        via = cfg[net[nxt]].addrs[there.name].split('/')[0]
+        cfg[net[name]].route(dst, via=via, dev=here)
+
+def configure_routers(net):
+    """Address r1..r9 and route them like IP routers, the default mode
+       (r1..r9 are namespaced hosts here, see setup_network())."""
+    h1, h2 = net.get('h1', 'h2')
+    r1, r2, r3 = net.get('r1', 'r2', 'r3')
+    r4, r5, r6 = net.get('r4', 'r5', 'r6')
+    r7, r8, r9 = net.get('r7', 'r8', 'r9')
+
+    # Every node's settings are collected and applied in one batch
+    cfg = dict((n, NodeConfig(n)) for n in
+               [h1, h2, r1, r2, r3, r4, r5, r6, r7, r8, r9])
+
+    # Assign IP addresses to router interfaces
+    # (ri-eth0 faces h1's side, ri-eth1 h2's)
+    # Path 1
+    cfg[r1].addr('r1-eth0', '10.1.1.1/24')
+    cfg[r1].addr('r1-eth1', '10.1.2.1/24')
+    cfg[r2].addr('r2-eth0', '10.1.2.2/24')
+    cfg[r2].addr('r2-eth1', '10.1.3.1/24')
+    cfg[r3].addr('r3-eth0', '10.1.3.2/24')
+    cfg[r3].addr('r3-eth1', '10.1.4.1/24')
+    cfg[h1].addr('h1-eth0', '10.1.1.100/24')
+    cfg[h2].addr('h2-eth0', '10.1.4.100/24')
+
+    # Path 2
+    cfg[r4].addr('r4-eth0', '10.2.1.1/24')
+    cfg[r4].addr('r4-eth1', '10.2.2.1/24')
+    cfg[r5].addr('r5-eth0', '10.2.2.2/24')
+    cfg[r5].addr('r5-eth1', '10.2.3.1/24')
+    cfg[r6].addr('r6-eth0', '10.2.3.2/24')
+    cfg[r6].addr('r6-eth1', '10.2.4.1/24')
+    cfg[h1].addr('h1-eth1', '10.2.1.100/24')
+    cfg[h2].addr('h2-eth1', '10.2.4.100/24')
+
+    # Path 3
+    cfg[r7].addr('r7-eth0', '10.3.1.1/24')
+    cfg[r7].addr('r7-eth1', '10.3.2.1/24')
+    cfg[r8].addr('r8-eth0', '10.3.2.2/24')
+    cfg[r8].addr('r8-eth1', '10.3.3.1/24')
+    cfg[r9].addr('r9-eth0', '10.3.3.2/24')
+    cfg[r9].addr('r9-eth1', '10.3.4.1/24')
+    cfg[h1].addr('h1-eth2', '10.3.1.100/24')
+    cfg[h2].addr('h2-eth2', '10.3.4.100/24')
+
+    # h1 and h2 keep their own addresses (10.0.0.1, 10.0.1.2) on lo,
+    # reachable over every path
+    cfg[h1].addr('lo', '10.0.0.1/32', flush=False)
+    cfg[h2].addr('lo', '10.0.1.2/32', flush=False)
+
+    # Enable IP forwarding on routers
+    for router in [r1, r2, r3, r4, r5, r6, r7, r8, r9]:
+        cfg[router].forwarding()
+
+    # Configure routing tables on routers
+    # Routes between the path subnets are compiled from the links and
+    # addresses (shortest path, hosts never used for transit). The
+    # hand-written set pointed r3, r6 and r9 at gateways that are not
+    # directly connected (e.g. r3 via 10.1.2.1) and had no return routes
+    # on r1/r2, r4/r5 or r7/r8.
+    routers = ['r%d' % i for i in range(1, 10)]
+    add_routes(cfg.values(), compile_routes(
+        net_links(net), net_addresses(net, cfg.values()), routers))
+    # and each path's routers carry h1's and h2's subnets
+    for path, _gw1, _gw2 in PATHS.values():
+        path_routes(net, cfg, list(path) + ['h2'], H2_NET)
+        path_routes(net, cfg, list(reversed(path)) + ['h1'], H1_NET)
+
+    # Configure routing tables on h1 and h2 for protocol-based routing:
+    # UDP via r1-r2-r3, TCP via r4-r5-r6, other traffic via r7-r8-r9,
+    # in both directions
+    for host, src, dst, side in ((h1, '10.0.0.1', H2_NET, 1),
+                                 (h2, '10.0.1.2', H1_NET, 2)):
+        Steering(cfg[host]).protocols(TABLES)
+        for name, hops in PATHS.items():
+            end = net[hops[0][0] if side == 1 else hops[0][-1]]
+            here = host.connectionsTo(end)[0][0]
+            cfg[host].route(dst, via=hops[side], dev=here, src=src,
+                            table=TABLES[name])
+        # replies may arrive on another interface than the address's
+        cfg[host].rp_disable()
+
+    # Default route for h1 (optional, for unrouted traffic)
+    cfg[h1].route('default', via='10.3.1.1', dev='h1-eth2')
+
+    # Configure all nodes concurrently
+    apply_all(cfg.values())
+
+def configure_flows(net):
+    """Compile the path policy into OpenFlow flows instead: the switches
+       of each path forward its protocol (any protocol on the 'other'
+       path) to h2's subnet and back to h1's, rewriting MACs and
+       decrementing the TTL like a router. h1 and h2 steer by protocol
+       and reach the end switches as gateways with static ARP entries,
+       so no packet ever goes to a controller."""
+    h1, h2 = net.get('h1', 'h2')
+    cfg = dict((n, NodeConfig(n)) for n in (h1, h2))
+    tables = dict((s, FlowTable(s)) for s in net.switches)
+    for name, (routers, gw1, gw2) in PATHS.items():
+        proto = None if name == 'other' else name
+        chain = ['h1'] + list(routers) + ['h2']
+        path_flows(net, tables, chain, H2_NET, proto)
+        path_flows(net, tables, chain[::-1], H1_NET, proto)
+        for host, gw, end, dst in ((h1, gw1, routers[0], H2_NET),
+                                   (h2, gw2, routers[-1], H1_NET)):
+            here, there = host.connectionsTo(net[end])[0]
+            cfg[host].ip('neigh replace %s lladdr %s dev %s nud permanent'
+                         % (gw, mac(there), here))
+            cfg[host].route(dst, via=gw, dev=here, onlink=True,
+                            table=TABLES[name])
+    for host in (h1, h2):
+        Steering(cfg[host]).protocols(TABLES)
+        # replies may arrive on another interface than the address's
+        cfg[host].rp_disable()
+    apply_all(cfg.values())
+    install_all(tables.values())
+
+def setup_network(proactive=False):
     # Create Mininet object
-    net = Mininet(controller=Controller, switch=OVSSwitch)
+    if proactive:
+        # No controller: every flow is installed before traffic starts
+        net = Mininet(controller=None,
+                      switch=partial(OVSSwitch, protocols=OF_VERSION))
+    else:
+        # The routers are hosts: no switch, so no controller either
+        net = Mininet(controller=None)
 
     # Add controller
     #c0 = net.addController('c0')
@@ -15,16 +170,22 @@ def setup_network():
     h1 = net.addHost('h1', ip='10.0.0.1/24')
     h2 = net.addHost('h2', ip='10.0.1.2/24')
 
-    # Add routers (using switches with IP forwarding)
-    r1 = net.addSwitch('r1')
-    r2 = net.addSwitch('r2')
-    r3 = net.addSwitch('r3')
-    r4 = net.addSwitch('r4')
-    r5 = net.addSwitch('r5')
-    r6 = net.addSwitch('r6')
-    r7 = net.addSwitch('r7')
-    r8 = net.addSwitch('r8')
-    r9 = net.addSwitch('r9')
+    # Add routers: OVS switches programmed with flows in proactive mode,
+    # otherwise hosts with their own namespace and routing table that
+    # forward like IP routers (ip=None: no automatic 10.0.0.x address)
+    if proactive:
+        addRouter = net.addSwitch
+    else:
+        addRouter = partial(net.addHost, ip=None)
+    r1 = addRouter('r1')
+    r2 = addRouter('r2')
+    r3 = addRouter('r3')
+    r4 = addRouter('r4')
+    r5 = addRouter('r5')
+    r6 = addRouter('r6')
+    r7 = addRouter('r7')
+    r8 = addRouter('r8')
+    r9 = addRouter('r9')
 
     # Create links
     # Path 1: h1 -> r1 -> r2 -> r3 -> h2
@@ -48,71 +209,10 @@ def setup_network():
     # Start the network
     net.start()
 
-    # Assign IP addresses to router interfaces
-    # Path 1
-    r1.cmd('ifconfig r1-eth0 10.1.1.1/24')
-    r1.cmd('ifconfig r1-eth1 10.1.2.1/24')
-    r2.cmd('ifconfig r2-eth0 10.1.2.2/24')
-    r2.cmd('ifconfig r2-eth1 10.1.3.1/24')
-    r3.cmd('ifconfig r3-eth0 10.1.3.2/24')
-    r3.cmd('ifconfig r3-eth1 10.1.4.1/24')
-
-    # Path 2
-    r4.cmd('ifconfig r4-eth0 10.2.1.1/24')
-    r4.cmd('ifconfig r4-eth1 10.2.2.1/24')
-    r5.cmd('ifconfig r5-eth0 10.2.2.2/24')
-    r5.cmd('ifconfig r5-eth1 10.2.3.1/24')
-    r6.cmd('ifconfig r6-eth0 10.2.3.2/24')
-    r6.cmd('ifconfig r6-eth1 10.2.4.1/24')
-
-    # Path 3
-    r7.cmd('ifconfig r7-eth0 10.3.1.1/24')
-    r7.cmd('ifconfig r7-eth1 10.3.2.1/24')
-    r8.cmd('ifconfig r8-eth0 10.3.2.2/24')
-    r8.cmd('ifconfig r8-eth1 10.3.3.1/24')
-    r9.cmd('ifconfig r9-eth0 10.3.3.2/24')
-    r9.cmd('ifconfig r9-eth1 10.3.4.1/24')
-
-    # Enable IP forwarding on routers
-    for router in [r1, r2, r3, r4, r5, r6, r7, r8, r9]:
-        router.cmd('sysctl -w net.ipv4.ip_forward=1')
-
-    # Configure routing tables on h1 for protocol-based routing
-    # UDP via r1-r2-r3
-    h1.cmd('ip rule add ipproto udp table 1')
-    h1.cmd('ip route add 10.0.1.0/24 via 10.1.1.1 dev h1-eth0 table 1')
-
-    # TCP via r4-r5-r6
-    h1.cmd('ip rule add ipproto tcp table 2')
-    h1.cmd('ip route add 10.0.1.0/24 via 10.2.1.1 dev h1-eth1 table 2')
-
-    # Other traffic via r7-r8-r9
-    h1.cmd('ip rule add table 3')
-    h1.cmd('ip route add 10.0.1.0/24 via 10.3.1.1 dev h1-eth2 table 3')
-
-    # Default route for h1 (optional, for unrouted traffic)
-    h1.cmd('ip route add default via 10.3.1.1')
-
-    # Configure routing tables on h2
-    h2.cmd('ip route add 10.0.0.0/24 via 10.1.4.1')  # For UDP
-    h2.cmd('ip route add 10.0.0.0/24 via 10.2.4.1')  # For TCP
-    h2.cmd('ip route add 10.0.0.0/24 via 10.3.4.1')  # For other
-
-    # Configure routing tables on routers
-    # Path 1: r1 -> r2 -> r3
-    r1.cmd('ip route add 10.0.1.0/24 via 10.1.2.2')
-    r2.cmd('ip route add 10.0.1.0/24 via 10.1.3.2')
-    r3.cmd('ip route add 10.0.0.0/24 via 10.1.2.1')
-
-    # Path 2: r4 -> r5 -> r6
-    r4.cmd('ip route add 10.0.1.0/24 via 10.2.2.2')
-    r5.cmd('ip route add 10.0.1.0/24 via 10.2.3.2')
-    r6.cmd('ip route add 10.0.0.0/24 via 10.2.2.1')
-
-    # Path 3: r7 -> r8 -> r9
-    r7.cmd('ip route add 10.0.1.0/24 via 10.3.2.2')
-    r8.cmd('ip route add 10.0.1.0/24 via 10.3.3.2')
-    r9.cmd('ip route add 10.0.0.0/24 via 10.3.2.1')
+    if proactive:
+        configure_flows(net)
+    else:
+        configure_routers(net)
 
     # Start CLI for manual testing
     CLI(net)
@@ -121,5 +221,10 @@ def setup_network():
     net.stop()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--proactive', action='store_true',
+                        help='forward with preinstalled OpenFlow flows '
+                        'instead of a controller')
+    args = parser.parse_args()
     setLogLevel('info')
-    setup_network()
\ No newline at end of file
+    setup_network(args.proactive)
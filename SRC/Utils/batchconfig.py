@@ -0,0 +1,244 @@
+"""
+Batched per-node configuration for Mininet routers
+
+The lab scripts used to configure every router with one node.cmd() per
+ifconfig, sysctl and route command. Each of those is a blocking round
+trip through the node's shell, so setup time grows with the number of
+routers and routes.
+
+NodeConfig collects the addresses, routes, policy rules and sysctls of
+one node and applies them in a single exchange: the ip commands are
+written to an `ip -batch` file and the sysctls to one `sysctl -p` file
+(Mininet nodes share the root filesystem), and both are run by one
+node.cmd(). Failures are reported per command.
+
+    cfg = NodeConfig(r1)
+    cfg.addr('r1-eth0', '10.0.1.1/24')
+    cfg.forwarding()
+    cfg.route('10.0.3.0/24', via='10.0.2.2')
+    result = cfg.apply()
+
+apply_all() applies the configs of many nodes concurrently (see
+parallel.pcmd), so start-to-ready time stays flat as routers are added.
+"""
+
+import os
+import re
+import tempfile
+from collections import namedtuple
+
+from mininet.log import error
+
+from parallel import pcmd
+
+# Marker echoed between the ip and sysctl sections of the output
+SYSCTL_MARKER = '@@sysctl@@'
+
+# One failed command and the error text ip/sysctl printed for it
+Failure = namedtuple('Failure', 'command message')
+
+
+class ConfigResult(object):
+    "Outcome of applying one NodeConfig."
+
+    def __init__(self, node, commands, failures, output=''):
+        self.node = node
+        self.commands = commands
+        self.failures = failures
+        self.output = output
+
+    @property
+    def ok(self):
+        return not self.failures
+
+    def __str__(self):
+        if self.ok:
+            return '%s: %d commands ok' % (self.node, self.commands)
+        return '%s: %d of %d commands failed' % (
+            self.node, len(self.failures), self.commands)
+
+
+class NodeConfig(object):
+    "Addresses, routes, rules and sysctls for one node, applied in one batch."
+
+    def __init__(self, node):
+        self.node = node
+        self.ipcmds = []
+        self.sysctls = []
+        self.addrs = {}
+        self.files = []
+
+    def _intfname(self, intf):
+        return intf if isinstance(intf, str) else intf.name
+
+    def ip(self, line):
+        "Add a raw `ip -batch` line, e.g. 'neigh add ...'."
+        self.ipcmds.append(line)
+        return self
+
+    def addr(self, intf, ip, flush=True):
+        """Set ip (a.b.c.d/len) on intf, replacing any existing address
+           like ifconfig does unless flush is False."""
+        name = self._intfname(intf)
+        if flush and name not in self.addrs:
+            self.ip('addr flush dev %s' % name)
+        self.ip('addr add %s dev %s' % (ip, name))
+        self.ip('link set dev %s up' % name)
+        self.addrs.setdefault(name, ip)
+        return self
+
+    def route(self, dst, via=None, dev=None, table=None, metric=None,
+              onlink=False, replace=False, src=None, nexthops=(),
+              proto=None):
+        """Add a route to dst ('default' or a.b.c.d/len). nexthops makes
+           it a multipath route over (via, dev[, weight]) tuples; proto
+           tags it, so `route flush proto N` removes the whole set."""
+        line = '%s %s' % ('route replace' if replace else 'route add', dst)
+        if via:
+            line += ' via %s' % via
+        if dev:
+            line += ' dev %s' % self._intfname(dev)
+        if onlink:
+            line += ' onlink'
+        if src:
+            line += ' src %s' % src
+        if metric is not None:
+            line += ' metric %s' % metric
+        if table is not None:
+            line += ' table %s' % table
+        if proto is not None:
+            line += ' proto %s' % proto
+        for nh in nexthops:
+            line += ' nexthop via %s dev %s' % (nh[0], self._intfname(nh[1]))
+            if len(nh) > 2:
+                line += ' weight %s' % nh[2]
+        return self.ip(line)
+
+    def rule(self, selector='', table=None, priority=None):
+        "Add a policy rule, e.g. rule('fwmark 1', table=1)."
+        line = 'rule add'
+        if priority is not None:
+            line += ' priority %s' % priority
+        if selector:
+            line += ' ' + selector
+        if table is not None:
+            line += ' lookup %s' % table
+        return self.ip(line)
+
+    def sysctl(self, key, value):
+        self.sysctls.append((key, str(value)))
+        return self
+
+    def forwarding(self, enable=True):
+        "Enable IPv4 forwarding."
+        return self.sysctl('net.ipv4.ip_forward', int(enable))
+
+    def rp_disable(self):
+        """Disable reverse path filtering on every interface; some of
+           the examples forward packets with no reverse path."""
+        for name in ['all', 'default'] + self.node.intfNames():
+            if name != 'lo':
+                self.sysctl('net.ipv4.conf.%s.rp_filter' % name, 0)
+        return self
+
+    def __len__(self):
+        return len(self.ipcmds) + len(self.sysctls)
+
+    def _write(self, suffix, lines):
+        fd, path = tempfile.mkstemp(
+            prefix='mn-%s-' % self.node.name, suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(''.join(line + '\n' for line in lines))
+        self.files.append(path)
+        return path
+
+    def script(self):
+        """Write the batch files and return the single shell command
+           that applies them (and removes them afterwards)."""
+        parts, files = [], []
+        if self.ipcmds:
+            path = self._write('.ip', self.ipcmds)
+            parts.append('ip -force -batch %s 2>&1' % path)
+            files.append(path)
+        if self.sysctls:
+            path = self._write('.conf', ['%s = %s' % kv
+                                         for kv in self.sysctls])
+            parts.append('echo %s' % SYSCTL_MARKER)
+            parts.append('sysctl -q -p %s 2>&1' % path)
+            files.append(path)
+        if files:
+            parts.append('rm -f ' + ' '.join(files))
+        return '; '.join(parts)
+
+    def parse(self, output):
+        "Turn the output of script() into a ConfigResult."
+        failures = []
+        ipout, _, sysout = output.partition(SYSCTL_MARKER)
+        pending = []
+        for line in ipout.splitlines():
+            line = line.strip()
+            m = re.match(r'Command failed .*:(\d+)$', line)
+            if m:
+                cmd = self.ipcmds[int(m.group(1)) - 1]
+                failures.append(Failure(cmd, ' '.join(pending)))
+                pending = []
+            elif line:
+                pending.append(line)
+        keys = dict(self.sysctls)
+        for line in sysout.splitlines():
+            line = line.strip()
+            if not line.startswith('sysctl:'):
+                continue
+            m = (re.search(r'/proc/sys/(\S+?):', line) or
+                 re.search(r'key ["\']?([\w.\-]+)', line))
+            key = m.group(1).replace('/', '.') if m else None
+            cmd = ('sysctl %s=%s' % (key, keys[key]) if key in keys
+                   else 'sysctl')
+            failures.append(Failure(cmd, line))
+        self._sync_intfs(failures)
+        result = ConfigResult(self.node.name, len(self), failures, output)
+        for f in failures:
+            error('*** %s: %s failed: %s\n' % (self.node.name, f.command,
+                                                f.message))
+        return result
+
+    def _sync_intfs(self, failures):
+        "Keep Mininet's view of interface addresses in step."
+        failed = set(f.command for f in failures)
+        for name, ip in self.addrs.items():
+            if 'addr add %s dev %s' % (ip, name) in failed:
+                continue
+            intf = self.node.nameToIntf.get(name)
+            if intf is not None:
+                intf.ip, prefix = ip.split('/')
+                intf.prefixLen = int(prefix)
+
+    def apply(self):
+        "Apply the whole batch with one node.cmd()."
+        if not len(self):
+            return ConfigResult(self.node.name, 0, [])
+        return self.parse(self.node.cmd(self.script()))
+
+
+def apply_all(configs, timeout=30):
+    """Apply configs on all of their nodes at once.
+       Returns a ConfigResult per config, in the order given."""
+    configs = list(configs)
+    todo = dict((cfg.node, cfg) for cfg in configs if len(cfg))
+    results = {}
+    for res in pcmd([(cfg.node, cfg.script()) for cfg in todo.values()],
+                    timeout):
+        cfg = todo[res.node]
+        if res.timedout:
+            error('*** %s: configuration timed out\n' % res.node)
+            for path in cfg.files:
+                if os.path.exists(path):
+                    os.remove(path)
+            results[res.node] = ConfigResult(
+                res.node.name, len(cfg),
+                [Failure('(batch)', 'timed out after %.1fs' % res.elapsed)],
+                res.output)
+        else:
+            results[res.node] = cfg.parse(res.output)
+    return [results.get(cfg.node) or ConfigResult(cfg.node.name, 0, [])
+            for cfg in configs]
@@ -0,0 +1,91 @@
+"""
+Small helpers shared by the scripts in SRC/Benchmarks
+
+Stopwatch times named phases, load_script() imports one of the lab
+scripts by path (their file names contain spaces), and write_results()
+saves a benchmark run as JSON together with a description of the
+machine, so runs from different hosts and commits can be compared.
+columnar() turns result rows into one list per column, which is much
+smaller for long sweeps.
+"""
+
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import time
+
+
+class Stopwatch(object):
+    "Record the duration of named phases: with sw('start'): ..."
+
+    def __init__(self):
+        self.times = {}
+
+    def __call__(self, name):
+        return _Phase(self, name)
+
+
+class _Phase(object):
+
+    def __init__(self, watch, name):
+        self.watch, self.name = watch, name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *_exc):
+        self.watch.times[self.name] = time.time() - self.start
+
+
+def load_script(path, name=None):
+    """Import the lab script at path (relative to SRC/) as a module
+       without running its __main__ block."""
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    path = os.path.join(src, path)
+    name = name or os.path.splitext(os.path.basename(path))[0].replace(
+        ' ', '_')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def machine():
+    "Description of the host a benchmark ran on."
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'hostname': platform.node(),
+            'kernel': platform.release(),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'commit': commit}
+
+
+def columnar(rows):
+    """Rows (dicts) as one list per column: {'columns': [names], 'rows':
+       n, 'data': {name: [value per row]}}; missing values are None."""
+    names = sorted(set(k for row in rows for k in row))
+    return {'columns': names, 'rows': len(rows),
+            'data': dict((k, [row.get(k) for row in rows]) for k in names)}
+
+
+def write_results(path, benchmark, params, results, indent=2):
+    """Save results (a list of dicts, or columnar()) with params and
+       machine info as JSON; indent=None writes it on one line."""
+    doc = {'benchmark': benchmark,
+           'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+           'machine': machine(),
+           'params': params,
+           'results': results}
+    with open(path, 'w') as f:
+        json.dump(doc, f, indent=indent, sort_keys=True)
+        f.write('\n')
+    return doc
@@ -0,0 +1,277 @@
+#!/usr/bin/python3
+"""
+Fast reroute between parallel paths with a BFD-like UDP keepalive
+
+MultiPathTopo has three disjoint paths between h1 and h2, and each host
+sends the traffic of one class through one path table (table 1, 2, 3).
+With only static routes a failed router or link on a path blackholes
+that traffic until it is repaired. Link state alone cannot help: a host
+only sees its own link, not r5 going down two hops away.
+
+An agent on each end host instead sends a small UDP keepalive over every
+path every --interval seconds and declares a path down when nothing has
+arrived over it for --multiplier intervals (BFD's asynchronous mode;
+30 ms with the defaults). It then points the path's table at the first
+path still up, with one `ip route replace`, and back when keepalives
+return. Keepalives themselves always take their own path: a policy rule
+sends packets from the host's path address to KEEPALIVE_PORT through a
+table of their own that is never rerouted.
+
+For rerouted traffic to get through, the routers of each path need
+routes to the other paths' end-host subnets. protect() precomputes and
+installs those backup routes on all routers, so a failover only changes
+the two hosts' tables:
+
+    agents = protect(net, [(['h1', 'r1', 'r2', 'r3', 'h2'], 1),
+                           (['h1', 'r4', 'r5', 'r6', 'h2'], 2),
+                           (['h1', 'r7', 'r8', 'r9', 'h2'], 3)])
+    ...
+    events = stop_agents(agents)
+
+Each agent prints one JSON line per event (path down/up, route change)
+with a timestamp; stop_agents() returns them per host.
+"""
+
+import argparse
+import ipaddress
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+from batchconfig import NodeConfig, apply_all
+
+# UDP port of the keepalives on every path
+KEEPALIVE_PORT = 3784
+
+# Keepalive tables are KEEPALIVE_TABLE + path index; their rules come
+# before any steering rule
+KEEPALIVE_TABLE = 100
+KEEPALIVE_PRIORITY = 500
+
+# seconds between keepalives, and keepalives missed before a path is down
+INTERVAL = 0.01
+MULTIPLIER = 3
+
+# seconds between attempts to repoint a table after `ip route` failed
+RETRY = 0.1
+
+AGENT = os.path.abspath(__file__)
+
+# Keepalive payload: sender's path index and sequence number
+PACKET = struct.Struct('!II')
+
+
+def emit(doc):
+    doc['time'] = time.time()
+    sys.stdout.write(json.dumps(doc, sort_keys=True) + '\n')
+    sys.stdout.flush()
+
+
+def ip(*args):
+    "Run one ip command; returns its exit status."
+    return subprocess.call(('ip',) + args)
+
+
+class Agent(object):
+    """Keepalive sessions over each path of one host, and the path
+       tables they keep pointed at live paths."""
+
+    def __init__(self, paths, interval=INTERVAL, multiplier=MULTIPLIER):
+        # paths: dicts with name, table, local, peer, gw, dev, in order
+        # of preference for backup
+        self.paths = paths
+        self.interval = interval
+        self.timeout = interval * multiplier
+        self.up = [True] * len(paths)
+        self.route = list(range(len(paths)))
+        # time of the next reroute() after a failed `ip route`, or None
+        self.retry = None
+        self.socks = []
+        now = time.time()
+        self.seen = [now] * len(paths)
+        for i, path in enumerate(paths):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((path['local'], KEEPALIVE_PORT))
+            sock.setblocking(False)
+            self.socks.append(sock)
+
+    def point(self, i, j):
+        "Send path i's table through path j."
+        path, via = self.paths[i], self.paths[j]
+        if self.route[i] == j:
+            return
+        status = ip('route', 'replace', 'default', 'via', via['gw'], 'dev',
+                    via['dev'], 'table', str(path['table']))
+        if status == 0:
+            self.route[i] = j
+        else:
+            self.retry = time.time() + RETRY
+        emit({'event': 'route', 'table': path['table'],
+              'path': path['name'], 'via': via['name'], 'ok': status == 0})
+
+    def reroute(self):
+        """Point every table at its own path if up, else the first path
+           up; a table whose `ip route` failed is retried after RETRY."""
+        self.retry = None
+        for i in range(len(self.paths)):
+            if self.up[i]:
+                self.point(i, i)
+            else:
+                live = [j for j in range(len(self.paths)) if self.up[j]]
+                if live:
+                    self.point(i, live[0])
+
+    def run(self):
+        poller = select.poll()
+        byfd = {}
+        for i, sock in enumerate(self.socks):
+            poller.register(sock.fileno(), select.POLLIN)
+            byfd[sock.fileno()] = i
+        seq = 0
+        next_send = time.time()
+        emit({'event': 'start', 'paths': [p['name'] for p in self.paths]})
+        while True:
+            now = time.time()
+            if now >= next_send:
+                for i, (sock, path) in enumerate(zip(self.socks, self.paths)):
+                    try:
+                        sock.sendto(PACKET.pack(i, seq),
+                                    (path['peer'], KEEPALIVE_PORT))
+                    except OSError:
+                        pass    # no route or link down: the peer will miss it
+                seq += 1
+                next_send += self.interval
+                if next_send < now:
+                    next_send = now + self.interval
+            for fd, _event in poller.poll(max(0, next_send - time.time())
+                                          * 1000):
+                i = byfd[fd]
+                try:
+                    while self.socks[i].recv(64):
+                        self.seen[i] = time.time()
+                except OSError:
+                    pass
+            now = time.time()
+            changed = False
+            for i, path in enumerate(self.paths):
+                alive = now - self.seen[i] <= self.timeout
+                if alive != self.up[i]:
+                    self.up[i] = alive
+                    changed = True
+                    emit({'event': 'up' if alive else 'down',
+                          'path': path['name']})
+            if changed or (self.retry is not None and now >= self.retry):
+                self.reroute()
+
+    def restore(self):
+        "Point every table back at its own path."
+        for i in range(len(self.paths)):
+            self.point(i, i)
+
+
+def keepalive_rules(cfg, paths):
+    "Pin each path's keepalives to a table routed over that path only."
+    for i, path in enumerate(paths):
+        table = KEEPALIVE_TABLE + i
+        cfg.route('default', via=path['gw'], dev=path['dev'], table=table)
+        cfg.rule('from %s ipproto udp dport %d' % (path['local'],
+                                                   KEEPALIVE_PORT),
+                 table=table, priority=KEEPALIVE_PRIORITY + i)
+
+
+def intf_ip(node, peer):
+    "(interface, address/len) of node on its link to peer."
+    intf = node.connectionsTo(peer)[0][0]
+    return intf, '%s/%d' % (intf.IP(), intf.prefixLen)
+
+
+def backup_routes(net, configs, chains):
+    """Route the end-host subnets of every chain along every other chain:
+       towards the last node's side forward, the first node's backward.
+       configs maps routers to their NodeConfig."""
+    for chain, _table in chains:
+        h1, h2 = net[chain[0]], net[chain[-1]]
+        first = ipaddress.ip_interface(intf_ip(h1, net[chain[1]])[1]).network
+        last = ipaddress.ip_interface(intf_ip(h2, net[chain[-2]])[1]).network
+        for other, _ in chains:
+            if other is chain:
+                continue
+            for nodes, dst in ((other, last), (list(reversed(other)), first)):
+                for name, nxt in zip(nodes[1:-1], nodes[2:]):
+                    here, there = net[name].connectionsTo(net[nxt])[0]
+                    configs[net[name]].route(str(dst), via=there.IP(),
+                                             dev=here)
+
+
+def agent_paths(net, chains, host):
+    "Agent path list for host, an end of every chain."
+    paths = []
+    for chain, table in chains:
+        nodes = chain if chain[0] == host else list(reversed(chain))
+        me, hop = net[nodes[0]], net[nodes[1]]
+        peer, last = net[nodes[-1]], net[nodes[-2]]
+        intf = me.connectionsTo(hop)[0][0]
+        paths.append({'name': '-'.join(chain[1:-1]), 'table': table,
+                      'local': intf.IP(), 'dev': intf.name,
+                      'gw': hop.connectionsTo(me)[0][0].IP(),
+                      'peer': peer.connectionsTo(last)[0][0].IP()})
+    return paths
+
+
+def protect(net, chains, interval=INTERVAL, multiplier=MULTIPLIER):
+    """Install backup routes and start a keepalive agent on both ends of
+       the chains [(node names, table)], which must share their end
+       hosts. Returns {host: agent process}."""
+    hosts = [chains[0][0][0], chains[0][0][-1]]
+    routers = set(n for chain, _ in chains for n in chain[1:-1])
+    configs = dict((net[n], NodeConfig(net[n])) for n in routers | set(hosts))
+    backup_routes(net, configs, chains)
+    agents = {}
+    specs = {}
+    for name in hosts:
+        specs[name] = agent_paths(net, chains, name)
+        keepalive_rules(configs[net[name]], specs[name])
+        configs[net[name]].rp_disable()
+    apply_all(configs.values())
+    for name in hosts:
+        agents[name] = net[name].popen(
+            ['python3', AGENT, '--interval', str(interval),
+             '--multiplier', str(multiplier), json.dumps(specs[name])])
+        agents[name].stdout.readline()      # {"event": "start"}
+    return agents
+
+
+def stop_agents(agents):
+    "Stop the agents; returns {host: [event dicts]}."
+    events = {}
+    for name, proc in agents.items():
+        proc.send_signal(signal.SIGTERM)
+        out, _err = proc.communicate()
+        events[name] = [json.loads(line) for line in out.decode().splitlines()
+                        if line.startswith('{')]
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('paths', help='JSON list of paths (see protect())')
+    parser.add_argument('--interval', type=float, default=INTERVAL)
+    parser.add_argument('--multiplier', type=int, default=MULTIPLIER)
+    args = parser.parse_args()
+    agent = Agent(json.loads(args.paths), args.interval, args.multiplier)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        agent.run()
+    finally:
+        agent.restore()
+
+
+if __name__ == '__main__':
+    main()
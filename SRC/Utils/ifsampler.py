@@ -0,0 +1,256 @@
+"""
+High-frequency interface counter sampling across Mininet nodes
+
+ifstats.netdev() opens and parses /proc/<pid>/net/dev once per call,
+which is fine before and after a test but too slow to watch traffic
+while it runs. Sampler keeps one descriptor per network namespace open
+and re-reads it with os.pread(), so a sample of every interface of
+every node costs a few system calls per namespace (proc files return
+about a page per read, plus one read at the end) and no process. (The
+per-interface files under /sys/class/net cannot be used: Mininet nodes
+share the root mount namespace, so sysfs there always shows the root
+namespace's interfaces; /proc/<pid>/net/dev shows the node's own.)
+Nodes outside a namespace, such as OVS switches, share one descriptor.
+
+Each sample stores the counter increase since the previous sample in
+a preallocated ring buffer: one array('q') row per sample with a column
+per interface and field, and an array('d') of sample times. A
+background thread samples at up to MAX_HZ; rates() gives per-interface
+rates over the last seconds, and the ring can be exported as CSV or,
+periodically, as a Prometheus textfile (node_exporter's textfile
+collector picks it up):
+
+    sampler = Sampler(net, hz=100, textfile='/var/lib/node_exporter/mn.prom')
+    sampler.start()
+    ...
+    sampler.stop()
+    sampler.rates(1.0)[('r1', 'r1-eth1')]['tx_bytes']
+    sampler.write_csv('r1-r9.csv')
+
+Utilization is reported for interfaces with a TCLink bw.
+"""
+
+import os
+import threading
+import time
+from array import array
+
+from ifstats import FIELDS
+
+# Highest sampling rate Sampler accepts
+MAX_HZ = 100
+
+# Fields sampled by default
+DEFAULT_FIELDS = ('rx_bytes', 'tx_bytes', 'rx_packets', 'tx_packets',
+                  'rx_drop', 'tx_drop')
+
+# Most bytes asked for per pread() of /proc/<pid>/net/dev
+READ_SIZE = 1 << 16
+
+
+def pread_all(fd):
+    """The whole file open as fd, read from offset 0 until end of file
+       (proc files return about a page per read, so a short read is not
+       the end)."""
+    chunks = []
+    offset = 0
+    while True:
+        chunk = os.pread(fd, READ_SIZE, offset)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+        offset += len(chunk)
+
+
+class Sampler(object):
+    "Ring buffer of interface counter deltas for the nodes of a network."
+
+    def __init__(self, net, nodes=None, fields=DEFAULT_FIELDS, hz=10,
+                 seconds=60, textfile=None, export_every=1.0):
+        if not 0 < hz <= MAX_HZ:
+            raise ValueError('hz must be in (0, %d]' % MAX_HZ)
+        nodes = nodes if nodes is not None else net.hosts + net.switches
+        self.fields = tuple(fields)
+        self.index = [FIELDS.index(f) for f in self.fields]
+        self.hz = hz
+        self.textfile = textfile
+        self.export_every = export_every
+        # one descriptor per namespace, with the (node, intf) it serves
+        self.sources = []
+        self.columns = []
+        byns = {}
+        for node in nodes:
+            path = '/proc/%d/net/dev' % node.pid
+            ns = os.stat('/proc/%d/ns/net' % node.pid).st_ino
+            if ns not in byns:
+                byns[ns] = (os.open(path, os.O_RDONLY), {})
+                self.sources.append(byns[ns])
+            for intf in node.intfList():
+                if intf.name != 'lo':
+                    byns[ns][1][intf.name] = len(self.columns)
+                    self.columns.append((node.name, intf.name,
+                                         intf.params.get('bw')))
+        width = len(self.columns) * len(self.fields)
+        self.capacity = max(2, int(hz * seconds))
+        self.times = array('d', bytes(8 * self.capacity))
+        self.ring = array('q', bytes(8 * self.capacity * width))
+        self.last = array('q', bytes(8 * width))
+        self.now = array('q', bytes(8 * width))
+        self.totals = array('q', bytes(8 * width))
+        self.width = width
+        self.count = 0
+        self.lock = threading.RLock()
+        self.thread = None
+        self.running = False
+        self._read(self.last)
+
+    def _read(self, out):
+        "Read every namespace's counters into out, fields by column."
+        nf = len(self.fields)
+        for fd, intfs in self.sources:
+            for line in pread_all(fd).split(b'\n')[2:]:
+                name, _, values = line.partition(b':')
+                col = intfs.get(name.strip().decode())
+                if col is None:
+                    continue
+                values = values.split()
+                if len(values) < len(FIELDS):
+                    continue        # not a whole line
+                base = col * nf
+                for i, k in enumerate(self.index):
+                    out[base + i] = int(values[k])
+
+    def sample(self):
+        "Take one sample now; returns its ring row."
+        now, last = self.now, self.last
+        self._read(now)
+        t = time.time()
+        with self.lock:
+            row = self.count % self.capacity
+            base = row * self.width
+            for i in range(self.width):
+                delta = now[i] - last[i]
+                self.ring[base + i] = delta
+                self.totals[i] += delta
+            self.last, self.now = now, last
+            self.times[row] = t
+            self.count += 1
+        return row
+
+    def _loop(self):
+        period = 1.0 / self.hz
+        tick = time.time()
+        exported = tick
+        while self.running:
+            self.sample()
+            if self.textfile and time.time() - exported >= self.export_every:
+                exported = time.time()
+                self.write_textfile(self.textfile)
+            tick += period
+            delay = tick - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # fell behind: skip the missed ticks
+                tick = time.time()
+
+    def start(self):
+        "Sample in a background thread until stop()."
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        if self.textfile:
+            self.write_textfile(self.textfile)
+
+    def close(self):
+        self.stop()
+        for fd, _intfs in self.sources:
+            os.close(fd)
+        self.sources = []
+
+    def rows(self):
+        "Ring rows in time order, oldest first."
+        with self.lock:
+            n = min(self.count, self.capacity)
+            first = self.count - n
+            return [(first + i) % self.capacity for i in range(n)]
+
+    def rates(self, seconds=1.0):
+        """{(node, intf): {field: per second}} over the samples of the
+           last seconds, plus 'utilization' (0..1 of the TCLink bw, from
+           tx_bytes) where the link has one."""
+        with self.lock:
+            rows = self.rows()
+            if len(rows) < 2:
+                return {}
+            end = self.times[rows[-1]]
+            # the deltas of the rows after first cover (first, end]
+            first = 0
+            while (first < len(rows) - 2 and
+                   self.times[rows[first + 1]] <= end - seconds):
+                first += 1
+            recent = rows[first + 1:]
+            span = end - self.times[rows[first]]
+            nf = len(self.fields)
+            result = {}
+            for col, (node, intf, bw) in enumerate(self.columns):
+                rate = {}
+                for i, field in enumerate(self.fields):
+                    k = col * nf + i
+                    total = sum(self.ring[r * self.width + k] for r in recent)
+                    rate[field] = total / span if span > 0 else 0.0
+                if bw and 'tx_bytes' in rate:
+                    rate['utilization'] = 8 * rate['tx_bytes'] / (bw * 1e6)
+                result[(node, intf)] = rate
+            return result
+
+    def write_csv(self, path):
+        """Write the ring as CSV: time, then one column of deltas per
+           node:interface:field."""
+        with self.lock, open(path, 'w') as f:
+            f.write(','.join(['time'] + ['%s:%s:%s' % (node, intf, field)
+                                         for node, intf, _bw in self.columns
+                                         for field in self.fields]) + '\n')
+            for r in self.rows():
+                base = r * self.width
+                f.write('%.6f,' % self.times[r] + ','.join(
+                    str(v) for v in self.ring[base:base + self.width]) + '\n')
+
+    def prometheus(self, seconds=1.0):
+        "Counters and rates in the Prometheus text exposition format."
+        nf = len(self.fields)
+        rates = self.rates(seconds)
+        lines = []
+        for i, field in enumerate(self.fields):
+            name = 'mininet_interface_%s' % field
+            lines.append('# TYPE %s_total counter' % name)
+            for col, (node, intf, _bw) in enumerate(self.columns):
+                lines.append('%s_total{node="%s",interface="%s"} %d' % (
+                    name, node, intf, self.totals[col * nf + i]))
+            lines.append('# TYPE %s_per_second gauge' % name)
+            for (node, intf), rate in sorted(rates.items()):
+                lines.append('%s_per_second{node="%s",interface="%s"} %g' % (
+                    name, node, intf, rate[field]))
+        util = [(key, rate['utilization'])
+                for key, rate in sorted(rates.items())
+                if 'utilization' in rate]
+        if util:
+            lines.append('# TYPE mininet_interface_utilization gauge')
+            lines.extend('mininet_interface_utilization{node="%s",'
+                         'interface="%s"} %g' % (node, intf, value)
+                         for (node, intf), value in util)
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        "Write prometheus() atomically, as the textfile collector expects."
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.prometheus())
+        os.rename(tmp, path)
@@ -0,0 +1,42 @@
+"""
+Interface counters of Mininet nodes
+
+A Mininet host only has its own network namespace, so /sys/class/net
+inside it still shows the root namespace. /proc/<pid>/net/dev, on the
+other hand, lists the interfaces of the namespace that pid lives in, so
+reading it for node.pid gives a node's counters without running a
+command in its shell.
+
+    before = netdev(r1)
+    ...
+    delta = diff(before, netdev(r1))
+    delta['r1-eth1']['tx_bytes']
+"""
+
+# Column names of /proc/net/dev, receive side then transmit side
+FIELDS = ('rx_bytes', 'rx_packets', 'rx_errs', 'rx_drop', 'rx_fifo',
+          'rx_frame', 'rx_compressed', 'rx_multicast',
+          'tx_bytes', 'tx_packets', 'tx_errs', 'tx_drop', 'tx_fifo',
+          'tx_colls', 'tx_carrier', 'tx_compressed')
+
+
+def parse_netdev(text):
+    "Parse /proc/net/dev text into {intf: {field: value}}."
+    counters = {}
+    for line in text.splitlines()[2:]:
+        name, _, values = line.partition(':')
+        counters[name.strip()] = dict(zip(FIELDS, map(int, values.split())))
+    return counters
+
+
+def netdev(node):
+    "Counters of every interface in node's namespace."
+    with open('/proc/%d/net/dev' % node.pid) as f:
+        return parse_netdev(f.read())
+
+
+def diff(before, after):
+    "Per-interface counter increase between two netdev() snapshots."
+    return dict((intf, dict((k, v - before.get(intf, {}).get(k, 0))
+                            for k, v in fields.items()))
+                for intf, fields in after.items())
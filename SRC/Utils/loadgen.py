@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+"""
+Minimal TCP/UDP load generator, used when iperf3 is not installed
+
+Run it inside Mininet nodes; both sides print one JSON summary line.
+
+    h2 python3 loadgen.py server --proto udp --port 5201 --once
+    h1 python3 loadgen.py client --proto udp --host 10.0.4.2 --port 5201 \\
+        --duration 5 --rate 50M --size 1200
+
+UDP datagrams carry a sequence number and a send timestamp, so the
+server reports loss and RFC 3550 interarrival jitter (Mininet nodes share
+one clock). The TCP server reports the bytes it received and the goodput.
+Both report max_gap_ms, the longest time without data arriving, which
+at a steady --rate is how long the traffic was interrupted.
+Servers print {"ready": port} as soon as they are listening; with
+--inetd the server uses the listening socket it was given as stdin
+(services.py starts it that way on the first connection). Clients
+report the packets (writes) they sent and their own user/system CPU
+time; --rate 0 sends as fast as the CPU allows.
+"""
+
+import argparse
+import json
+import os
+import socket
+import struct
+import sys
+import time
+
+# seq, send time, flags
+UDP_HEADER = struct.Struct('!Qdl')
+FLAG_FIN = 1
+
+
+def parse_rate(text):
+    "Bits per second from '500k', '10M', '1G' or a plain number."
+    units = {'k': 1e3, 'm': 1e6, 'g': 1e9}
+    text = str(text).strip().lower()
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def emit(doc):
+    sys.stdout.write(json.dumps(doc, sort_keys=True) + '\n')
+    sys.stdout.flush()
+
+
+def listen_socket(proto, port):
+    kind = socket.SOCK_STREAM if proto == 'tcp' else socket.SOCK_DGRAM
+    sock = socket.socket(socket.AF_INET, kind)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('', port))
+    if proto == 'tcp':
+        sock.listen(16)
+    return sock
+
+
+def tcp_session(conn, bufsize=1 << 16):
+    "Read one connection to EOF; return its summary."
+    buf = bytearray(bufsize)
+    view = memoryview(buf)
+    total, start, last, gap = 0, None, None, 0.0
+    while True:
+        n = conn.recv_into(view)
+        if not n:
+            break
+        now = time.time()
+        if start is None:
+            start = now
+        else:
+            gap = max(gap, now - last)
+        last = now
+        total += n
+    conn.close()
+    elapsed = time.time() - start if start else 0.0
+    return {'proto': 'tcp', 'bytes': total, 'seconds': elapsed,
+            'bps': 8 * total / elapsed if elapsed else 0.0,
+            'max_gap_ms': gap * 1000}
+
+
+def tcp_server(sock, once):
+    while True:
+        conn, _addr = sock.accept()
+        emit(tcp_session(conn))
+        if once:
+            return
+
+
+def udp_server(sock, once, idle=2.0):
+    buf = bytearray(65536)
+    while True:
+        sock.settimeout(None)
+        received = nbytes = 0
+        maxseq = -1
+        jitter, transit = 0.0, None
+        first = last = None
+        gap = 0.0
+        while True:
+            try:
+                n = sock.recv_into(buf)
+            except socket.timeout:
+                break
+            now = time.time()
+            seq, sent, flags = UDP_HEADER.unpack_from(buf)
+            if flags & FLAG_FIN:
+                if received:
+                    break
+                # a FIN repeat of the session just reported
+                continue
+            sock.settimeout(idle)
+            first = first or now
+            if last is not None:
+                gap = max(gap, now - last)
+            last = now
+            received += 1
+            nbytes += n
+            maxseq = max(maxseq, seq)
+            if transit is not None:
+                jitter += (abs((now - sent) - transit) - jitter) / 16
+            transit = now - sent
+        expected = maxseq + 1
+        elapsed = (last - first) if first else 0.0
+        emit({'proto': 'udp', 'packets': received, 'bytes': nbytes,
+              'seconds': elapsed,
+              'bps': 8 * nbytes / elapsed if elapsed else 0.0,
+              'lost': max(0, expected - received),
+              'loss_pct': (100.0 * (expected - received) / expected
+                           if expected else 0.0),
+              'jitter_ms': jitter * 1000, 'max_gap_ms': gap * 1000})
+        if once:
+            return
+
+
+def server(args, sock=None):
+    sock = sock or listen_socket(args.proto, args.port)
+    emit({'ready': sock.getsockname()[1]})
+    if args.proto == 'tcp':
+        tcp_server(sock, args.once)
+    else:
+        udp_server(sock, args.once)
+
+
+def pace(start, sent_bits, rate):
+    "Sleep until sending sent_bits at rate would be on schedule."
+    if rate:
+        delay = start + sent_bits / rate - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def tcp_client(args, rate):
+    sock = socket.create_connection((args.host, args.port))
+    payload = b'\0' * args.size
+    total = writes = 0
+    start = time.time()
+    end = start + args.duration
+    while time.time() < end:
+        sock.sendall(payload)
+        total += len(payload)
+        writes += 1
+        pace(start, 8 * total, rate)
+    sock.close()
+    return total, time.time() - start, writes
+
+
+def udp_client(args, rate):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect((args.host, args.port))
+    packet = bytearray(max(args.size, UDP_HEADER.size))
+    total = seq = 0
+    start = time.time()
+    end = start + args.duration
+    while time.time() < end:
+        UDP_HEADER.pack_into(packet, 0, seq, time.time(), 0)
+        try:
+            total += sock.send(packet)
+        except ConnectionRefusedError:
+            pass
+        seq += 1
+        pace(start, 8 * total, rate)
+    elapsed = time.time() - start
+    for _ in range(3):
+        UDP_HEADER.pack_into(packet, 0, seq, time.time(), FLAG_FIN)
+        try:
+            sock.send(packet)
+        except ConnectionRefusedError:
+            pass
+        time.sleep(0.05)
+    return total, elapsed, seq
+
+
+def client(args):
+    rate = parse_rate(args.rate) if args.rate else None
+    cpu = os.times()
+    if args.proto == 'tcp':
+        total, elapsed, packets = tcp_client(args, rate)
+    else:
+        total, elapsed, packets = udp_client(
+            args, 1e6 if rate is None else rate)
+    used = os.times()
+    emit({'proto': args.proto, 'role': 'client', 'bytes': total,
+          'packets': packets, 'seconds': elapsed,
+          'bps': 8 * total / elapsed if elapsed else 0,
+          'pps': packets / elapsed if elapsed else 0,
+          'cpu_user': used.user - cpu.user,
+          'cpu_system': used.system - cpu.system})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('mode', choices=['server', 'client'])
+    parser.add_argument('--proto', choices=['tcp', 'udp'], default='tcp')
+    parser.add_argument('--host', help='server address (client)')
+    parser.add_argument('--port', type=int, default=5201)
+    parser.add_argument('--once', action='store_true',
+                        help='server: exit after one session')
+    parser.add_argument('--inetd', action='store_true',
+                        help='server: listening socket on stdin')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--rate', help='target bits/s, e.g. 10M, or 0 '
+                        'for unlimited (UDP default 1M, TCP default '
+                        'unlimited)')
+    parser.add_argument('--size', type=int, default=1200,
+                        help='bytes per datagram or write')
+    args = parser.parse_args()
+    if args.mode == 'server':
+        sock = None
+        if args.inetd:
+            sock = socket.socket(fileno=sys.stdin.fileno())
+            sock.setblocking(True)
+        server(args, sock)
+    else:
+        client(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Concurrent commands across Mininet nodes
+
+Every Mininet node has its own shell, but node.cmd() waits for one
+command to finish before the caller can send the next, so configuring
+r1..r9 one after another costs nine round trips in series.
+
+pcmd() sends one command to each node with the non-blocking sendCmd(),
+then polls all of the shells together and yields each node's output as
+soon as its command finishes. Each node has its own timeout; a node
+that runs past it is interrupted and reported as timed out. If its shell
+does not come back within DRAIN seconds of the interrupt either, the
+node is reported as wedged and left waiting, so a later cmd() on it
+fails at once instead of hanging.
+
+    for res in pcmd([(r, 'sysctl -w net.ipv4.ip_forward=1')
+                     for r in routers], timeout=5):
+        info('%s %s\n' % (res.node, res.output))
+"""
+
+import select
+import time
+from collections import namedtuple
+
+from mininet.log import info, warn
+
+# Output of one node's command; elapsed is seconds since dispatch
+Result = namedtuple('Result', 'node output timedout elapsed wedged')
+
+# Seconds to wait for a shell to return after interrupting its command
+DRAIN = 2.0
+
+
+def drain(node, seconds=DRAIN):
+    """Read node's output until its command has returned or seconds
+       have passed; returns (output, whether it returned)."""
+    output = []
+    end = time.time() + seconds
+    while node.waiting:
+        left = end - time.time()
+        if left <= 0:
+            break
+        output.append(node.monitor(timeoutms=left * 1000))
+    return ''.join(output), not node.waiting
+
+
+def pcmd(jobs, timeout=30):
+    """Run jobs concurrently and yield a Result for each as it finishes.
+       jobs: list of (node, cmd) or (node, cmd, timeout) with at most
+       one job per node; timeout: default per-node timeout in seconds
+       (None waits forever)"""
+    poller = select.poll()
+    pending, outputs, deadlines = {}, {}, {}
+    start = time.time()
+    for job in jobs:
+        node, cmd = job[0], job[1]
+        limit = job[2] if len(job) > 2 else timeout
+        fd = node.stdout.fileno()
+        assert fd not in pending, '%s has more than one job' % node
+        node.sendCmd(cmd)
+        pending[fd] = node
+        outputs[fd] = []
+        deadlines[fd] = start + limit if limit is not None else None
+        poller.register(fd, select.POLLIN)
+    while pending:
+        limits = [d for fd, d in deadlines.items()
+                  if fd in pending and d is not None]
+        wait = max(0, min(limits) - time.time()) * 1000 if limits else None
+        for fd, _event in poller.poll(wait):
+            node = pending[fd]
+            outputs[fd].append(node.monitor(timeoutms=0))
+            if not node.waiting:
+                poller.unregister(fd)
+                del pending[fd]
+                yield Result(node, ''.join(outputs[fd]), False,
+                             time.time() - start, False)
+        now = time.time()
+        for fd in [fd for fd in pending
+                   if deadlines[fd] is not None and now >= deadlines[fd]]:
+            node = pending.pop(fd)
+            poller.unregister(fd)
+            warn('*** %s: command timed out, interrupting\n' % node)
+            node.sendInt()
+            output, returned = drain(node)
+            if not returned:
+                warn('*** %s: shell did not return after the interrupt, '
+                     'marking it wedged\n' % node)
+            yield Result(node, ''.join(outputs[fd]) + output, True,
+                         now - start, not returned)
+
+
+def pcmd_all(jobs, timeout=30):
+    "Run jobs concurrently; return their Results in the order of jobs."
+    byNode = dict((res.node, res) for res in pcmd(jobs, timeout))
+    return [byNode[job[0]] for job in jobs]
+
+
+def show(results):
+    "Print results in order, one block per node."
+    for res in results:
+        status = ('wedged' if res.wedged else 'timed out' if res.timedout
+                  else '%.3fs' % res.elapsed)
+        info('*** %s (%s)\n%s' % (res.node, status, res.output))
+        if res.output and not res.output.endswith('\n'):
+            info('\n')
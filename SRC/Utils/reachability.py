@@ -0,0 +1,158 @@
+"""
+Parallel all-pairs reachability test
+
+net.pingAll() pings every pair one after another and waits out the full
+timeout on every failure, so a large network takes minutes to check.
+
+reachability() starts the probes of every source host at the same time
+(one shell command per host, see parallel.pcmd). Each host probes all
+destinations concurrently, with fping when it is installed and otherwise
+with a bounded pool of `ping -c count -w deadline` processes, which stop
+as soon as count replies have arrived. The result is a ReachMatrix with
+loss and RTT statistics for every pair.
+
+    matrix = reachability(net)
+    info(matrix)
+    assert matrix.ok
+"""
+
+import os
+import re
+import tempfile
+from collections import namedtuple
+from shutil import which
+
+from parallel import pcmd
+
+# Probes sent and replies received for one (src, dst) pair; rtt_* in ms
+PairStats = namedtuple('PairStats',
+                       'sent received rtt_min rtt_avg rtt_max')
+
+LOST = PairStats(0, 0, None, None, None)
+
+
+class ReachMatrix(object):
+    "Loss and RTT statistics for every ordered pair of hosts."
+
+    def __init__(self, hosts, stats):
+        self.hosts = hosts
+        self.stats = stats
+
+    def pair(self, src, dst):
+        return self.stats.get((str(src), str(dst)), LOST)
+
+    def loss(self, src, dst):
+        "Fraction of probes from src to dst that got no reply."
+        p = self.pair(src, dst)
+        return 1.0 if not p.sent else 1.0 - float(p.received) / p.sent
+
+    def rtt(self, src, dst):
+        "Average RTT in ms, or None if nothing came back."
+        return self.pair(src, dst).rtt_avg
+
+    def reachable(self, src, dst):
+        return self.pair(src, dst).received > 0
+
+    def failures(self):
+        "Pairs with no reply at all."
+        return [(s, d) for s, d in self.pairs() if not self.reachable(s, d)]
+
+    def pairs(self):
+        return [(s, d) for s in self.hosts for d in self.hosts if s != d]
+
+    @property
+    def ok(self):
+        return not self.failures()
+
+    def ploss(self):
+        "Percentage of unreachable pairs, like net.pingAll() returns."
+        pairs = self.pairs()
+        return 100.0 * len(self.failures()) / len(pairs) if pairs else 0.0
+
+    def as_dict(self):
+        return dict(('%s->%s' % pair, self.pair(*pair)._asdict())
+                    for pair in self.pairs())
+
+    def __str__(self):
+        lines = []
+        for s in self.hosts:
+            cells = [d if self.reachable(s, d) else 'X'
+                     for d in self.hosts if d != s]
+            lines.append('%s -> %s' % (s, ' '.join(cells)))
+        rtts = [self.rtt(*p) for p in self.pairs() if self.rtt(*p)]
+        lines.append('*** Results: %d%% dropped (%d/%d pairs reachable)'
+                     % (self.ploss(), len(self.pairs()) -
+                        len(self.failures()), len(self.pairs())) +
+                     (', rtt avg %.3f ms max %.3f ms' %
+                      (sum(rtts) / len(rtts), max(rtts)) if rtts else ''))
+        return '\n'.join(lines) + '\n'
+
+
+def probe_command(dsts, count=1, interval=0.05, deadline=2, workers=32):
+    """Shell command that probes every address in dsts from one host.
+       The addresses go through a file, keeping the command line short
+       for large networks."""
+    fd, path = tempfile.mkstemp(prefix='mn-reach-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(''.join(dst + '\n' for dst in dsts))
+    if which('fping'):
+        cmd = ('fping -q -c %d -p %d -t %d -r 0 -f %s 2>&1' %
+               (count, max(1, int(interval * 1000)),
+                int(deadline * 1000), path))
+    else:
+        # One summary line per destination so concurrent output never mixes
+        cmd = ("xargs -P %d -I{} sh -c "
+               "'echo \"@@ {} $(ping -n -q -c %d -i %s -W 1 -w %d {} 2>&1 "
+               "| tr \"\\n\" \" \")\"' < %s" %
+               (workers, count, interval, max(1, int(round(deadline))),
+                path))
+    return cmd + '; rm -f %s' % path
+
+
+def parse_probes(output):
+    "Map each probed address to PairStats from fping or ping output."
+    stats = {}
+    for line in output.splitlines():
+        m = re.match(r'\s*(\S+)\s*: xmt/rcv/%loss = (\d+)/(\d+)/\d+%'
+                     r'(?:, min/avg/max = ([\d.]+)/([\d.]+)/([\d.]+))?',
+                     line)
+        if m:
+            addr, nums = m.group(1), m.groups()[1:]
+        else:
+            m = re.match(r'@@ (\S+) ', line)
+            if not m:
+                continue
+            addr = m.group(1)
+            sent = re.search(r'(\d+) packets transmitted, (\d+) '
+                             r'(?:packets )?received', line)
+            rtt = re.search(r'= ([\d.]+)/([\d.]+)/([\d.]+)', line)
+            nums = ((sent.groups() if sent else ('0', '0')) +
+                    (rtt.groups() if rtt else (None, None, None)))
+        sent, received = int(nums[0]), int(nums[1])
+        rtts = [float(x) if x else None for x in nums[2:5]]
+        stats[addr] = PairStats(sent, received, *rtts)
+    return stats
+
+
+def reachability(net, hosts=None, count=1, interval=0.05, deadline=2,
+                 timeout=60):
+    """Probe every ordered pair of hosts concurrently.
+       count: replies wanted per pair (probing stops once they arrive)
+       interval: seconds between probes to one destination
+       deadline: seconds to keep probing an unresponsive destination
+       timeout: overall limit per source host
+       returns: ReachMatrix"""
+    hosts = hosts or net.hosts
+    byIP = dict((h.IP(), h.name) for h in hosts)
+    jobs = []
+    for src in hosts:
+        dsts = [h.IP() for h in hosts if h is not src]
+        if dsts:
+            jobs.append((src, probe_command(dsts, count, interval,
+                                            deadline)))
+    stats = {}
+    for res in pcmd(jobs, timeout):
+        for addr, pair in parse_probes(res.output).items():
+            if addr in byIP:
+                stats[(res.node.name, byIP[addr])] = pair
+    return ReachMatrix([h.name for h in hosts], stats)
@@ -0,0 +1,228 @@
+"""
+Static route synthesis for routed Mininet topologies
+
+The router examples used hand-written `route add` commands for every
+router, which grows as O(n^2) with the number of routers and is easy to
+get wrong (a gateway that is not on a connected subnet, a missing return
+route).
+
+compile_routes() takes the links of a topology and the address of each
+interface, runs one shortest-path search from every router (hosts are
+never used for transit), and emits for each router a route to every
+subnet it is not directly connected to. Routes that share a next hop are
+aggregated into the fewest covering prefixes.
+
+    links = net_links(net)
+    addresses = net_addresses(net, configs)
+    add_routes(configs, compile_routes(links, addresses, routers))
+
+Switches are not modelled: every link is treated as a point-to-point
+layer-3 hop between the two nodes it joins.
+"""
+
+import heapq
+import ipaddress
+from collections import namedtuple
+
+# onlink is set when via is not on one of dev's connected subnets
+Route = namedtuple('Route', 'dst via dev onlink')
+
+# One end of a link as seen from node: the neighbor and both interfaces
+Adjacency = namedtuple('Adjacency', 'neighbor intf remote cost')
+
+
+def topo_links(topo):
+    """Links of a Topo as (node1, intf1, node2, intf2, cost) tuples.
+       Interface names follow Mininet's node-ethN default unless the
+       link sets intfName1/intfName2."""
+    for n1, n2, info in topo.links(sort=True, withInfo=True):
+        i1 = info.get('intfName1') or '%s-eth%d' % (n1, info['port1'])
+        i2 = info.get('intfName2') or '%s-eth%d' % (n2, info['port2'])
+        yield n1, i1, n2, i2, info.get('cost', 1)
+
+
+def topo_addresses(topo):
+    """Addresses declared in a Topo: each host's ip (on its first
+       interface) and any ip given in link params1/params2."""
+    addresses = {}
+    for name in topo.nodes():
+        ip = topo.nodeInfo(name).get('ip')
+        if ip and '/' in ip:
+            addresses['%s-eth0' % name] = ip
+    for n1, i1, n2, i2, _cost in topo_links(topo):
+        info = topo.linkInfo(n1, n2)
+        for intf, params in ((i1, info.get('params1', {})),
+                             (i2, info.get('params2', {}))):
+            if params.get('ip'):
+                addresses[intf] = params['ip']
+    return addresses
+
+
+def net_links(net):
+    "Links of a running Mininet as (node1, intf1, node2, intf2, cost)."
+    for link in net.links:
+        yield (link.intf1.node.name, link.intf1.name,
+               link.intf2.node.name, link.intf2.name, 1)
+
+
+def net_addresses(net, configs=()):
+    """Current interface addresses of a running Mininet, updated with
+       the (not yet applied) addresses in batchconfig NodeConfigs."""
+    addresses = {}
+    for node in net.values():
+        for intf in node.intfList():
+            if intf.IP() and intf.prefixLen:
+                addresses[intf.name] = '%s/%s' % (intf.IP(), intf.prefixLen)
+    for cfg in configs:
+        addresses.update(cfg.addrs)
+    return addresses
+
+
+class RouteCompiler(object):
+    "Shortest-path static routes for every router in a topology."
+
+    def __init__(self, links, addresses, routers=None):
+        """links: iterable of (node1, intf1, node2, intf2[, cost])
+           addresses: dict of intf name -> 'a.b.c.d/len'
+           routers: names of forwarding nodes (default: every node
+           with more than one link)"""
+        self.adj = {}
+        self.owner = {}
+        for link in links:
+            n1, i1, n2, i2 = link[:4]
+            cost = link[4] if len(link) > 4 else 1
+            self.adj.setdefault(n1, []).append(Adjacency(n2, i1, i2, cost))
+            self.adj.setdefault(n2, []).append(Adjacency(n1, i2, i1, cost))
+            self.owner[i1], self.owner[i2] = n1, n2
+        for adjs in self.adj.values():
+            adjs.sort(key=lambda a: (a.neighbor, a.intf))
+        self.ifaddr = {}
+        self.gateways = {}
+        self.attached = {}
+        self.connected = {}
+        for intf, ip in addresses.items():
+            if intf not in self.owner:
+                continue
+            iface = ipaddress.ip_interface(ip)
+            node = self.owner[intf]
+            net = (int(iface.network.network_address),
+                   iface.network.prefixlen)
+            self.ifaddr[intf] = iface
+            self.attached.setdefault(net, set()).add(node)
+            self.connected.setdefault(node, set()).add(net)
+        if routers is None:
+            routers = [n for n in self.adj if len(self.adj[n]) > 1]
+        self.routers = set(str(r) for r in routers)
+
+    def paths(self, src):
+        """Dijkstra from src through routers only.
+           Returns {node: (distance, first-hop Adjacency)}."""
+        best = {src: (0, None)}
+        heap = [(0, src, None)]
+        done = set()
+        while heap:
+            dist, node, first = heapq.heappop(heap)
+            if node in done:
+                continue
+            done.add(node)
+            if node != src and node not in self.routers:
+                continue
+            for adj in self.adj.get(node, ()):
+                d = dist + adj.cost
+                hop = first or adj
+                if adj.neighbor not in best or d < best[adj.neighbor][0]:
+                    best[adj.neighbor] = (d, hop)
+                    heapq.heappush(heap, (d, adj.neighbor, hop))
+        return best
+
+    def gateway(self, adj):
+        """Next-hop address for adj: the neighbor's address on the link,
+           or any of its addresses (reached onlink) if the link end has
+           none."""
+        if adj in self.gateways:
+            return self.gateways[adj]
+        remote = self.ifaddr.get(adj.remote)
+        if remote is None:
+            others = sorted(intf for intf, node in self.owner.items()
+                            if node == adj.neighbor and intf in self.ifaddr)
+            remote = self.ifaddr[others[0]] if others else None
+        if remote is None:
+            result = None, False
+        else:
+            local = self.ifaddr.get(adj.intf)
+            result = (str(remote.ip),
+                      local is None or remote.ip not in local.network)
+        self.gateways[adj] = result
+        return result
+
+    def routes(self, router, aggregate=True, default=False):
+        "Routes for one router, as a list of Route."
+        best = self.paths(router)
+        local = self.connected.get(router, set())
+        groups = {}
+        for net, nodes in self.attached.items():
+            if net in local:
+                continue
+            reachable = [(best[n][0], n) for n in nodes if n in best]
+            if not reachable:
+                continue
+            adj = best[min(reachable)[1]][1]
+            via, onlink = self.gateway(adj)
+            if via is None:
+                continue
+            groups.setdefault((via, adj.intf, onlink), []).append(net)
+        if default and groups:
+            key = max(groups, key=lambda k: (len(groups[k]), k))
+            groups[key] = [(0, 0)]
+        routes = []
+        for (via, dev, onlink), nets in groups.items():
+            if aggregate:
+                nets = collapse(nets)
+            for addr, plen in nets:
+                routes.append((addr, plen, dev, Route(
+                    '%s/%d' % (ipaddress.IPv4Address(addr), plen),
+                    via, dev, onlink)))
+        return [r[-1] for r in sorted(routes)]
+
+    def compile(self, aggregate=True, default=False):
+        "Routes for every router: {router name: [Route, ...]}."
+        return dict((r, self.routes(r, aggregate, default))
+                    for r in sorted(self.routers) if r in self.adj)
+
+
+def compile_routes(links, addresses, routers=None, aggregate=True,
+                   default=False):
+    """Compile the minimal static route set for routers.
+       aggregate: merge prefixes with the same next hop
+       default: replace the largest next-hop group with a default route"""
+    return RouteCompiler(links, addresses, routers).compile(
+        aggregate, default)
+
+
+def collapse(nets):
+    """Merge IPv4 (address, prefixlen) pairs into the fewest prefixes
+       covering exactly the same addresses."""
+    stack = []
+    for addr, plen in sorted(set(nets)):
+        if stack:
+            top, tlen = stack[-1]
+            if plen >= tlen and addr >> (32 - tlen) == top >> (32 - tlen):
+                continue    # covered by the previous prefix
+        stack.append((addr, plen))
+        while len(stack) > 1:
+            (a1, l1), (a2, l2) = stack[-2], stack[-1]
+            size = 1 << (32 - l1)
+            if (l1 != l2 or l1 == 0 or a1 + size != a2 or
+                    a1 & (2 * size - 1)):
+                break
+            stack[-2:] = [(a1, l1 - 1)]
+    return stack
+
+
+def add_routes(configs, routes):
+    "Add compiled routes to the matching batchconfig NodeConfigs."
+    byName = dict((cfg.node.name, cfg) for cfg in configs)
+    for router, rlist in routes.items():
+        for route in rlist:
+            byName[router].route(route.dst, via=route.via, dev=route.dev,
+                                 onlink=route.onlink)
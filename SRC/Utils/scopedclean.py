@@ -0,0 +1,249 @@
+"""
+Scoped cleanup of one Mininet run
+
+mininet.clean.cleanup() kills every controller and Mininet shell on the
+machine, deletes every OVS bridge and every interface that looks like a
+Mininet link, one command at a time. That takes seconds, and it tears
+down any other experiment running on the same host.
+
+record() instead writes a manifest of what this run created:
+
+    bridges   OVS bridges of its switches, with their _uuid
+    links     root-namespace interfaces of its links, with their ifindex
+    pids      node shells, with their start time
+    netns     network namespaces of its hosts: inode, with the pid and
+              start time of the shell holding it
+
+The manifest lives in MANIFEST_DIR until the run releases it after a
+clean net.stop(). If the run dies first, the manifest is cleaned at exit
+or, after a crash, by clean_stale() at the start of a later run, which
+only touches manifests whose owning process is gone. Cleaning removes
+exactly the recorded items that still exist: the processes of the
+shells and their namespaces (found with one scan of /proc), the bridges
+in one `ovs-vsctl` transaction and the links in one `ip -batch`. An item
+whose uuid, ifindex or start time changed belongs to somebody else now
+and is left alone. The kernel reuses the inode numbers of dead
+namespaces, so a namespace is only cleaned while its recorded shell is
+alive and still in it; once the shell is gone, so is the namespace's
+identity, and its processes are left alone.
+
+Record the network before starting it, so a run that dies in start()
+leaves a manifest too, and again once start() has created the bridges:
+
+    clean_stale()
+    run = record(net)
+    net.start()
+    run.update(net)
+    ...
+    net.stop()
+    run.release()
+
+Runs that share a host still need distinct switch names, since OVS
+bridges and their interfaces share the root namespace.
+"""
+
+import atexit
+import json
+import os
+import signal
+import subprocess
+import time
+
+from mininet.log import info
+
+MANIFEST_DIR = os.environ.get('MN_MANIFEST_DIR', '/tmp/mininet-runs')
+
+
+def proc_stat(pid):
+    "(ppid, start time in clock ticks) of a process, or None."
+    try:
+        with open('/proc/%d/stat' % pid) as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (IOError, OSError, IndexError):
+        return None
+    return int(fields[1]), int(fields[19])
+
+
+def netns_inode(pid):
+    "Inode of a process's network namespace, or None."
+    try:
+        return os.stat('/proc/%d/ns/net' % pid).st_ino
+    except OSError:
+        return None
+
+
+def processes():
+    "{pid: (ppid, start time, netns inode)} of every process."
+    procs = {}
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            pid = int(name)
+            stat = proc_stat(pid)
+            if stat:
+                procs[pid] = stat + (netns_inode(pid),)
+    return procs
+
+
+def ifindex(name):
+    "ifindex of a root-namespace interface, or None."
+    try:
+        with open('/sys/class/net/%s/ifindex' % name) as f:
+            return int(f.read())
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def bridge_uuids():
+    "{name: _uuid} of every OVS bridge, with one ovs-vsctl call."
+    try:
+        out = subprocess.check_output(
+            ['ovs-vsctl', '--format=csv', '--data=bare', '--no-headings',
+             '--columns=name,_uuid', 'list', 'Bridge'],
+            stderr=subprocess.DEVNULL).decode()
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+    return dict(line.split(',', 1) for line in out.splitlines() if line)
+
+
+class Manifest(object):
+    "What one Mininet run created, kept as JSON until it is cleaned."
+
+    def __init__(self, path, doc):
+        self.path = path
+        self.doc = doc
+
+    @classmethod
+    def capture(cls, net, directory=MANIFEST_DIR):
+        "Manifest of a network, owned by this process."
+        owner = os.getpid()
+        uuids = bridge_uuids()
+        doc = {'owner': owner, 'owner_start': proc_stat(owner)[1],
+               'created': time.time(), 'bridges': {}, 'links': {},
+               'pids': {}, 'netns': []}
+        root = netns_inode(owner)
+        for node in net.hosts + net.switches + net.controllers:
+            stat = proc_stat(node.pid) if node.pid else None
+            if stat:
+                doc['pids'][str(node.pid)] = stat[1]
+            ns = netns_inode(node.pid) if node.pid else None
+            if stat and ns and ns != root:
+                doc['netns'].append([node.pid, stat[1], ns])
+            if node.name in uuids:
+                doc['bridges'][node.name] = uuids[node.name]
+            if not node.inNamespace:
+                for intf in node.intfList():
+                    index = ifindex(intf.name)
+                    if index is not None and intf.name != 'lo':
+                        doc['links'][intf.name] = index
+        return cls(os.path.join(directory, '%d.json' % owner), doc)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(path, json.load(f))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.doc, f)
+        os.rename(tmp, self.path)
+        return self
+
+    def update(self, net):
+        "Record what the network has created since, such as its bridges."
+        self.doc = Manifest.capture(net, os.path.dirname(self.path)).doc
+        return self.save()
+
+    def release(self):
+        "Forget the manifest: the run stopped cleanly."
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def owner_alive(self):
+        stat = proc_stat(self.doc['owner'])
+        return stat is not None and stat[1] == self.doc['owner_start']
+
+    def clean(self):
+        """Remove whatever recorded item still exists and is still the
+           one recorded. Returns {'pids': n, 'bridges': n, 'links': n}."""
+        if not os.path.exists(self.path):
+            return {'pids': 0, 'bridges': 0, 'links': 0}
+        procs = processes()
+        shells = set(int(pid) for pid, start in self.doc['pids'].items()
+                     if procs.get(int(pid), (None, None))[1] == start)
+        # a namespace only while its shell is alive and still in it
+        netns = set(ns for pid, start, ns in self.doc['netns']
+                    if procs.get(pid, (None, None, None))[1:] == (start, ns))
+        doomed = set(pid for pid, (_, _, ns) in procs.items()
+                     if ns in netns) | shells
+        children = {}
+        for pid, (ppid, _, _) in procs.items():
+            children.setdefault(ppid, []).append(pid)
+        stack = list(shells)
+        while stack:
+            for child in children.get(stack.pop(), []):
+                if child not in doomed:
+                    doomed.add(child)
+                    stack.append(child)
+        doomed.discard(os.getpid())
+        for pid in doomed:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+        uuids = bridge_uuids()
+        bridges = sorted(name for name, uuid in self.doc['bridges'].items()
+                         if uuids.get(name) == uuid)
+        if bridges:
+            cmd = ['ovs-vsctl']
+            for name in bridges:
+                cmd += ['--', '--if-exists', 'del-br', name]
+            subprocess.call(cmd)
+        links = sorted(name for name, index in self.doc['links'].items()
+                       if ifindex(name) == index)
+        if links:
+            proc = subprocess.Popen(['ip', '-force', '-batch', '-'],
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL)
+            proc.communicate(''.join('link del dev %s\n' % name
+                                     for name in links).encode())
+        self.release()
+        return {'pids': len(doomed), 'bridges': len(bridges),
+                'links': len(links)}
+
+
+def record(net, directory=MANIFEST_DIR):
+    """Write the manifest of a network, best before net.start() (see
+       Manifest.update()); it is cleaned at exit unless released first.
+       Returns the Manifest."""
+    manifest = Manifest.capture(net, directory).save()
+    atexit.register(manifest.clean)
+    return manifest
+
+
+def clean_stale(directory=MANIFEST_DIR):
+    """Clean the manifests of runs whose process is gone.
+       Returns the number of runs cleaned."""
+    if not os.path.isdir(directory):
+        return 0
+    cleaned = 0
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            manifest = Manifest.load(os.path.join(directory, name))
+        except (IOError, OSError, ValueError):
+            continue
+        if manifest.owner_alive():
+            continue
+        counts = manifest.clean()
+        info('*** Cleaned stale run %s: %d processes, %d bridges, '
+             '%d links\n' % (manifest.doc['owner'], counts['pids'],
+                             counts['bridges'], counts['links']))
+        cleaned += 1
+    return cleaned
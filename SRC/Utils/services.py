@@ -0,0 +1,313 @@
+"""
+On-demand per-node services, started by their first connection
+
+router3.py used to start /usr/sbin/sshd in every node. Each daemon is a
+fork, a few MB of memory and some startup time per node, mostly for
+nobody: with hundreds of nodes that dominates both. Services instead
+declares the services of each node and opens only their listening
+sockets, inside the node's network namespace (setns(), from the Mininet
+process itself, so no process per node). One supervisor thread polls all
+of them and starts a service on its first connection, as inetd does:
+
+    nowait   every connection is accepted and handed to a new process as
+             its stdin and stdout (`sshd -i`); the process ends with the
+             connection
+    wait     the listening socket itself is handed to one process as its
+             stdin (`loadgen.py server --inetd`), which serves everything
+             that arrives until it exits or has been idle for idle
+             seconds (no CPU time used); it is then reaped and the next
+             connection or datagram starts it again. Its output goes
+             to the service's log file, or nowhere without one
+
+The supervisor keeps its own reference to every listening socket, so
+nothing queued on it is lost while a service is being reaped or
+restarted.
+
+    services = Services(net)
+    services.sshd(net.hosts)
+    services.add(net['h2'], 'udprecv', ['python3', LOADGEN, 'server',
+                 '--proto', 'udp', '--port', '5201', '--inetd'],
+                 port=5201, proto='udp', mode='wait', idle=30,
+                 log='/tmp/h2-udprecv.log')
+    services.start()
+    ...
+    services.status()
+    net_rss(net)                # {node: kB}, every process of each node
+    services.stop()
+
+Daemons must be able to take their socket on stdin: iperf3 cannot, so
+start it with node.popen() as before, or use loadgen.py.
+"""
+
+import ctypes
+import os
+import select
+import socket
+import threading
+import time
+from subprocess import DEVNULL
+
+from mininet.log import info, warn
+
+# Seconds without CPU time before a wait service is reaped
+IDLE = 60
+
+# Seconds between the supervisor's checks for exited and idle services
+TICK = 1.0
+
+# setns() namespace type
+CLONE_NEWNET = 0x40000000
+
+SSHD = ['/usr/sbin/sshd', '-i']
+
+PAGE_KB = os.sysconf('SC_PAGE_SIZE') // 1024
+
+_libc = ctypes.CDLL(None, use_errno=True)
+_nslock = threading.Lock()
+
+
+def setns(fd):
+    "Move the calling thread into the network namespace open as fd."
+    if _libc.setns(fd, CLONE_NEWNET) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+def netns_socket(node, family, kind):
+    "A socket created in node's network namespace."
+    own = os.open('/proc/thread-self/ns/net', os.O_RDONLY)
+    target = os.open('/proc/%d/ns/net' % node.pid, os.O_RDONLY)
+    try:
+        with _nslock:
+            setns(target)
+            try:
+                return socket.socket(family, kind)
+            finally:
+                setns(own)
+    finally:
+        os.close(own)
+        os.close(target)
+
+
+def cpu_ticks(pid):
+    "User plus system clock ticks used by pid, or None once it is gone."
+    try:
+        with open('/proc/%d/stat' % pid) as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (IOError, OSError):
+        return None
+    return int(fields[11]) + int(fields[12])
+
+
+def ns_rss():
+    "{network namespace inode: resident kB of all its processes}."
+    totals = {}
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            ns = os.stat('/proc/%s/ns/net' % pid).st_ino
+            with open('/proc/%s/statm' % pid) as f:
+                pages = int(f.read().split()[1])
+        except (IOError, OSError, IndexError, ValueError):
+            continue    # exited, or a kernel thread
+        totals[ns] = totals.get(ns, 0) + pages * PAGE_KB
+    return totals
+
+
+def net_rss(net, nodes=None):
+    """{node name: kB} resident in all processes of each node: its shell,
+       services and anything started with cmd() or popen(). Pages shared
+       between processes (libraries) are counted in each of them. Nodes
+       outside a namespace share the root namespace and are left out."""
+    nodes = nodes if nodes is not None else net.hosts
+    totals = ns_rss()
+    return dict((node.name, totals.get(
+                 os.stat('/proc/%d/ns/net' % node.pid).st_ino, 0))
+                for node in nodes if node.inNamespace)
+
+
+def node_rss(node):
+    "kB resident in all processes of one node (see net_rss())."
+    return net_rss(None, [node]).get(node.name)
+
+
+class Service(object):
+    "One declared service: its listening socket and running processes."
+
+    def __init__(self, node, name, argv, port, proto='tcp', mode='nowait',
+                 idle=IDLE, log=None):
+        if mode not in ('nowait', 'wait'):
+            raise ValueError('mode must be nowait or wait')
+        if mode == 'nowait' and proto != 'tcp':
+            raise ValueError('nowait services must be tcp')
+        self.node = node
+        self.name = name
+        self.argv = list(argv)
+        self.port = port
+        self.proto = proto
+        self.mode = mode
+        self.idle = idle
+        self.log = log
+        self.procs = []
+        self.starts = 0
+        self.reaped = 0
+        # (cpu ticks, time they last changed) of the wait process
+        self.activity = None
+        kind = socket.SOCK_STREAM if proto == 'tcp' else socket.SOCK_DGRAM
+        self.sock = netns_socket(node, socket.AF_INET, kind)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('', port))
+        if proto == 'tcp':
+            self.sock.listen(64)
+        if mode == 'nowait':
+            # wait services share the socket's flags with their process
+            self.sock.setblocking(False)
+
+    def spawn(self, stdio):
+        "Start the service with stdio as its stdin and stdout."
+        out = open(self.log, 'ab') if self.log else DEVNULL
+        try:
+            proc = self.node.popen(self.argv, stdin=stdio,
+                                   stdout=stdio if self.mode == 'nowait'
+                                   else out, stderr=out)
+        finally:
+            if self.log:
+                out.close()
+        self.procs.append(proc)
+        self.starts += 1
+        return proc
+
+    def ready(self):
+        "Handle activity on the listening socket."
+        if self.mode == 'wait':
+            self.spawn(self.sock.fileno())
+            self.activity = None
+            return
+        try:
+            conn, _addr = self.sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        try:
+            conn.setblocking(True)
+            self.spawn(conn.fileno())
+        finally:
+            conn.close()
+
+    def check(self, now):
+        """Forget exited processes and reap an idle wait process; returns
+           whether the socket is free for the supervisor to poll."""
+        self.procs = [p for p in self.procs if p.poll() is None]
+        if self.mode == 'nowait':
+            return True
+        if not self.procs:
+            return True
+        if self.idle:
+            ticks = cpu_ticks(self.procs[0].pid)
+            if self.activity is None or ticks != self.activity[0]:
+                self.activity = (ticks, now)
+            elif now - self.activity[1] >= self.idle:
+                self.procs[0].terminate()
+                self.procs[0].wait()
+                self.procs = []
+                self.reaped += 1
+                return True
+        return False
+
+    def stop(self):
+        for proc in self.procs:
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in self.procs:
+            proc.wait()
+        self.procs = []
+        self.sock.close()
+
+    def status(self):
+        return {'node': self.node.name, 'service': self.name,
+                'port': self.port, 'proto': self.proto, 'mode': self.mode,
+                'running': [p.pid for p in self.procs],
+                'starts': self.starts, 'reaped': self.reaped}
+
+
+class Services(object):
+    "The declared services of a network and their supervisor thread."
+
+    def __init__(self, net):
+        self.net = net
+        self.services = []
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+        # pipe that wakes the supervisor up on stop()
+        self.wake = os.pipe()
+
+    def add(self, node, name, argv, port, **opts):
+        """Declare a service of node; see Service for opts. Its socket
+           listens at once, the service starts on the first connection."""
+        service = Service(node, name, argv, port, **opts)
+        with self.lock:
+            self.services.append(service)
+        return service
+
+    def sshd(self, nodes, port=22, argv=SSHD):
+        "Declare sshd, started per connection, on each of nodes."
+        return [self.add(node, 'sshd', argv, port) for node in nodes]
+
+    def _loop(self):
+        poller = select.poll()
+        polled = {}
+        poller.register(self.wake[0], select.POLLIN)
+        last = 0
+        while self.running:
+            now = time.time()
+            if now - last >= TICK:
+                last = now
+                with self.lock:
+                    services = list(self.services)
+                for service in services:
+                    fd = service.sock.fileno()
+                    free = service.check(now)
+                    if free and fd not in polled:
+                        poller.register(fd, select.POLLIN)
+                        polled[fd] = service
+            for fd, _event in poller.poll(TICK * 1000):
+                service = polled.get(fd)
+                if service is None:
+                    continue
+                try:
+                    service.ready()
+                except OSError as e:
+                    warn('*** %s on %s failed to start: %s\n' % (
+                        service.name, service.node.name, e))
+                if service.mode == 'wait':
+                    # the service owns the socket until it exits
+                    poller.unregister(fd)
+                    del polled[fd]
+
+    def start(self):
+        "Supervise the services in a background thread until stop()."
+        info('*** Listening for %d services\n' % len(self.services))
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        "Stop the supervisor and every service process."
+        self.running = False
+        if self.thread:
+            os.write(self.wake[1], b'x')
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            for service in self.services:
+                service.stop()
+            self.services = []
+        for fd in self.wake:
+            os.close(fd)
+
+    def status(self):
+        "One dict per service: where it listens, its processes and starts."
+        with self.lock:
+            return [service.status() for service in self.services]
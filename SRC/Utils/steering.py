@@ -0,0 +1,88 @@
+"""
+Protocol steering with policy rules only, no netfilter marks
+
+Exercise 03_01 used to steer h1's traffic by protocol with three
+iptables `mangle OUTPUT` MARK rules and one `ip rule fwmark` per path.
+Every packet h1 sends then walks the netfilter hook and its rules, and
+when the mark changes the packet is routed a second time; the socket has
+already picked its route and source address without the mark.
+
+`ip rule` can match the IP protocol and the L4 ports itself (ipproto,
+sport, dport; Linux 4.17, iproute2 4.17). The selector is then checked
+during the route lookup the packet makes anyway, which connected sockets
+cache, and the source address follows the chosen path.
+
+Rules are tried in priority order. `ip rule add` without a priority puts
+each new rule in front of the previous one, so a catch-all added last
+shadows all the others (Exercise 03_02 sent everything to table 3 this
+way). Steering gives its rules explicit, increasing priorities in the
+order they are added:
+
+    steer = Steering(cfg[h1])
+    steer.add(4, proto='tcp', dport=5201)     # iperf3 on its own table
+    steer.protocols({'udp': 1, 'tcp': 2, 'other': 3})
+"""
+
+# First priority used; lower numbers are tried first, and the main
+# table is at 32766
+PRIORITY = 1000
+
+# Protocols with an ipproto selector; 'other' is everything else
+PROTOCOLS = ('udp', 'tcp')
+
+
+def ports(value):
+    "Port selector text: 5201 -> '5201', (5000, 5099) -> '5000-5099'."
+    if isinstance(value, (tuple, list)):
+        return '%d-%d' % tuple(value)
+    return str(value)
+
+
+def selector(proto=None, sport=None, dport=None, src=None, dst=None,
+             fwmark=None):
+    "ip rule selector text, e.g. selector('tcp', dport=5201)."
+    parts = []
+    if src:
+        parts.append('from %s' % src)
+    if dst:
+        parts.append('to %s' % dst)
+    if fwmark is not None:
+        parts.append('fwmark %s' % fwmark)
+    if proto:
+        parts.append('ipproto %s' % proto)
+    if sport is not None:
+        parts.append('sport %s' % ports(sport))
+    if dport is not None:
+        parts.append('dport %s' % ports(dport))
+    return ' '.join(parts)
+
+
+class Steering(object):
+    "Policy rules added to one NodeConfig with increasing priorities."
+
+    def __init__(self, cfg, base=PRIORITY):
+        self.cfg = cfg
+        self.priority = base
+
+    def add(self, table, **match):
+        """Look up table for packets matching selector(**match); rules
+           added earlier win."""
+        self.cfg.rule(selector(**match), table=table,
+                      priority=self.priority)
+        self.priority += 1
+        return self
+
+    def protocols(self, tables, dst=None):
+        """Steer udp and tcp to tables['udp'] and tables['tcp'], then
+           every other protocol to tables['other'] (a catch-all, so it
+           is added last). Without 'other', other protocols are left to
+           later rules; with it, udp or tcp missing from tables use the
+           main table."""
+        for proto in PROTOCOLS:
+            if proto in tables:
+                self.add(tables[proto], proto=proto, dst=dst)
+            elif 'other' in tables:
+                self.add('main', proto=proto, dst=dst)
+        if 'other' in tables:
+            self.add(tables['other'], dst=dst)
+        return self
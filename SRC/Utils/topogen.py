@@ -0,0 +1,121 @@
+"""
+Parametric router topologies
+
+RouterTopo, RTopo and the lab3 topology have fixed sizes. The generators
+here build routed topologies of any size so startup and routing can be
+measured as the network grows:
+
+    routerchain: h1 -- r1 -- r2 -- ... -- rN -- h2
+    routermesh:  r1..rN on a grid, each router linked to its right and
+                 lower neighbour; h1 on the first and h2 on the last
+
+Both take n (routers), fanout (extra hosts per router) and link (a name
+from LINK_PROFILES or a dict of TCLink options). Every interface gets a
+/24 from 10.0.0.0/8 through the link params, so a started network is
+fully addressed; configure_routers() then enables forwarding and adds
+compiled static routes.
+
+    sudo mn --custom topogen.py --topo routerchain,10,2 --link tc
+
+Use a TCLink-based network (mn --link tc) for profiles other than none.
+"""
+
+from mininet.topo import Topo
+
+# Link options by profile name (bw in Mbit/s, as TCLink expects)
+LINK_PROFILES = {
+    'none': {},
+    'lan': {'bw': 1000, 'delay': '0.1ms'},
+    'wan': {'bw': 100, 'delay': '10ms'},
+    'lossy': {'bw': 10, 'delay': '20ms', 'loss': 1},
+}
+
+
+class RoutedTopo(Topo):
+    "Base class: addressing and host attachment for generated topologies."
+
+    def build(self, n=3, fanout=0, link='none'):
+        self.subnets = 0
+        self.addresses = {}
+        self.linkopts = (LINK_PROFILES[link] if isinstance(link, str)
+                         else dict(link))
+        # ip=None keeps Mininet from putting an automatic 10.0.0.x/8 on
+        # each router's first interface over the link address
+        self.routers = [self.addHost('r%d' % (i + 1), ip=None)
+                        for i in range(int(n))]
+        self.addRouterLinks(self.routers)
+        self.addEndHost('h1', self.routers[0])
+        self.addEndHost('h2', self.routers[-1])
+        for i, router in enumerate(self.routers):
+            for j in range(int(fanout)):
+                self.addEndHost('h%ds%d' % (i + 1, j + 1), router)
+
+    def addRouterLinks(self, routers):
+        "Override to link the routers together."
+        raise NotImplementedError
+
+    def nextSubnet(self):
+        "Next free 10.x.y.0/24, as '10.x.y.'"
+        k = self.subnets
+        self.subnets += 1
+        assert k < 65536, 'out of /24 subnets in 10.0.0.0/8'
+        return '10.%d.%d.' % (k >> 8, k & 255)
+
+    def addRoutedLink(self, node1, node2, host1=1, host2=2):
+        "Link node1 and node2 over a fresh /24."
+        prefix = self.nextSubnet()
+        ip1, ip2 = prefix + '%d/24' % host1, prefix + '%d/24' % host2
+        key = self.addLink(node1, node2, params1={'ip': ip1},
+                           params2={'ip': ip2}, **self.linkopts)
+        port1, port2 = self.port(node1, node2)
+        self.addresses['%s-eth%d' % (node1, port1)] = ip1
+        self.addresses['%s-eth%d' % (node2, port2)] = ip2
+        return key
+
+    def addEndHost(self, name, router):
+        "Add host name on its own subnet behind router."
+        prefix = self.nextSubnet()
+        self.addHost(name, ip=prefix + '100/24',
+                     defaultRoute='via ' + prefix + '1')
+        self.addRoutedLink(router, name, host1=1, host2=100)
+
+
+class RouterChainTopo(RoutedTopo):
+    "h1 -- r1 -- r2 -- ... -- rN -- h2, fanout hosts on every router."
+
+    def addRouterLinks(self, routers):
+        for left, right in zip(routers, routers[1:]):
+            self.addRoutedLink(left, right)
+
+
+class RouterMeshTopo(RoutedTopo):
+    "Routers on a near-square grid, linked to right and lower neighbours."
+
+    def addRouterLinks(self, routers):
+        cols = 1
+        while cols * cols < len(routers):
+            cols += 1
+        for i, router in enumerate(routers):
+            if (i + 1) % cols and i + 1 < len(routers):
+                self.addRoutedLink(router, routers[i + 1])
+            if i + cols < len(routers):
+                self.addRoutedLink(router, routers[i + cols])
+
+
+def configure_routers(net, routers=None, timeout=60):
+    """Enable forwarding on the routers of a started generated topology
+       and install compiled static routes, all nodes in parallel.
+       Returns the batchconfig ConfigResults."""
+    from batchconfig import NodeConfig, apply_all
+    from routecompiler import add_routes, compile_routes, net_addresses, \
+        net_links
+    if routers is None:
+        routers = [h.name for h in net.hosts if h.name.startswith('r')]
+    configs = [NodeConfig(net[r]).forwarding() for r in routers]
+    add_routes(configs, compile_routes(net_links(net), net_addresses(net),
+                                       routers))
+    return apply_all(configs, timeout)
+
+
+topos = {'routerchain': RouterChainTopo,
+         'routermesh': RouterMeshTopo}
@@ -0,0 +1,506 @@
+#!/usr/bin/python3
+"""
+Warm network runner: build a topology once, run many experiments on it
+
+Every lab script builds its network, runs one experiment and stops it
+again, so each edit-run cycle pays for all the namespaces, veth pairs and
+OVS bridges. The runner keeps one started network alive instead and
+takes experiment jobs over a local Unix socket:
+
+    sudo python3 warmrunner.py serve --custom topogen.py \\
+        --topo routerchain,3 --setup setup.py
+    sudo python3 warmrunner.py run [--no-reset] experiment.py [args...]
+    sudo python3 warmrunner.py cmd h1 'ping -c 1 10.0.3.2'
+    sudo python3 warmrunner.py stop
+
+The setup script runs once after net.start() (e.g. to call
+topogen.configure_routers(net)); the state it leaves is then snapshotted
+as the baseline: each namespaced node's IPv4 routes in all tables but
+local (less the kernel's prefix routes of its addresses) and its policy
+rules, every node's qdiscs, and every OVS switch's flows. Before each
+`run` job the runner takes the state again, diffs it against the
+baseline and repairs only what differs: one `ip -batch` per node deletes
+added routes and rules and re-adds removed ones, changed qdiscs are
+deleted and TCLink interfaces reconfigured from their link params
+(qdiscs a setup script added by hand are not rebuilt), and changed
+switches get their baseline flows back with one `ovs-ofctl
+replace-flows`. An untouched network costs one snapshot round across all
+nodes. Addresses, with the prefix routes that come with them, ARP
+entries and processes started by a job are not reset.
+
+A job script runs with `net` (the Mininet object) and `args` (its
+command-line arguments) as globals, like a body of code at the
+mininet> prompt; what it prints or logs is sent back, and whatever it
+assigns to `result` is returned as JSON. `cmd` jobs run commands on
+nodes concurrently without a reset, so they can inspect what the last
+job left behind.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from mininet.link import Link, TCLink
+from mininet.log import lg, setLogLevel, info, error, warn
+from mininet.net import Mininet
+from mininet.node import Controller, OVSSwitch
+
+from batchconfig import NodeConfig, apply_all
+from parallel import pcmd, pcmd_all
+from scopedclean import clean_stale, record
+import topogen
+
+# Default socket path
+SOCKET = os.environ.get('MN_WARM_SOCKET', '/tmp/mn-warm.sock')
+
+# One shell command per node takes its whole snapshot
+SNAPSHOT = ('ip -4 route show table all; echo @@rules@@; ip -4 rule show; '
+            'echo @@qdisc@@; tc qdisc show')
+
+# Route flags ip prints but does not accept back
+ROUTE_FLAGS = ('linkdown', 'dead', 'offload', 'trap', 'rt_offload',
+               'rt_trap', 'pervasive', 'notify')
+
+# TCIntf.config() parameters that shape the interface's qdiscs
+TC_PARAMS = ('bw', 'delay', 'jitter', 'loss', 'speedup', 'use_hfsc',
+             'use_tbf', 'latency_ms', 'enable_ecn', 'enable_red',
+             'max_queue_size')
+
+# Switches whose flows are dumped or replaced at the same time
+WORKERS = 16
+
+
+def parse_routes(text):
+    """Routes of `ip route show table all` as ip route arguments, one
+       per route (multipath nexthops joined), the local table and the
+       kernel's routes of addresses left out."""
+    routes = []
+    for line in text.splitlines():
+        if line[:1].isspace() and routes:
+            routes[-1] += ' ' + line.strip()
+        elif line.strip():
+            routes.append(line.strip())
+    return [' '.join(w for w in route.split() if w not in ROUTE_FLAGS)
+            for route in routes
+            if not re.search(r'\btable local\b|\bproto kernel\b', route)]
+
+
+def parse_rules(text):
+    "Rules of `ip rule show` as `priority N selector action` arguments."
+    rules = []
+    for line in text.splitlines():
+        prio, sep, rest = line.partition(':')
+        if sep and prio.strip().isdigit():
+            rest = re.sub(r'\[\w+\]|\bunresolved\b', '', rest)
+            rules.append('priority %s %s' % (prio.strip(),
+                                             ' '.join(rest.split())))
+    return rules
+
+
+def parse_qdiscs(text, intfs):
+    "{interface: its `tc qdisc show` lines} for the given interfaces."
+    qdiscs = dict((name, []) for name in intfs)
+    for line in text.splitlines():
+        m = re.search(r'\bdev (\S+)', line)
+        if m and m.group(1) in qdiscs:
+            # packet counts are not configuration
+            qdiscs[m.group(1)].append(
+                re.sub(r'\s*direct_packets_stat \d+', '', line.strip()))
+    return qdiscs
+
+
+def ofctl_args(switch):
+    "ovs-ofctl arguments selecting the switch's OpenFlow version."
+    protocols = getattr(switch, 'protocols', None)
+    return ['ovs-ofctl'] + (['-O', protocols] if protocols else [])
+
+
+def dump_flows(switch):
+    "Sorted flows of an OVS switch without statistics, or None."
+    proc = subprocess.run(ofctl_args(switch) + ['--no-stats', 'dump-flows',
+                                                switch.name],
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if proc.returncode:
+        return None
+    return sorted(line.strip() for line in proc.stdout.decode().splitlines()
+                  if 'actions=' in line)
+
+
+def replace_flows(switch, flows):
+    "Make the switch's flow table exactly flows; returns True on success."
+    fd, path = tempfile.mkstemp(prefix='mn-%s-' % switch.name,
+                                suffix='.flows')
+    with os.fdopen(fd, 'w') as f:
+        f.write(''.join(flow + '\n' for flow in flows))
+    try:
+        return subprocess.call(ofctl_args(switch) + ['replace-flows',
+                                                     switch.name, path]) == 0
+    finally:
+        os.remove(path)
+
+
+class WarmNet(object):
+    "Baseline snapshot of a started network, and reset back to it."
+
+    def __init__(self, net, timeout=30):
+        self.net = net
+        self.timeout = timeout
+        self.nodes = net.hosts + net.switches
+        self.ovs = [s for s in net.switches if isinstance(s, OVSSwitch)]
+        self.baseline = None
+
+    def snapshot(self):
+        """{node: {'routes', 'rules', 'qdiscs'}} and {switch: flows} of
+           the network as it is now."""
+        state = {}
+        for res in pcmd([(node, SNAPSHOT) for node in self.nodes],
+                        self.timeout):
+            routes, _, rest = res.output.partition('@@rules@@')
+            rules, _, qdiscs = rest.partition('@@qdisc@@')
+            node = res.node
+            # nodes outside a namespace share the host's routes and
+            # rules, which are not ours to reset
+            state[node] = {
+                'routes': parse_routes(routes) if node.inNamespace else [],
+                'rules': parse_rules(rules) if node.inNamespace else [],
+                'qdiscs': parse_qdiscs(qdiscs, [n for n in node.intfNames()
+                                                if n != 'lo'])}
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            flows = dict(zip(self.ovs, pool.map(dump_flows, self.ovs)))
+        return state, flows
+
+    def save(self):
+        "Take the current state as the baseline."
+        self.baseline = self.snapshot()
+        return self
+
+    def diff(self, state=None):
+        """What differs from the baseline: {node: (extra routes, missing
+           routes, extra rules, missing rules, changed interfaces)} and
+           the switches whose flows changed."""
+        state, flows = state or self.snapshot()
+        base, baseflows = self.baseline
+        nodes = {}
+        for node, now in state.items():
+            was = base.get(node)
+            if was is None:
+                continue
+            routes = Counter(now['routes']), Counter(was['routes'])
+            rules = Counter(now['rules']), Counter(was['rules'])
+            changes = (list((routes[0] - routes[1]).elements()),
+                       list((routes[1] - routes[0]).elements()),
+                       list((rules[0] - rules[1]).elements()),
+                       list((rules[1] - rules[0]).elements()),
+                       [name for name, lines in now['qdiscs'].items()
+                        if lines != was['qdiscs'].get(name, lines)])
+            if any(changes):
+                nodes[node] = changes
+        switches = [s for s in self.ovs
+                    if flows.get(s) is not None and
+                    flows[s] != baseflows.get(s, flows[s])]
+        return nodes, switches
+
+    def reset(self):
+        """Bring routes, rules, qdiscs and flows back to the baseline.
+           Returns a summary dict; ok is False if anything still differs."""
+        start = time.time()
+        nodes, switches = self.diff()
+        configs = []
+        for node, (routes, lost, rules, gone, intfs) in nodes.items():
+            cfg = NodeConfig(node)
+            for rule in rules:
+                cfg.ip('rule del ' + rule)
+            for route in routes:
+                cfg.ip('route del ' + route)
+            # direct routes first, so the gateways of the others resolve
+            for route in sorted(lost, key=lambda r: ' via ' in r):
+                cfg.ip('route add ' + route)
+            for rule in gone:
+                cfg.ip('rule add ' + rule)
+            configs.append(cfg)
+        apply_all(configs, self.timeout)
+        for node, changes in nodes.items():
+            for name in changes[4]:
+                self.reset_qdisc(node.nameToIntf[name])
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            replaced = list(pool.map(
+                lambda s: replace_flows(s, self.baseline[1][s]), switches))
+        for switch, ok in zip(switches, replaced):
+            if not ok:
+                error('*** %s: replace-flows failed\n' % switch)
+        left, stale = self.diff() if nodes or switches else ({}, [])
+        for node, changes in left.items():
+            warn('*** %s still differs from the baseline: %s\n' % (
+                node, '; '.join(' | '.join(c) for c in changes if c)))
+        for switch in stale:
+            warn('*** %s flows still differ from the baseline\n' % switch)
+        return {'ok': not left and not stale, 'nodes': len(nodes),
+                'routes': sum(len(c[0]) + len(c[1]) for c in nodes.values()),
+                'rules': sum(len(c[2]) + len(c[3]) for c in nodes.values()),
+                'qdiscs': sum(len(c[4]) for c in nodes.values()),
+                'switches': len(switches), 'seconds': time.time() - start}
+
+    def reset_qdisc(self, intf):
+        "Delete intf's root qdisc and reapply its TCLink shaping, if any."
+        intf.cmd('tc qdisc del dev %s root' % intf.name)
+        params = dict((k, v) for k, v in getattr(intf, 'params', {}).items()
+                      if k in TC_PARAMS)
+        if params and hasattr(intf, 'bwCmds'):
+            intf.config(**params)
+
+
+def load_topos(custom=None):
+    "Topology classes by name: Mininet's, topogen's and custom's `topos`."
+    from mininet.topo import LinearTopo, MinimalTopo, SingleSwitchTopo
+    from mininet.topolib import TreeTopo
+    topos = {'minimal': MinimalTopo, 'single': SingleSwitchTopo,
+             'linear': LinearTopo, 'tree': TreeTopo}
+    topos.update(topogen.topos)
+    if custom:
+        spec = importlib.util.spec_from_file_location(
+            os.path.splitext(os.path.basename(custom))[0], custom)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        topos.update(getattr(module, 'topos', {}))
+    return topos
+
+
+def parse_value(text):
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def build_topo(spec, custom=None):
+    "Topo from an mn-style 'name[,arg,...][,key=value,...]' spec."
+    name, _, rest = spec.partition(',')
+    args, kwargs = [], {}
+    for word in filter(None, rest.split(',')):
+        key, eq, value = word.partition('=')
+        if eq:
+            kwargs[key] = parse_value(value)
+        else:
+            args.append(parse_value(word))
+    topos = load_topos(custom)
+    if name not in topos:
+        raise ValueError('unknown topology %r (known: %s)' % (
+            name, ', '.join(sorted(topos))))
+    return topos[name](*args, **kwargs)
+
+
+def run_script(net, path, args):
+    """Run a job script with net and args as globals. Returns (output,
+       result, error text or None)."""
+    out = io.StringIO()
+    handler = logging.StreamHandler(out)
+    handler.terminator = ''
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    lg.addHandler(handler)
+    scope = {'__name__': '__warm__', '__file__': path, 'net': net,
+             'args': list(args)}
+    failure = None
+    try:
+        with open(path) as f:
+            code = compile(f.read(), path, 'exec')
+        with contextlib.redirect_stdout(out):
+            exec(code, scope)
+    except (Exception, SystemExit):
+        failure = traceback.format_exc()
+    finally:
+        lg.removeHandler(handler)
+    result = scope.get('result')
+    try:
+        json.dumps(result)
+    except (TypeError, ValueError):
+        result = repr(result)
+    return out.getvalue(), result, failure
+
+
+class Runner(object):
+    "Serve jobs for one warm network over a Unix socket."
+
+    def __init__(self, net, path=SOCKET):
+        self.net = net
+        self.path = path
+        self.warm = WarmNet(net)
+        self.running = True
+
+    def handle(self, job):
+        "Run one job dict; returns the reply dict."
+        kind = job.get('job')
+        if kind == 'run':
+            reset = self.warm.reset() if job.get('reset', True) else None
+            start = time.time()
+            output, result, failure = run_script(self.net, job['path'],
+                                                 job.get('args', []))
+            return {'ok': failure is None, 'output': output,
+                    'result': result, 'error': failure, 'reset': reset,
+                    'seconds': time.time() - start}
+        if kind == 'cmd':
+            jobs = [(self.net[name], cmd) for name, cmd in job['cmds']]
+            results = pcmd_all(jobs, job.get('timeout', 30))
+            return {'ok': not any(r.timedout for r in results),
+                    'outputs': [{'node': r.node.name, 'output': r.output,
+                                 'timedout': r.timedout,
+                                 'wedged': r.wedged,
+                                 'seconds': r.elapsed} for r in results]}
+        if kind == 'reset':
+            reset = self.warm.reset()
+            return {'ok': reset['ok'], 'reset': reset}
+        if kind == 'baseline':
+            self.warm.save()
+            return {'ok': True}
+        if kind == 'stop':
+            self.running = False
+            return {'ok': True}
+        return {'ok': False, 'error': 'unknown job %r' % kind}
+
+    def serve(self):
+        "Answer one job per connection until a stop job arrives."
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        sock.listen(4)
+        info('*** Warm network ready, jobs on %s\n' % self.path)
+        try:
+            while self.running:
+                conn, _addr = sock.accept()
+                with conn:
+                    try:
+                        job = json.loads(conn.makefile().readline())
+                        reply = self.handle(job)
+                    except Exception:
+                        job = {}
+                        reply = {'ok': False, 'error': traceback.format_exc()}
+                    info('*** %s job: %s\n' % (
+                        job.get('job', '?'), 'ok' if reply['ok'] else
+                        'failed'))
+                    conn.sendall(json.dumps(reply).encode() + b'\n')
+        finally:
+            sock.close()
+            os.remove(self.path)
+
+
+def send(job, path=SOCKET):
+    "Send one job to a runner and return its reply."
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    with sock:
+        sock.sendall(json.dumps(job).encode() + b'\n')
+        return json.loads(sock.makefile().readline())
+
+
+def serve(args):
+    clean_stale()
+    topo = build_topo(args.topo, args.custom)
+    controller = (Controller if args.controller == 'default' and
+                  topo.switches() else None)
+    net = Mininet(topo=topo, controller=controller,
+                  link=TCLink if args.link == 'tc' else Link)
+    run = record(net)
+    net.start()
+    run.update(net)
+    # net.stop() in the finally block below on SIGTERM as well
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        if args.setup:
+            output, _result, failure = run_script(net, args.setup, [])
+            sys.stdout.write(output)
+            if failure:
+                error('*** Setup failed:\n%s' % failure)
+                return
+        runner = Runner(net, args.socket)
+        start = time.time()
+        runner.warm.save()
+        info('*** Baseline of %d nodes and %d switches in %.3fs\n' % (
+            len(runner.warm.nodes), len(runner.warm.ovs),
+            time.time() - start))
+        runner.serve()
+    finally:
+        net.stop()
+        run.release()
+
+
+def client(args):
+    if args.mode == 'run':
+        job = {'job': 'run', 'path': os.path.abspath(args.script),
+               'args': args.args, 'reset': not args.no_reset}
+    elif args.mode == 'cmd':
+        job = {'job': 'cmd', 'cmds': [[args.node, ' '.join(args.command)]]}
+    else:
+        job = {'job': args.mode}
+    start = time.time()
+    reply = send(job, args.socket)
+    for out in reply.get('outputs', []):
+        sys.stdout.write(out['output'])
+    sys.stdout.write(reply.get('output', ''))
+    if reply.get('result') is not None:
+        print(json.dumps(reply['result'], indent=1, sort_keys=True))
+    if reply.get('error'):
+        sys.stderr.write(reply['error'])
+    reset = reply.get('reset')
+    if reset:
+        sys.stderr.write(
+            '*** reset %.3fs (%d routes, %d rules, %d qdiscs, %d switches)%s\n'
+            % (reset['seconds'], reset['routes'], reset['rules'],
+               reset['qdiscs'], reset['switches'],
+               '' if reset['ok'] else ', incomplete'))
+    sys.stderr.write('*** %s in %.3fs\n' % (
+        'done' if reply['ok'] else 'failed', time.time() - start))
+    return 0 if reply['ok'] else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--socket', default=SOCKET)
+    sub = parser.add_subparsers(dest='mode')
+    sub.required = True
+    p = sub.add_parser('serve', help='build the network and serve jobs')
+    p.add_argument('--topo', default='routerchain,3',
+                   help="mn-style spec, e.g. 'routerchain,3,2' or 'tree,2,3'")
+    p.add_argument('--custom', help='file with a topos dict, as mn --custom')
+    p.add_argument('--link', choices=['default', 'tc'], default='default')
+    p.add_argument('--controller', choices=['default', 'none'],
+                   default='default',
+                   help='a reference controller if the topo has switches')
+    p.add_argument('--setup', help='script run once before the baseline')
+    p = sub.add_parser('run', help='reset, then run a job script')
+    # options go before the script: everything after it is the job's
+    p.add_argument('--no-reset', action='store_true',
+                   help='skip the reset (give it before the script)')
+    p.add_argument('script')
+    p.add_argument('args', nargs=argparse.REMAINDER)
+    p = sub.add_parser('cmd', help='run a command on a node, no reset')
+    p.add_argument('node')
+    p.add_argument('command', nargs=argparse.REMAINDER)
+    for mode in ('reset', 'baseline', 'stop'):
+        sub.add_parser(mode)
+    args = parser.parse_args()
+    if args.mode == 'serve':
+        setLogLevel('info')
+        serve(args)
+    else:
+        sys.exit(client(args))
+
+
+if __name__ == '__main__':
+    main()